@@ -1,185 +1,529 @@
 import os
+import sys
+import json
 import logging
-import firebase_admin
-from firebase_admin import credentials, firestore
-from sklearn.ensemble import IsolationForest
-import pandas as pd
-from utils import validate_transaction, normalize_status, normalize_field, normalize_transaction
-from logging.handlers import RotatingFileHandler
-from tenacity import retry, stop_after_attempt, wait_exponential
-from autoencoder_model import detect_anomalies_with_autoencoder
-from tensorflow.keras.models import load_model
-from sklearn.preprocessing import StandardScaler
+import datetime
+from utils import validate_transaction, normalize_status, normalize_field, normalize_transaction, RejectionReport
+from autoencoder_model import autoencoder_reconstruction_error, load_autoencoder
+from batch_writer import chunked
+from storage import get_storage
+from detector_runner import Detector, DetectorRunner
+from state_store import read_state, write_state
+from model_store import save_artifact, load_artifact
+from features import load_feature_schema
+from columnar import SettlementBatch, ParquetExport, write_parquet
+from pipeline_context import configure_logging
 import numpy as np
 
-# Create logs directory if it doesn't exist
-os.makedirs("logs", exist_ok=True)
-
-# Configure logging to write to a file and console
-log_file = "logs/app.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler(),  # Log to console
-        RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3)  # Log to file with rotation
-    ]
-)
-
-# Update the path to the correct location
-cred_path = "/workspaces/clearsettleAI/clearsettle-ai-firebase-adminsdk-fbsvc-844f7a5e30.json"
-
-# Firebase Init
-try:
-    if os.getenv("FIRESTORE_EMULATOR_HOST"):
-        os.environ["FIRESTORE_PROJECT_ID"] = "clearsettle-ai"
-    if not firebase_admin._apps:  # Check if Firebase is already initialized
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logging.info("Firebase initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize Firebase: {e}")
-    exit()
-
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10))
-def update_firestore_with_retry(doc_ref, data):
-    """
-    Update Firestore document with retry logic.
+ISOLATION_FOREST_ARTIFACT = "isolation_forest"
+DEAD_LETTER_FILE = "logs/anomaly_dead_letter.jsonl"
+ANOMALY_EXPORT = "logs/anomalies.parquet"
+AUTOENCODER_THRESHOLD = 0.01  # Reconstruction error threshold
+ANOMALY_VOTE = os.getenv("ANOMALY_VOTE", "any")
+# Rows per scoring block; unset or 0 scores the whole batch at once
+ANOMALY_BLOCK_SIZE = int(os.getenv("ANOMALY_BLOCK_SIZE", "0")) or None
+ANOMALY_CURSOR_STATE = "anomaly_cursor"
+
+def write_dead_letters(updates, detector):
+    """
+    Append anomaly flags that could not be written to storage to the dead-letter file.
 
     Args:
-        doc_ref: Firestore document reference.
-        data: Data to update in the document.
+        updates (dict): Fields that failed to be written, keyed by transaction ID.
+        detector (str): Name of the detector that produced the flags.
     """
-    doc_ref.update(data)
+    failed_at = datetime.datetime.utcnow().isoformat() + "Z"
+    os.makedirs(os.path.dirname(DEAD_LETTER_FILE), exist_ok=True)
+    with open(DEAD_LETTER_FILE, "a") as f:
+        for transaction_id, data in updates.items():
+            f.write(json.dumps({
+                "transaction_id": transaction_id,
+                "detector": detector,
+                "update": data,
+                "failed_at": failed_at,
+            }) + "\n")
+    logging.error(f"{len(updates)} anomaly flags from {detector} written to {DEAD_LETTER_FILE}")
+
+def flag_anomalies(transaction_ids, score_fields, detector):
+    """
+    Flag anomalies in storage using chunked batch writes instead of one update per document.
 
-def process_anomalies(valid_transactions):
-    try:
-        # Convert transactions to a DataFrame
-        df = pd.DataFrame(valid_transactions)
+    Each chunk is retried on its own; IDs from chunks that still fail are sent to the
+    dead-letter file so they can be replayed later.
 
-        if df.empty:
-            logging.warning("No valid settlement data found.")
-            return []
+    Args:
+        transaction_ids (list): IDs of the flagged transactions.
+        score_fields (dict): Raw scores to store, as {field: list of scores aligned with transaction_ids}.
+        detector (str): Name of the detector, recorded in dead letters.
+
+    Returns:
+        list: IDs that could not be flagged.
+    """
+    updates = {}
+    for i, transaction_id in enumerate(transaction_ids):
+        data = {'anomaly_detected': True}
+        data.update({field: float(scores[i]) for field, scores in score_fields.items()})
+        updates[transaction_id] = data
+    result = get_storage().update_settlements(updates.items())
+
+    if result["failed"]:
+        write_dead_letters({transaction_id: updates[transaction_id] for transaction_id in result["failed"]}, detector)
+    logging.info(f"Flagged {result['written']} anomalies from {detector} in storage.")
+    return result["failed"]
+
+def mark_anomalies(transactions, anomaly_ids):
+    """
+    Mirror the stored anomaly flag onto the in-memory transactions.
+
+    Args:
+        transactions (list): Transactions shared with later pipeline stages.
+        anomaly_ids (iterable): IDs of transactions flagged as anomalies.
+    """
+    anomaly_ids = set(anomaly_ids)
+    for txn in transactions:
+        if txn.get('transaction_id') in anomaly_ids:
+            txn['anomaly_detected'] = True
 
-        # Prepare data for anomaly detection
-        features = df[['anomaly_score']].fillna(0)
+def stream_transactions():
+    """
+    Stream the `settlements` collection one document at a time.
+
+    Yields:
+        dict: The next settlement.
+    """
+    yield from get_storage().stream_settlements()
+
+class ChangeCursor:
+    """
+    High-water mark over the `updated_at` field written by upload_settlements.
+
+    `stream` yields only documents changed since the last successful run and tracks
+    the newest `updated_at` it has seen; `commit` persists that value atomically. It is
+    only called once every detector scored every document and every flag was stored,
+    so a failed or partial run is simply retried from the previous cursor. Documents written before
+    `updated_at` existed have no value for it and are only scored by full runs.
+    """
 
-        # Fine-tuned Isolation Forest model
-        model = IsolationForest(
-            n_estimators=200,        # More trees for stability
-            contamination=0.02,      # Adjust based on expected anomaly proportion
-            max_features=0.8,        # Avoid overfitting on small fields
-            random_state=42
+    def __init__(self):
+        state = read_state(ANOMALY_CURSOR_STATE, {})
+        self.since = datetime.datetime.fromisoformat(state["updated_at"]) if state.get("updated_at") else None
+        self.latest = self.since
+        self.count = 0
+
+    def stream(self):
+        for data in get_storage().stream_changed_settlements(self.since):
+            updated_at = data.get('updated_at')
+            if updated_at is not None and (self.latest is None or updated_at > self.latest):
+                self.latest = updated_at
+            self.count += 1
+            yield data
+
+    def commit(self):
+        if self.latest is not None and self.latest != self.since:
+            write_state(ANOMALY_CURSOR_STATE, {"updated_at": self.latest.isoformat(), "documents": self.count})
+            logging.info(f"Anomaly cursor advanced to {self.latest.isoformat()} after {self.count} changed documents.")
+
+def fetch_transactions():
+    """
+    Read the full `settlements` collection. Only used when the stage runs on its own.
+
+    Returns:
+        list: Settlement dictionaries.
+    """
+    return list(stream_transactions())
+
+def train_isolation_forest(X, feature_columns, schema_version):
+    """
+    Fit the IsolationForest on an encoded feature matrix and save it as a versioned artifact.
+
+    Args:
+        X (numpy.ndarray): Feature matrix from features.FeatureSchema.encode.
+        feature_columns (list): Names of the matrix columns.
+        schema_version (str): Version of the feature schema used to encode X.
+
+    Returns:
+        dict: Manifest of the saved artifact.
+    """
+    if len(X) == 0:
+        raise ValueError("No valid settlement data to train the IsolationForest on.")
+
+    # Only training needs the estimator class; scoring unpickles the saved model
+    from sklearn.ensemble import IsolationForest
+
+    # Fine-tuned Isolation Forest model
+    model = IsolationForest(
+        n_estimators=200,        # More trees for stability
+        contamination=0.02,      # Adjust based on expected anomaly proportion
+        max_features=0.8,        # Avoid overfitting on small fields
+        random_state=42
+    )
+    model.fit(X)
+    logging.info(f"Anomaly Score Threshold: {model.offset_}")
+
+    return save_artifact(
+        ISOLATION_FOREST_ARTIFACT,
+        {"model": model, "features": feature_columns},
+        {
+            "features": feature_columns,
+            "feature_schema_version": schema_version,
+            "threshold": float(model.offset_),
+            "n_samples": len(X),
+        },
+    )
+
+def load_isolation_forest(version=None):
+    """
+    Load the trained IsolationForest artifact (cached after the first call).
+
+    Args:
+        version (str, optional): Specific artifact version; defaults to the latest.
+
+    Returns:
+        tuple: (model, threshold, feature schema version, artifact version)
+    """
+    payload, manifest = load_artifact(ISOLATION_FOREST_ARTIFACT, version)
+    return payload["model"], manifest["threshold"], manifest.get("feature_schema_version"), manifest["version"]
+
+def encode_features(valid_transactions):
+    """
+    Encode a batch once into the numeric matrix shared by every detector.
+
+    Args:
+        valid_transactions (list | pandas.DataFrame): Normalized, validated transactions.
+
+    Returns:
+        numpy.ndarray: float32 feature matrix aligned with `valid_transactions`.
+    """
+    schema, schema_version = load_feature_schema()
+    _, _, model_schema_version, model_version = load_isolation_forest()
+    if model_schema_version != schema_version:
+        logging.warning(
+            f"IsolationForest {model_version} was trained with feature schema {model_schema_version}, "
+            f"but the latest schema is {schema_version}. Retrain with train_models.py."
         )
-        df['anomaly'] = model.fit_predict(features)
+    return schema.encode(valid_transactions)
 
-        # Log model performance
-        logging.info(f"Anomaly Score Threshold: {model.offset_}")
-        anomalies = df[df['anomaly'] == -1]
-        logging.info(f"Anomalies Detected: {len(anomalies)} out of {len(df)} transactions")
+def prepare_transactions(transactions):
+    """
+    Normalize and validate transactions before scoring.
 
-        # Update Firestore with anomaly detection results
-        for _, row in anomalies.iterrows():
-            doc_ref = db.collection('settlements').document(row['transaction_id'])
-            update_firestore_with_retry(doc_ref, {'anomaly_detected': True})
+    Args:
+        transactions (list): List of transaction dictionaries.
 
-        # Export anomalies to a CSV file
-        if not anomalies.empty:
-            anomalies.to_csv("logs/anomalies.csv", index=False)
-            logging.info("Anomalies exported to logs/anomalies.csv")
+    Returns:
+        list: Valid, de-duplicated transactions.
+    """
+    seen_ids = set()
+    report = RejectionReport()
+    valid_transactions = [txn for txn in map(normalize_transaction, transactions) if validate_transaction(txn, seen_ids, report)]
+    report.log("transactions during anomaly detection")
+    return valid_transactions
 
-        return anomalies['transaction_id'].tolist()
-    except Exception as e:
-        logging.error(f"Error during anomaly detection: {e}")
-        return []
+class IsolationForestDetector(Detector):
+    """Scores rows with the pre-trained IsolationForest artifact."""
 
-def process_anomalies_with_autoencoder(valid_transactions):
+    name = "IsolationForest"
+    score_field = "isolation_forest_score"
+
+    def score(self, X):
+        model, threshold, _, _ = load_isolation_forest()
+        scores = model.score_samples(X)
+        return scores < threshold, scores
+
+class AutoencoderDetector(Detector):
+    """Scores rows by Autoencoder reconstruction error."""
+
+    name = "Autoencoder"
+    score_field = "autoencoder_error"
+
+    def __init__(self, threshold=AUTOENCODER_THRESHOLD):
+        self.threshold = threshold
+
+    def score(self, X):
+        model, scaler = load_autoencoder()
+        errors = autoencoder_reconstruction_error(X, model, scaler)
+        return errors > self.threshold, errors
+
+def default_detectors():
+    """
+    Detectors run by `main`, in registration order.
+
+    Returns:
+        list: Detector instances.
+    """
+    return [IsolationForestDetector(), AutoencoderDetector()]
+
+def run_detectors(valid_transactions, X, runner=None, export=None, batch=None):
+    """
+    Run all detectors concurrently over one feature matrix, then flag the merged verdict.
+
+    Args:
+        valid_transactions (list): Normalized, validated transactions aligned with X.
+        X (numpy.ndarray): Feature matrix shared by every detector.
+        runner (DetectorRunner, optional): Runner to use; defaults to the registered detectors
+            with the vote mode from ANOMALY_VOTE.
+        export (ParquetExport, optional): Export the flagged rows are added to; by default
+            ANOMALY_EXPORT is rewritten with this batch's anomalies.
+        batch (SettlementBatch, optional): Columnar copy of `valid_transactions`, if already built.
+
+    Returns:
+        DetectionResult: Merged verdict, per-detector scores and timings.
+
+    Raises:
+        RuntimeError: If a detector failed or flags could not be stored. The verdicts of the
+            other detectors are still stored and exported, but the batch counts as not scored,
+            so callers do not advance the change cursor or checkpoint the stage.
+    """
+    runner = runner or DetectorRunner(default_detectors(), vote=ANOMALY_VOTE)
+    result = runner.run(X)
+
+    batch = batch or SettlementBatch.from_records(valid_transactions)
+    detectors = {detector.name: detector for detector in runner.detectors}
+    for name, scores in result.scores.items():
+        batch = batch.with_column(detectors[name].score_field, scores)
+    anomalies = batch.take(result.flags)
+    logging.info(
+        f"Anomalies Detected: {len(anomalies)} out of {len(batch)} transactions "
+        f"({runner.vote} vote, timings: {', '.join(f'{k} {v:.3f}s' for k, v in result.timings.items())})"
+    )
+
+    # Store the merged verdict and every detector's raw score
+    anomaly_ids = anomalies.table["transaction_id"].to_pylist()
+    score_fields = {detectors[name].score_field: anomalies.table[detectors[name].score_field].to_pylist() for name in result.scores}
+    unflagged = flag_anomalies(anomaly_ids, score_fields, f"{runner.vote} vote")
+    mark_anomalies(valid_transactions, anomaly_ids)
+
+    # Export anomalies with their scores as Parquet
+    if len(anomalies):
+        if export is None:
+            write_parquet(anomalies, ANOMALY_EXPORT)
+            logging.info(f"Anomalies exported to {ANOMALY_EXPORT}")
+        else:
+            export.write(anomalies)
+
+    problems = [f"detector {name} failed ({error})" for name, error in result.failed.items()]
+    if unflagged:
+        problems.append(f"{len(unflagged)} anomaly flags could not be stored (see {DEAD_LETTER_FILE})")
+    if problems:
+        raise RuntimeError(f"Anomaly detection incomplete: {'; '.join(problems)}")
+    return result
+
+class ChunkScorer:
+    """
+    Scores consecutive chunks of one run, keeping the state that spans chunks.
+
+    Duplicate IDs are tracked across chunks and every chunk's anomalies go to one
+    Parquet export, so scoring a run chunk by chunk gives the same verdicts and export
+    as scoring it all at once. Call `close` after the last chunk to publish the export.
+
+    Args:
+        runner (DetectorRunner, optional): Runner to use; defaults to the registered detectors.
+        export_path (str): Parquet file for the run's anomalies.
+    """
+
+    def __init__(self, runner=None, export_path=ANOMALY_EXPORT):
+        self.runner = runner or DetectorRunner(default_detectors(), vote=ANOMALY_VOTE)
+        self.export = ParquetExport(export_path)
+        self.seen_ids = set()
+        self.rejections = RejectionReport()
+        self.anomaly_ids = []
+        self.total = 0
+
+    def score(self, block):
+        """
+        Normalize, validate, encode and score one chunk.
+
+        Args:
+            block (list): Transactions; valid ones are flagged in place.
+
+        Returns:
+            list: IDs of the transactions in this chunk flagged as anomalies.
+        """
+        self.total += len(block)
+        valid_transactions = [
+            txn for txn in map(normalize_transaction, block) if validate_transaction(txn, self.seen_ids, self.rejections)
+        ]
+        if not valid_transactions:
+            return []
+
+        # One columnar copy per chunk feeds both the feature encoding and the export
+        batch = SettlementBatch.from_records(valid_transactions)
+        X = encode_features(batch.to_pandas())
+        result = run_detectors(valid_transactions, X, self.runner, export=self.export, batch=batch)
+        flagged = [txn['transaction_id'] for txn, flag in zip(valid_transactions, result.flags) if flag]
+        self.anomaly_ids.extend(flagged)
+        return flagged
+
+    def close(self):
+        self.rejections.log("transactions during anomaly detection")
+        rows = self.export.close()
+        if rows:
+            logging.info(f"{rows} anomalies exported to {self.export.path}")
+
+    def abort(self):
+        self.export.abort()
+
+def score_in_chunks(transactions, block_size, runner=None):
     """
-    Detect anomalies using the Autoencoder.
+    Score transactions in fixed-size blocks so memory stays bounded by the block size.
+
+    Each block goes through normalization, validation, feature encoding and the
+    pre-trained detectors on its own. Because the feature schema and the models are
+    fitted ahead of time and duplicate IDs are tracked across blocks, the verdicts are
+    identical to scoring the whole batch at once.
+
+    Args:
+        transactions (iterable): Transactions to score. Consumed lazily.
+        block_size (int): Number of transactions per block.
+        runner (DetectorRunner, optional): Runner to use; defaults to the registered detectors.
+
+    Returns:
+        list: IDs of the transactions flagged as anomalies.
+    """
+    scorer = ChunkScorer(runner)
+    try:
+        for block in chunked(transactions, block_size):
+            scorer.score(block)
+    except BaseException:
+        scorer.abort()
+        raise
+    scorer.close()
+    logging.info(f"Chunked scoring: {len(scorer.anomaly_ids)} anomalies in {scorer.total} transactions (block size {block_size}).")
+    return scorer.anomaly_ids
+
+def process_anomalies(valid_transactions, X=None):
+    """
+    Detect anomalies using the pre-trained IsolationForest.
 
     Args:
         valid_transactions (list): List of valid transactions.
+        X (numpy.ndarray, optional): Pre-encoded feature matrix for the same rows.
 
     Returns:
         list: List of anomalies detected.
+
+    Raises:
+        RuntimeError: If some anomaly flags could not be stored. Other errors (e.g. a missing
+            artifact) are logged and re-raised, so the pipeline does not checkpoint the stage.
     """
     try:
-        # Convert transactions to a DataFrame
-        df = pd.DataFrame(valid_transactions)
+        # Convert transactions to a DataFrame with categorical venue, asset type and counterparty
+        df = SettlementBatch.from_records(valid_transactions).to_pandas()
 
         if df.empty:
             logging.warning("No valid settlement data found.")
             return []
 
-        # Load the trained Autoencoder model and scaler
-        model = load_model("autoencoder_model.keras")
-        scaler = StandardScaler()
-        scaler.fit(df)  # Ensure the scaler is consistent with training
+        if X is None:
+            X = encode_features(valid_transactions)
 
-        # Detect anomalies
-        threshold = 0.01  # Set a threshold for reconstruction error
-        anomalies = detect_anomalies_with_autoencoder(df.values, model, scaler, threshold)
+        # Score with the pre-trained model; no refit happens here
+        model, threshold, _, version = load_isolation_forest()
+        df['anomaly_score_raw'] = model.score_samples(X)
+        df['anomaly'] = np.where(df['anomaly_score_raw'] < threshold, -1, 1)
 
-        # Log anomalies
-        anomaly_indices = np.where(anomalies)[0]
-        logging.info(f"Anomalies Detected: {len(anomaly_indices)} out of {len(df)} transactions")
+        # Log model performance
+        logging.info(f"Scored with IsolationForest {version} (threshold {threshold})")
+        anomalies = df[df['anomaly'] == -1]
+        logging.info(f"Anomalies Detected: {len(anomalies)} out of {len(df)} transactions")
 
-        # Update Firestore with anomaly detection results
-        for idx in anomaly_indices:
-            txn = valid_transactions[idx]
-            doc_ref = db.collection('settlements').document(txn['transaction_id'])
-            update_firestore_with_retry(doc_ref, {'anomaly_detected': True})
+        # Store the anomaly detection results
+        unflagged = flag_anomalies(
+            anomalies['transaction_id'].tolist(),
+            {'isolation_forest_score': anomalies['anomaly_score_raw'].tolist()},
+            'IsolationForest'
+        )
+        mark_anomalies(valid_transactions, anomalies['transaction_id'])
 
-        # Export anomalies to a CSV file
-        anomalies_df = df.iloc[anomaly_indices]
-        if not anomalies_df.empty:
-            anomalies_df.to_csv("logs/anomalies_autoencoder.csv", index=False)
-            logging.info("Anomalies exported to logs/anomalies_autoencoder.csv")
+        # Export anomalies with their scores as Parquet
+        if not anomalies.empty:
+            write_parquet(anomalies, ANOMALY_EXPORT)
+            logging.info(f"Anomalies exported to {ANOMALY_EXPORT}")
 
-        return anomalies_df['transaction_id'].tolist()
+        if unflagged:
+            raise RuntimeError(f"{len(unflagged)} anomaly flags could not be stored (see {DEAD_LETTER_FILE})")
+        return anomalies['transaction_id'].tolist()
     except Exception as e:
-        logging.error(f"Error during anomaly detection with Autoencoder: {e}")
-        return []
+        logging.error(f"Error during anomaly detection: {e}")
+        raise
 
-def detect_anomalies(transactions: list):
+def detect_anomalies(transactions, block_size=ANOMALY_BLOCK_SIZE):
     """
-    Detect anomalies in the given transactions.
+    Detect anomalies in the given transactions with the IsolationForest.
 
     Args:
-        transactions (list): List of transaction dictionaries.
+        transactions (iterable): Transaction dictionaries.
+        block_size (int, optional): Score in blocks of this many rows instead of all at once.
+            Defaults to ANOMALY_BLOCK_SIZE.
 
     Returns:
         list: List of anomalies detected.
+
+    Raises:
+        Exception: If scoring failed or flags could not be stored (see process_anomalies).
+    """
+    if block_size:
+        return score_in_chunks(transactions, block_size, DetectorRunner([IsolationForestDetector()]))
+    return process_anomalies(prepare_transactions(list(transactions)))
+
+def main(transactions=None, block_size=ANOMALY_BLOCK_SIZE, incremental=False):
+    """
+    Run both anomaly detectors.
+
+    Args:
+        transactions (list, optional): Transactions from the pipeline context. When omitted
+            the stage runs on its own and reads the `settlements` collection.
+        block_size (int, optional): Score in blocks of this many rows to bound memory.
+            Defaults to ANOMALY_BLOCK_SIZE.
+        incremental (bool): When reading the collection, only score documents whose
+            `updated_at` changed since the last successful run.
+
+    Raises:
+        Exception: Whatever stopped the run, after logging it, so the pipeline marks the stage failed.
     """
-    seen_ids = set()
-    normalized_transactions = [normalize_transaction(txn) for txn in transactions]
-    valid_transactions = [txn for txn in normalized_transactions if validate_transaction(txn, seen_ids)]
-    
-    if len(valid_transactions) < len(transactions):
-        logging.warning("Some invalid or duplicate transactions were skipped during anomaly detection.")
-    
-    return process_anomalies(valid_transactions)
-
-def main():
     try:
-        # Fetch settlement data
-        docs = db.collection('settlements').stream()
-        transactions = [doc.to_dict() for doc in docs]
+        cursor = None
+        if transactions is None and incremental:
+            cursor = ChangeCursor()
+            logging.info(f"Incremental run: scoring settlements updated after {cursor.since or 'the beginning'}.")
+
+        if block_size:
+            # Stream the collection straight into fixed-size scoring blocks
+            source = transactions if transactions is not None else (cursor.stream() if cursor else stream_transactions())
+            anomalies = score_in_chunks(source, block_size)
+            logging.info(f"Detected {len(anomalies)} anomalies.")
+            if cursor:
+                cursor.commit()
+            return
+
+        # Fetch settlement data only when no pipeline context was passed in
+        if transactions is None:
+            transactions = list(cursor.stream()) if cursor else fetch_transactions()
 
         if not transactions:
             logging.warning("No settlement data found.")
             return
 
-        # Detect anomalies using IsolationForest
-        anomalies = detect_anomalies(transactions)
-        logging.info(f"Detected {len(anomalies)} anomalies using IsolationForest.")
-
-        # Detect anomalies using Autoencoder
-        autoencoder_anomalies = process_anomalies_with_autoencoder(transactions)
-        logging.info(f"Detected {len(autoencoder_anomalies)} anomalies using Autoencoder.")
+        # Encode the batch once and share the matrix between all detectors
+        valid_transactions = prepare_transactions(transactions)
+        if not valid_transactions:
+            logging.warning("No valid settlement data found.")
+            if cursor:
+                cursor.commit()
+            return
+        batch = SettlementBatch.from_records(valid_transactions)
+        X = encode_features(batch.to_pandas())
+
+        # Run IsolationForest and Autoencoder concurrently and merge their verdicts
+        result = run_detectors(valid_transactions, X, batch=batch)
+        for name, flags in result.detector_flags.items():
+            logging.info(f"Detected {int(flags.sum())} anomalies using {name}.")
+        if cursor:
+            cursor.commit()
     except Exception as e:
         logging.error(f"Error in main: {e}")
+        raise
 
 if __name__ == "__main__":
-    main()
+    configure_logging()
+    main(incremental="--incremental" in sys.argv[1:])
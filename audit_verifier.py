@@ -0,0 +1,234 @@
+# audit_verifier.py
+# Hash formats of the audit log and O(log n) inclusion proofs for single transactions.
+import time
+import hashlib
+import logging
+from merkle import verify_proof, merkle_root
+from state_store import read_state, write_state
+
+HASH_VERSION = 2
+GENESIS_BLOCK_HASH = "0" * 64
+CHECKPOINT_STATE = "audit_verify_checkpoint"
+DEFAULT_PAGE_SIZE = 100
+
+
+def entry_hash_input(entry):
+    """
+    Canonical string hashed for an audit entry.
+
+    Version 2 entries cover the previous block hash, the block height and the entry's
+    position, so rewriting any of them changes the leaf hash. Entries written before
+    blocks existed (no hash_version) used the original unlinked format.
+
+    Args:
+        entry (dict): Audit entry.
+
+    Returns:
+        str: The hash input.
+    """
+    if entry.get("hash_version", 1) == 1:
+        return entry["transaction_id"] + entry["timestamp"] + entry["action"] + entry["actor"]
+    return "|".join([
+        entry["transaction_id"], entry["timestamp"], entry["action"], entry["actor"],
+        entry["previous_hash"], str(entry["block_height"]), str(entry["index"]),
+    ])
+
+
+def entry_hash(entry):
+    return hashlib.sha256(entry_hash_input(entry).encode()).hexdigest()
+
+
+def compute_block_hash(block):
+    """
+    Hash of a block header; covers the previous block's hash and the block's Merkle root.
+
+    Args:
+        block (dict): Block header.
+
+    Returns:
+        str: Block hash (hex).
+    """
+    header = "|".join([
+        str(block["height"]), block["previous_block_hash"], block["merkle_root"],
+        block["timestamp"], str(block["entry_count"]),
+    ])
+    return hashlib.sha256(header.encode()).hexdigest()
+
+
+def get_inclusion_proof(storage, transaction_id):
+    """
+    Fetch the audit entries of one transaction together with their block headers.
+
+    Each entry carries its own Merkle path, so this reads one document per entry plus
+    one block header, regardless of the size of the log.
+
+    Args:
+        storage (StorageBackend): Where the audit log is stored.
+        transaction_id (str): Transaction to prove.
+
+    Returns:
+        list: {"entry": dict, "block": dict or None} per audit entry.
+    """
+    bundles = []
+    for entry in storage.audit_entries_for_transaction(transaction_id):
+        block = storage.get_audit_block(entry["block_hash"]) if entry.get("block_hash") else None
+        bundles.append({"entry": entry, "block": block})
+    return bundles
+
+
+def verify_inclusion_proof(bundle):
+    """
+    Verify one entry against its block.
+
+    Checks the entry's own hash, its Merkle path up to the block's root, the block hash,
+    and that the entry points at the block's predecessor.
+
+    Args:
+        bundle (dict): {"entry": dict, "block": dict} from get_inclusion_proof.
+
+    Returns:
+        tuple: (bool, reason)
+    """
+    entry, block = bundle["entry"], bundle.get("block")
+    leaf = entry_hash(entry)
+    if leaf != entry.get("hash"):
+        return False, "entry hash does not match its contents"
+    if entry.get("hash_version", 1) < HASH_VERSION:
+        return False, "legacy entry without a Merkle proof"
+    if block is None:
+        return False, f"block {entry.get('block_hash')} not found"
+    if compute_block_hash(block) != entry["block_hash"]:
+        return False, "block header does not match its hash"
+    if block["previous_block_hash"] != entry["previous_hash"]:
+        return False, "entry does not link to the previous block"
+    if not verify_proof(leaf, entry.get("merkle_proof", []), block["merkle_root"]):
+        return False, "Merkle proof does not lead to the block root"
+    return True, "verified"
+
+
+def verify_transaction(storage, transaction_id):
+    """
+    Prove every audit entry of a transaction without loading the rest of the log.
+
+    Args:
+        storage (StorageBackend): Where the audit log is stored.
+        transaction_id (str): Transaction to verify.
+
+    Returns:
+        list: (entry, ok, reason) per audit entry.
+    """
+    results = []
+    for bundle in get_inclusion_proof(storage, transaction_id):
+        ok, reason = verify_inclusion_proof(bundle)
+        results.append((bundle["entry"], ok, reason))
+    return results
+
+
+def stream_blocks(storage, after_height=-1, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Stream block headers in height order, one page at a time.
+
+    Args:
+        storage (StorageBackend): Where the audit log is stored.
+        after_height (int): Only blocks above this height are returned.
+        page_size (int): Block headers fetched per query.
+
+    Yields:
+        dict: The next block header.
+    """
+    while True:
+        page = storage.audit_blocks_after(after_height, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_height = page[-1]["height"]
+
+
+def verify_block(storage, block, previous_block_hash):
+    """
+    Verify one block header and all of its entries.
+
+    Args:
+        storage (StorageBackend): Where the audit log is stored.
+        block (dict): Block header.
+        previous_block_hash (str): Hash of the last verified block.
+
+    Returns:
+        tuple: (number of entries checked, None if valid or a description of the first broken link)
+    """
+    if block["previous_block_hash"] != previous_block_hash:
+        return 0, "block does not link to the previous block"
+    if compute_block_hash(block) != block["block_hash"]:
+        return 0, "block header does not match its hash"
+
+    hashes = [None] * block["entry_count"]
+    for doc_id, entry in storage.audit_entries_in_block(block["block_hash"]):
+        index = entry.get("index")
+        if not isinstance(index, int) or not 0 <= index < len(hashes) or hashes[index] is not None:
+            return 0, f"unexpected entry {doc_id} in block"
+        if entry.get("previous_hash") != block["previous_block_hash"]:
+            return 0, f"entry {doc_id} does not link to the previous block"
+        if entry_hash(entry) != entry.get("hash"):
+            return 0, f"entry {doc_id} hash does not match its contents"
+        hashes[index] = entry["hash"]
+
+    if any(value is None for value in hashes):
+        return 0, f"block is missing {hashes.count(None)} of {len(hashes)} entries"
+    if merkle_root(hashes) != block["merkle_root"]:
+        return 0, "entries do not match the block's Merkle root"
+    return len(hashes), None
+
+
+def verify_chain(storage, page_size=DEFAULT_PAGE_SIZE, resume=True):
+    """
+    Verify the audit chain block by block with constant memory.
+
+    Blocks are streamed in pages and each block's entries are fetched and checked
+    before moving on, so memory is bounded by one block. At the end of the run the
+    checkpoint (height and hash of the last verified block) is saved, so the next run
+    only verifies blocks appended since. Verification stops at the first broken link.
+    Entries written before audit blocks existed are not part of the chain.
+
+    Args:
+        storage (StorageBackend): Where the audit log is stored.
+        page_size (int): Block headers fetched per query.
+        resume (bool): Start after the saved checkpoint instead of the genesis block.
+
+    Returns:
+        dict: Report with counts, throughput and the first broken link (or None).
+    """
+    checkpoint = read_state(CHECKPOINT_STATE, {}) if resume else {}
+    height = checkpoint.get("height", -1)
+    previous_block_hash = checkpoint.get("block_hash", GENESIS_BLOCK_HASH)
+    report = {"start_height": height + 1, "blocks": 0, "entries": 0, "broken_link": None}
+
+    start = time.perf_counter()
+    for block in stream_blocks(storage, height, page_size):
+        if block["height"] != height + 1:
+            report["broken_link"] = {"height": height + 1, "block_hash": None, "reason": "block missing from the chain"}
+            break
+        entries, problem = verify_block(storage, block, previous_block_hash)
+        if problem:
+            report["broken_link"] = {"height": block["height"], "block_hash": block["block_hash"], "reason": problem}
+            break
+
+        height, previous_block_hash = block["height"], block["block_hash"]
+        report["blocks"] += 1
+        report["entries"] += entries
+
+    # The checkpoint only ever records the last block that verified cleanly
+    if report["blocks"]:
+        write_state(CHECKPOINT_STATE, {
+            "height": height,
+            "block_hash": previous_block_hash,
+            "verified_entries": checkpoint.get("verified_entries", 0) + report["entries"],
+        })
+
+    elapsed = time.perf_counter() - start
+    report["seconds"] = elapsed
+    report["entries_per_second"] = report["entries"] / elapsed if elapsed > 0 else 0.0
+    report["tip_height"] = height
+    report["tip_hash"] = previous_block_hash
+    if report["broken_link"]:
+        logging.error(f"Audit chain broken at height {report['broken_link']['height']}: {report['broken_link']['reason']}")
+    return report
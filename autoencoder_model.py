@@ -1,8 +1,10 @@
-import tensorflow as tf
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Input, Dense
-from sklearn.preprocessing import StandardScaler
+import logging
+import joblib
 import numpy as np
+from model_store import registry
+
+AUTOENCODER_MODEL_PATH = "autoencoder_model.keras"
+AUTOENCODER_SCALER_PATH = "autoencoder_scaler.joblib"
 
 def build_autoencoder(input_dim):
     """
@@ -14,6 +16,10 @@ def build_autoencoder(input_dim):
     Returns:
         Model: Compiled Autoencoder model.
     """
+    # TensorFlow takes seconds to import, so only training and scoring pay for it
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.layers import Input, Dense
+
     input_layer = Input(shape=(input_dim,))
     encoded = Dense(16, activation='relu')(input_layer)
     encoded = Dense(8, activation='relu')(encoded)
@@ -31,6 +37,8 @@ def train_autoencoder(data):
     Returns:
         tuple: Trained Autoencoder model and StandardScaler instance.
     """
+    from sklearn.preprocessing import StandardScaler
+
     scaler = StandardScaler()
     X = scaler.fit_transform(data)
 
@@ -38,10 +46,46 @@ def train_autoencoder(data):
     model.compile(optimizer='adam', loss='mse')
     model.fit(X, X, epochs=50, batch_size=16, shuffle=True)
 
-    # Save model for later use
-    model.save("autoencoder_model.keras")
+    # Save model and the scaler fitted on the training data for later use
+    model.save(AUTOENCODER_MODEL_PATH)
+    joblib.dump(scaler, AUTOENCODER_SCALER_PATH)
     return model, scaler
 
+def load_autoencoder():
+    """
+    Load the trained Autoencoder and its scaler once per process.
+
+    The pair is cached in the shared model registry and reloaded only when either
+    file changes on disk (e.g. after retraining).
+
+    Returns:
+        tuple: Trained Autoencoder model and the StandardScaler fitted at training time.
+    """
+    def loader():
+        from tensorflow.keras.models import load_model
+        model = load_model(AUTOENCODER_MODEL_PATH)
+        scaler = joblib.load(AUTOENCODER_SCALER_PATH)
+        logging.info(f"Loaded Autoencoder from {AUTOENCODER_MODEL_PATH}")
+        return model, scaler
+
+    return registry.get("autoencoder", [AUTOENCODER_MODEL_PATH, AUTOENCODER_SCALER_PATH], loader)
+
+def autoencoder_reconstruction_error(data, model, scaler):
+    """
+    Mean squared reconstruction error per row.
+
+    Args:
+        data (numpy.ndarray): Input data for anomaly detection.
+        model (Model): Trained Autoencoder model.
+        scaler (StandardScaler): Scaler used during training.
+
+    Returns:
+        numpy.ndarray: Reconstruction error for each row.
+    """
+    X = scaler.transform(data)
+    reconstructed = model.predict(X)
+    return np.mean(np.power(X - reconstructed, 2), axis=1)
+
 def detect_anomalies_with_autoencoder(data, model, scaler, threshold=0.01):
     """
     Detect anomalies using the trained Autoencoder.
@@ -55,7 +99,4 @@ def detect_anomalies_with_autoencoder(data, model, scaler, threshold=0.01):
     Returns:
         numpy.ndarray: Boolean array indicating anomalies.
     """
-    X = scaler.transform(data)
-    reconstructed = model.predict(X)
-    reconstruction_error = np.mean(np.power(X - reconstructed, 2), axis=1)
-    return reconstruction_error > threshold
\ No newline at end of file
+    return autoencoder_reconstruction_error(data, model, scaler) > threshold
\ No newline at end of file
@@ -0,0 +1,93 @@
+# batch_writer.py
+# Helpers for committing Firestore writes in chunked batches instead of one round trip per document.
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_SIZE = 500
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+def chunked(items, size):
+    """
+    Split an iterable into lists of at most `size` items without materializing it.
+
+    Args:
+        items (iterable): Items to split.
+        size (int): Maximum chunk length.
+
+    Yields:
+        list: The next chunk of items.
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10))
+def commit_batch_with_retry(db, writes):
+    """
+    Commit a list of writes as a single Firestore batch with retry logic.
+
+    A fresh WriteBatch is built on every attempt so a failed commit is never reused.
+
+    Args:
+        db: Firestore client.
+        writes (list): Tuples of (operation, doc_ref, data) where operation is "set" or "update".
+    """
+    batch = db.batch()
+    for operation, doc_ref, data in writes:
+        if operation == "set":
+            batch.set(doc_ref, data)
+        elif operation == "update":
+            batch.update(doc_ref, data)
+        else:
+            raise ValueError(f"Unsupported batch operation: {operation}")
+    batch.commit()
+
+
+def write_in_batches(db, writes, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Commit writes in chunks of up to `batch_size`, with at most `max_in_flight` commits running at once.
+
+    Args:
+        db: Firestore client.
+        writes (iterable): Tuples of (operation, doc_ref, data). Consumed lazily.
+        batch_size (int): Number of writes per batch (capped at 500).
+        max_in_flight (int): Maximum number of concurrent batch commits.
+
+    Returns:
+        dict: Summary with the number of "written" documents and the "failed" document IDs.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    summary = {"written": 0, "failed": []}
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            chunk = pending.pop(future)
+            try:
+                future.result()
+                summary["written"] += len(chunk)
+            except Exception as e:
+                failed_ids = [doc_ref.id for _, doc_ref, _ in chunk]
+                summary["failed"].extend(failed_ids)
+                logging.error(f"Batch commit of {len(chunk)} documents failed after retries: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+        for chunk in chunked(writes, batch_size):
+            # Bound the number of commits in flight so large inputs are never fully buffered
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(commit_batch_with_retry, db, chunk)] = chunk
+        if pending:
+            done, _ = wait(pending)
+            collect(done)
+
+    return summary
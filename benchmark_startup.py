@@ -0,0 +1,77 @@
+# benchmark_startup.py
+# Measures cold import time of the pipeline modules and which heavy dependencies each one pulls in.
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+DEFAULT_MODULES = [
+    "utils",
+    "upload_settlements",
+    "generate_recommendations",
+    "simulate_blockchain_log",
+    "verify_audit_log",
+    "anomaly_detection",
+    "main_pipeline",
+]
+# Dependencies that should only be loaded once a stage actually needs them
+HEAVY_MODULES = ["tensorflow", "sklearn", "firebase_admin", "google.cloud.firestore"]
+
+_CHILD = """
+import sys, json, time, importlib
+started = time.perf_counter()
+importlib.import_module({module!r})
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, runs=5):
+    """
+    Import a module in fresh interpreters and time it.
+
+    Args:
+        module (str): Module name.
+        runs (int): Number of cold imports.
+
+    Returns:
+        dict: {"module", "min", "median", "loaded": heavy modules imported along the way}
+    """
+    timings, loaded = [], []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _CHILD.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(sample["seconds"])
+        loaded = sample["loaded"]
+    return {"module": module, "min": min(timings), "median": statistics.median(timings), "loaded": loaded}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the pipeline modules.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import.")
+    parser.add_argument("--runs", type=int, default=5, help="Cold imports per module.")
+    parser.add_argument("--budget", type=float, help="Fail if any module's median import time exceeds this many seconds.")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    print(f"{'module':<28}{'min':>9}{'median':>9}  heavy imports")
+    for module in args.modules:
+        stats = measure_import(module, args.runs)
+        print(f"{module:<28}{stats['min']:>8.3f}s{stats['median']:>8.3f}s  {', '.join(stats['loaded']) or '-'}")
+        if args.budget is not None and stats["median"] > args.budget:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Over the {args.budget}s budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
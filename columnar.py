@@ -0,0 +1,300 @@
+# columnar.py
+# Column-oriented settlement batches backed by Apache Arrow, with Parquet and Arrow IPC file interchange.
+import os
+import logging
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Low-cardinality fields stored as dictionary-encoded columns (one copy of each distinct value)
+CATEGORICAL_COLUMNS = ["settlement_venue", "asset_type", "counterparty_1"]
+READ_BATCH_SIZE = 10_000
+
+
+def _to_array(name, values):
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed value types in one field; keep them as text rather than failing the batch
+        array = pa.array([None if value is None else str(value) for value in values], type=pa.string())
+    if pa.types.is_null(array.type):
+        array = array.cast(pa.string())
+    if name in CATEGORICAL_COLUMNS:
+        if not pa.types.is_string(array.type):
+            array = pa.array([None if value is None else str(value) for value in values], type=pa.string())
+        array = array.dictionary_encode()
+    return array
+
+
+class SettlementBatch:
+    """
+    A batch of settlements stored column by column in an Arrow table.
+
+    Venue, asset type and counterparty are dictionary-encoded, so a batch holds each
+    distinct value once and pandas sees them as categoricals. Columns are the union of
+    the record keys; records missing a field get a null.
+
+    Args:
+        table (pyarrow.Table): The columns.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._frame = None
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a batch from transaction dicts.
+
+        Args:
+            records (list): Transaction dictionaries.
+
+        Returns:
+            SettlementBatch: The batch.
+        """
+        names = {}
+        for record in records:
+            for name in record:
+                names.setdefault(name, None)
+        return cls(pa.table({name: _to_array(name, [record.get(name) for record in records]) for name in names}))
+
+    @classmethod
+    def read_parquet(cls, path, columns=None):
+        """
+        Load a Parquet file, memory-mapped, reading only the requested columns.
+
+        Args:
+            path (str): Parquet file.
+            columns (list, optional): Columns to read; all by default.
+
+        Returns:
+            SettlementBatch: The batch.
+        """
+        return cls(pq.read_table(path, columns=columns, memory_map=True))
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def columns(self):
+        return self.table.column_names
+
+    def to_pandas(self):
+        """
+        The batch as a DataFrame (converted once, then reused). Dictionary columns become categoricals.
+
+        Returns:
+            pandas.DataFrame: One row per transaction.
+        """
+        if self._frame is None:
+            self._frame = self.table.to_pandas()
+        return self._frame
+
+    def to_records(self):
+        """
+        The batch as transaction dicts (see table_records).
+
+        Returns:
+            list: Transaction dictionaries.
+        """
+        return table_records(self.table)
+
+    def take(self, mask):
+        """
+        Rows where `mask` is true, as a new batch.
+
+        Args:
+            mask (array-like): Boolean per row.
+
+        Returns:
+            SettlementBatch: The selected rows.
+        """
+        return SettlementBatch(self.table.filter(pa.array(mask, type=pa.bool_())))
+
+    def with_column(self, name, values):
+        """
+        A new batch with a column added or replaced.
+
+        Args:
+            name (str): Column name.
+            values (array-like): One value per row.
+
+        Returns:
+            SettlementBatch: The extended batch.
+        """
+        array = pa.array(values)
+        if name in self.table.column_names:
+            return SettlementBatch(self.table.set_column(self.table.column_names.index(name), name, array))
+        return SettlementBatch(self.table.append_column(name, array))
+
+
+def _to_table(batch):
+    if isinstance(batch, SettlementBatch):
+        return batch.table
+    if isinstance(batch, pa.Table):
+        return batch
+    # pandas categoricals map to dictionary-encoded columns
+    return pa.Table.from_pandas(batch, preserve_index=False)
+
+
+def _conform(table, schema):
+    # Later batches of one export may lack fields, carry extra ones, or infer other types
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(table.num_rows, field.type))
+            continue
+        column = table[field.name]
+        if column.type != field.type:
+            try:
+                column = column.cast(field.type)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                logging.warning(f"Column {field.name} ({column.type}) does not match {field.type}; exporting nulls.")
+                column = pa.nulls(table.num_rows, field.type)
+        columns.append(column)
+    dropped = set(table.column_names) - set(schema.names)
+    if dropped:
+        logging.warning(f"Columns not in the export schema were dropped: {', '.join(sorted(dropped))}")
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class ParquetExport:
+    """
+    Writes one Parquet file from one or more batches.
+
+    The file is written under a temporary name and moved into place on `close`, so
+    readers never see a partial export. Batches after the first are conformed to the
+    first batch's schema. Nothing is written if no batch was added.
+
+    Args:
+        path (str): Destination file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._tmp_path = None
+
+    def write(self, batch):
+        """
+        Append a batch.
+
+        Args:
+            batch (SettlementBatch | pyarrow.Table | pandas.DataFrame): Rows to write.
+        """
+        table = _to_table(batch)
+        if self._writer is None:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            os.close(fd)
+            self._writer = pq.ParquetWriter(self._tmp_path, table.schema)
+        else:
+            table = _conform(table, self._writer.schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        """
+        Finish the file and move it into place.
+
+        Returns:
+            int: Rows written.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._tmp_path, self.path)
+            self._writer = None
+        return self.rows
+
+    def abort(self):
+        # Drop a partial export, e.g. after a failed run
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._tmp_path)
+            self._writer = None
+
+
+def write_parquet(batch, path):
+    """
+    Write a batch to a Parquet file atomically.
+
+    Args:
+        batch (SettlementBatch | pyarrow.Table | pandas.DataFrame): Rows to write.
+        path (str): Destination file.
+
+    Returns:
+        int: Rows written.
+    """
+    export = ParquetExport(path)
+    try:
+        export.write(batch)
+    except BaseException:
+        export.abort()
+        raise
+    return export.close()
+
+
+def iter_record_batches(data_file, file_format, batch_size=READ_BATCH_SIZE):
+    """
+    Stream the record batches of a Parquet or Arrow IPC file, memory-mapped.
+
+    Args:
+        data_file (str): Path to the file.
+        file_format (str): "parquet" or "arrow", as returned by json_stream.sniff_columnar_format.
+        batch_size (int): Rows per batch for Parquet; IPC files keep the batches they were written with.
+
+    Yields:
+        pyarrow.RecordBatch: The next batch.
+    """
+    if file_format == "parquet":
+        yield from pq.ParquetFile(data_file, memory_map=True).iter_batches(batch_size=batch_size)
+        return
+    source = pa.memory_map(data_file)
+    try:
+        reader = pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        yield from pa.ipc.open_stream(source)
+        return
+    for i in range(reader.num_record_batches):
+        yield reader.get_batch(i)
+
+
+def table_records(table):
+    """
+    Convert columns to transaction dicts, the way the same rows would read from JSON.
+
+    Null fields are left out, like absent keys, and date columns become ISO strings.
+
+    Args:
+        table (pyarrow.Table | pyarrow.RecordBatch): Transactions as columns.
+
+    Returns:
+        list: Transaction dictionaries.
+    """
+    columns = {}
+    for name, column in zip(table.schema.names, table.columns):
+        if pa.types.is_date(column.type):
+            column = column.cast(pa.string())
+        columns[name] = column.to_pylist()
+    names = list(columns)
+    return [{name: value for name, value in zip(names, values) if value is not None} for values in zip(*columns.values())]
+
+
+def iter_columnar(data_file, file_format, batch_size=READ_BATCH_SIZE):
+    """
+    Stream transactions from a Parquet or Arrow IPC file, one record batch in memory at a time.
+
+    Args:
+        data_file (str): Path to the file.
+        file_format (str): "parquet" or "arrow", as returned by json_stream.sniff_columnar_format.
+        batch_size (int): Rows decoded at a time.
+
+    Yields:
+        dict: The next transaction, as converted by table_records.
+    """
+    for record_batch in iter_record_batches(data_file, file_format, batch_size):
+        yield from table_records(record_batch)
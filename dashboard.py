@@ -1,41 +1,79 @@
+import os
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
 import pandas as pd
 import logging
+from audit_verifier import verify_transaction
+from query_cache import QueryCache
+from storage import get_storage, page_cursor
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 
-# Firebase Init
-try:
-    if not firebase_admin._apps:  # Check if Firebase is already initialized
-        cred = credentials.Certificate("/app/clearsettle-ai-firebase-adminsdk-fbsvc-844f7a5e30.json")
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logging.info("Firebase initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize Firebase: {e}")
-    exit()
-
-# Load Settlements Data
-@st.cache_data
-def load_settlements():
+storage = get_storage()
+
+PAGE_SIZE = 50
+SETTLEMENT_COLUMNS = [
+    "transaction_id", "status", "asset_type", "isin_code",
+    "counterparty_1", "counterparty_2",
+    "anomaly_score", "root_cause_tag", "recommendation", "Anomaly"
+]
+AUDIT_COLUMNS = ["timestamp", "action", "actor", "hash", "previous_hash"]
+CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+CACHE_MAX_MB = int(os.getenv("DASHBOARD_CACHE_MB", "256"))
+
+@st.cache_resource
+def get_query_cache():
+    # One cache per server process, shared by every session
+    return QueryCache(ttl=CACHE_TTL, max_bytes=CACHE_MAX_MB * 1024 * 1024)
+
+query_cache = get_query_cache()
+
+def status_tags(statuses):
+    return [("settlements", f"status:{status}") for status in statuses]
+
+def fetch_settlements_page(statuses, start_after, page_size):
+    # Filtered, ordered by anomaly_score and paged by the backend, on its (status, anomaly_score, transaction_id) index
+    return pd.DataFrame(storage.settlements_page(statuses, start_after, page_size))
+
+# Load one page of settlements matching the status filter
+def load_settlements_page(statuses, start_after=None, page_size=PAGE_SIZE):
     try:
-        docs = db.collection('settlements').stream()
-        data = [doc.to_dict() | {"doc_id": doc.id} for doc in docs]
-        return pd.DataFrame(data)
+        # Pages are also tagged with their rows, so a transaction changing status drops the page it left
+        df = query_cache.get_or_load(
+            ("settlements_page", statuses, start_after, page_size),
+            lambda df: status_tags(statuses) + [("settlements", f"txn:{txn}") for txn in df.get("transaction_id", [])],
+            lambda: fetch_settlements_page(statuses, start_after, page_size),
+        )
+        # The table below adds columns, so work on a copy rather than the cached frame
+        return df.copy()
     except Exception as e:
         st.error(f"Failed to load settlements: {e}")
         return pd.DataFrame()
 
-# Load Audit Log Data
-@st.cache_data
-def load_audit_logs():
+# Count matching settlements on the server instead of reading them
+def count_settlements(statuses):
+    try:
+        return query_cache.get_or_load(
+            ("settlements_count", statuses),
+            status_tags(statuses),
+            lambda: storage.count_settlements(statuses),
+        )
+    except Exception as e:
+        logging.warning(f"Failed to count settlements: {e}")
+        return None
+
+def fetch_audit_logs(transaction_id):
+    # Backed by the (transaction_id, timestamp) index
+    return pd.DataFrame(storage.audit_entries_for_transaction(transaction_id))
+
+# Load Audit Log Data for one transaction
+def load_audit_logs(transaction_id):
     try:
-        logs = db.collection('audit_log').order_by('timestamp').stream()
-        data = [doc.to_dict() for doc in logs]
-        return pd.DataFrame(data)
+        return query_cache.get_or_load(
+            ("audit_log", transaction_id),
+            [("audit_log", f"txn:{transaction_id}")],
+            lambda: fetch_audit_logs(transaction_id),
+        )
     except Exception as e:
         st.error(f"Failed to load audit logs: {e}")
         return pd.DataFrame()
@@ -44,37 +82,74 @@ def load_audit_logs():
 st.set_page_config(layout="wide")
 st.title("📊 ClearSettle AI – Settlement Dashboard")
 
-settlements_df = load_settlements()
-audit_df = load_audit_logs()
-
 # Sidebar filter
 status_filter = st.sidebar.multiselect("Filter by Status", options=["pending", "failed", "settled"], default=["failed"])
-filtered_df = settlements_df[settlements_df["status"].isin(status_filter)].copy()
+statuses = tuple(sorted(status_filter))
+
+# Page cursors: the (anomaly_score, transaction_id) of the last row of each page already visited; reset when the filter changes
+if st.session_state.get("page_statuses") != statuses:
+    st.session_state.page_statuses = statuses
+    st.session_state.page_cursors = [None]
+cursors = st.session_state.page_cursors
+
+filtered_df = load_settlements_page(statuses, cursors[-1]) if statuses else pd.DataFrame()
+total = count_settlements(statuses) if statuses else 0
 
-# Add the "Anomaly" column explicitly using .loc
-filtered_df.loc[:, "Anomaly"] = filtered_df["root_cause_tag"].apply(lambda x: "⚠️" if x == "anomaly_detected" else "✅")
+if not filtered_df.empty:
+    # Add the "Anomaly" column explicitly using .loc
+    root_cause = filtered_df["root_cause_tag"] if "root_cause_tag" in filtered_df else pd.Series("", index=filtered_df.index)
+    filtered_df.loc[:, "Anomaly"] = root_cause.apply(lambda x: "⚠️" if x == "anomaly_detected" else "✅")
 
 # Display Main Table
-st.subheader(f"🧾 Settlement Overview ({len(filtered_df)} results)")
-st.dataframe(
-    filtered_df[[
-        "transaction_id", "status", "asset_type", "isin_code",
-        "counterparty_1", "counterparty_2",
-        "anomaly_score", "root_cause_tag", "recommendation", "Anomaly"
-    ]].sort_values("anomaly_score", ascending=False).reset_index(drop=True),
-    use_container_width=True
-)
+page_number = len(cursors)
+st.subheader(f"🧾 Settlement Overview ({total if total is not None else '?'} results, page {page_number})")
+# Rows arrive highest anomaly_score first across all pages, unscored settlements last
+page_df = filtered_df.reindex(columns=SETTLEMENT_COLUMNS)
+st.dataframe(page_df.reset_index(drop=True), use_container_width=True)
+
+previous_col, next_col = st.columns(2)
+if previous_col.button("⬅️ Previous page", disabled=page_number == 1):
+    cursors.pop()
+    st.rerun()
+if next_col.button("Next page ➡️", disabled=len(filtered_df) < PAGE_SIZE):
+    last = filtered_df.iloc[-1]
+    score = last.get("anomaly_score")
+    cursors.append(page_cursor({"anomaly_score": None if pd.isna(score) else float(score), "transaction_id": last["transaction_id"]}))
+    st.rerun()
 
 # Audit Log Viewer
 st.subheader("🧾 Blockchain-style Audit Log")
 
-txn_ids = settlements_df["transaction_id"].unique().tolist()
+txn_ids = filtered_df["transaction_id"].tolist() if not filtered_df.empty else []
 selected_txn = st.selectbox("Select a Transaction ID to view audit history", txn_ids)
 
-txn_logs = audit_df[audit_df["transaction_id"] == selected_txn]
+# Audit history is only fetched on request, for the selected transaction
+if st.button("📜 Load audit history", disabled=selected_txn is None):
+    st.session_state.audit_txn = selected_txn
 
-if not txn_logs.empty:
-    st.write(f"🔗 Showing {len(txn_logs)} audit blocks for `{selected_txn}`")
-    st.dataframe(txn_logs[["timestamp", "action", "actor", "hash", "previous_hash"]], use_container_width=True)
-else:
-    st.info("No audit logs found for the selected transaction.")
+if selected_txn is not None and st.session_state.get("audit_txn") == selected_txn:
+    txn_logs = load_audit_logs(selected_txn)
+
+    if not txn_logs.empty:
+        st.write(f"🔗 Showing {len(txn_logs)} audit blocks for `{selected_txn}`")
+        st.dataframe(txn_logs.reindex(columns=AUDIT_COLUMNS), use_container_width=True)
+
+        # Merkle inclusion proofs check this transaction's entries without walking the whole log
+        if st.button("🔍 Verify audit history"):
+            for entry, ok, reason in verify_transaction(storage, selected_txn):
+                if ok:
+                    st.success(f"✅ {entry['timestamp']}: {reason} (block {entry.get('block_height')})")
+                else:
+                    st.error(f"❌ {entry['timestamp']}: {reason}")
+    else:
+        st.info("No audit logs found for the selected transaction.")
+
+# Cache statistics, after this run's lookups
+cache_stats = query_cache.summary()
+lookups = cache_stats["hits"] + cache_stats["misses"]
+st.sidebar.caption(
+    f"Query cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses"
+    f" ({cache_stats['hits'] / lookups:.0%} hit rate), {cache_stats['entries']} entries,"
+    f" {cache_stats['megabytes']:.1f} MB, {cache_stats['evictions']} evicted, {cache_stats['invalidations']} invalidated"
+    if lookups else "Query cache: empty"
+)
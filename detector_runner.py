@@ -0,0 +1,129 @@
+# detector_runner.py
+# Runs the registered anomaly detectors concurrently over one shared feature matrix and merges their verdicts.
+import time
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+
+VOTE_MODES = ("any", "all", "weighted")
+
+
+class Detector(ABC):
+    """
+    Base class for anomaly detectors run by DetectorRunner.
+
+    Subclasses set `name` and `score_field` and implement `score`, which must be safe
+    to call from a worker thread (or be picklable when a process pool is used). A
+    subclass without `score` cannot be instantiated.
+    """
+
+    name = "detector"
+    score_field = "anomaly_score"
+
+    @abstractmethod
+    def score(self, X):
+        """
+        Score an encoded batch.
+
+        Args:
+            X (numpy.ndarray): Feature matrix.
+
+        Returns:
+            tuple: (flags, scores) as numpy arrays with one entry per row.
+        """
+
+
+class DetectionResult:
+    """
+    Merged verdict of all detectors for one batch.
+
+    Attributes:
+        flags (numpy.ndarray): Combined boolean verdict per row.
+        scores (dict): Raw scores per detector name.
+        detector_flags (dict): Boolean verdict per detector name.
+        timings (dict): Wall time in seconds per detector name.
+        failed (dict): Error message per detector that raised.
+    """
+
+    def __init__(self, flags, scores, detector_flags, timings, failed):
+        self.flags = flags
+        self.scores = scores
+        self.detector_flags = detector_flags
+        self.timings = timings
+        self.failed = failed
+
+
+def _timed_score(detector, X):
+    start = time.perf_counter()
+    flags, scores = detector.score(X)
+    return np.asarray(flags, dtype=bool), np.asarray(scores, dtype=np.float64), time.perf_counter() - start
+
+
+class DetectorRunner:
+    """
+    Runs detectors in parallel so total latency is that of the slowest detector.
+
+    Args:
+        detectors (list): Detector instances.
+        vote (str): "any" flags a row if any detector does, "all" only if every detector
+            does, "weighted" if the weights of the flagging detectors reach `weight_threshold`
+            of the total weight.
+        weights (dict, optional): Weight per detector name for weighted voting (default 1).
+        weight_threshold (float): Share of total weight needed in weighted voting.
+        use_processes (bool): Use a process pool instead of threads.
+        max_workers (int, optional): Pool size; defaults to one worker per detector.
+    """
+
+    def __init__(self, detectors, vote="any", weights=None, weight_threshold=0.5,
+                 use_processes=False, max_workers=None):
+        if vote not in VOTE_MODES:
+            raise ValueError(f"Unknown vote mode '{vote}'. Expected one of {VOTE_MODES}.")
+        self.detectors = list(detectors)
+        self.vote = vote
+        self.weights = weights or {}
+        self.weight_threshold = weight_threshold
+        self.use_processes = use_processes
+        self.max_workers = max_workers or max(1, len(self.detectors))
+
+    def run(self, X):
+        """
+        Score X with every detector concurrently and merge the verdicts.
+
+        A detector that raises is logged and left out of the vote.
+
+        Args:
+            X (numpy.ndarray): Feature matrix shared by all detectors.
+
+        Returns:
+            DetectionResult: Merged verdict, per-detector scores and timings.
+        """
+        executor_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        detector_flags, scores, timings, failed = {}, {}, {}, {}
+
+        with executor_cls(max_workers=self.max_workers) as executor:
+            futures = {detector.name: executor.submit(_timed_score, detector, X) for detector in self.detectors}
+            for name, future in futures.items():
+                try:
+                    flags, detector_scores, elapsed = future.result()
+                except Exception as e:
+                    logging.error(f"Detector {name} failed: {e}")
+                    failed[name] = str(e)
+                    continue
+                detector_flags[name] = flags
+                scores[name] = detector_scores
+                timings[name] = elapsed
+                logging.info(f"{name}: {int(flags.sum())} anomalies in {elapsed:.3f}s")
+
+        return DetectionResult(self._merge(detector_flags, len(X)), scores, detector_flags, timings, failed)
+
+    def _merge(self, detector_flags, n_rows):
+        if not detector_flags:
+            return np.zeros(n_rows, dtype=bool)
+        stacked = np.vstack(list(detector_flags.values()))
+        if self.vote == "any":
+            return stacked.any(axis=0)
+        if self.vote == "all":
+            return stacked.all(axis=0)
+        weights = np.array([self.weights.get(name, 1.0) for name in detector_flags], dtype=np.float64)
+        return weights @ stacked >= self.weight_threshold * weights.sum()
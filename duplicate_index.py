@@ -0,0 +1,405 @@
+# duplicate_index.py
+# Persistent index of uploaded transaction IDs: a memory-mapped Bloom filter in front of an exact SQLite table.
+import os
+import sys
+import json
+import math
+import mmap
+import time
+import struct
+import sqlite3
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from state_store import STATE_DIR
+
+DUPLICATE_INDEX_DIR = os.getenv("CLEARSETTLE_DUPLICATE_INDEX_DIR", os.path.join(STATE_DIR, "duplicate_index"))
+# Reject uploads of IDs stored by earlier runs; off by default because re-running a file is then a no-op
+UPLOAD_DUPLICATE_INDEX = os.getenv("UPLOAD_DUPLICATE_INDEX", "0") == "1"
+DUPLICATE_INDEX_CAPACITY = int(os.getenv("DUPLICATE_INDEX_CAPACITY", "10000000"))
+DUPLICATE_INDEX_ERROR_RATE = float(os.getenv("DUPLICATE_INDEX_ERROR_RATE", "0.001"))
+
+_HEADER = struct.Struct("<8sQQQd")
+_MAGIC = b"CSBLOOM1"
+# Bound on SQLite query parameters per statement
+_SQL_CHUNK = 500
+
+
+def bloom_parameters(capacity, error_rate):
+    """
+    Optimal Bloom filter size for an expected number of entries and false-positive rate.
+
+    Args:
+        capacity (int): Expected number of IDs.
+        error_rate (float): Target false-positive rate at that capacity.
+
+    Returns:
+        tuple: (number of bits, number of hash functions)
+    """
+    num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+class BloomFilter:
+    """
+    A Bloom filter in a memory-mapped file, shared by every process that opens it.
+
+    Positions come from one BLAKE2b digest per key (double hashing). The file starts with
+    a header holding the size, number of hashes, capacity and target error rate, so every
+    process agrees on the layout. The filter never forgets: bits are only ever set.
+
+    Args:
+        path (str): Filter file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # The mapping keeps its own descriptor, so the file can be closed right away
+        with open(path, "r+b") as f:
+            self._map = mmap.mmap(f.fileno(), 0)
+            self.inode = os.fstat(f.fileno()).st_ino
+        magic, self.num_bits, self.num_hashes, self.capacity, self.error_rate = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a duplicate index Bloom filter")
+
+    @staticmethod
+    def create(path, capacity, error_rate):
+        """
+        Write an empty filter file atomically.
+
+        Args:
+            path (str): Filter file.
+            capacity (int): Expected number of IDs.
+            error_rate (float): Target false-positive rate at that capacity.
+        """
+        num_bits, num_hashes = bloom_parameters(capacity, error_rate)
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, num_bits, num_hashes, capacity, error_rate))
+            f.truncate(_HEADER.size + (num_bits + 7) // 8)
+        os.replace(tmp_path, path)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        bits = self._map
+        for position in self._positions(key):
+            if not bits[_HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        # Callers serialize writers; setting a bit is idempotent
+        bits = self._map
+        for position in self._positions(key):
+            index = _HEADER.size + (position >> 3)
+            bits[index] |= 1 << (position & 7)
+
+    def bits_set(self):
+        count = 0
+        for start in range(_HEADER.size, len(self._map), 1 << 20):
+            count += int.from_bytes(self._map[start:start + (1 << 20)], "little").bit_count()
+        return count
+
+    def size_bytes(self):
+        return len(self._map)
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+
+
+class DuplicateIndex:
+    """
+    Every transaction ID ever uploaded, persisted under `directory` and shared by all workers.
+
+    Lookups first ask the Bloom filter, which answers "definitely new" for unseen IDs in a
+    few microseconds without touching disk. Only Bloom positives are confirmed against the
+    exact SQLite table, so a false positive never rejects a transaction. Claims run inside a
+    SQLite write transaction, which serializes parallel upload workers: an ID is claimed by
+    exactly one of them. Bloom bits are set before the transaction commits, so a committed
+    ID is always visible to the filter.
+
+    The filter is sized for `capacity` IDs at `error_rate`; past that the false-positive
+    rate (visible in `stats`) climbs and `rebuild` with a larger capacity restores it.
+
+    Args:
+        directory (str): Index directory.
+        capacity (int): Expected number of IDs, used when the filter is first created.
+        error_rate (float): Target false-positive rate, used when the filter is first created.
+    """
+
+    def __init__(self, directory=DUPLICATE_INDEX_DIR, capacity=DUPLICATE_INDEX_CAPACITY, error_rate=DUPLICATE_INDEX_ERROR_RATE):
+        self.directory = directory
+        self.db_path = os.path.join(directory, "ids.db")
+        self.bloom_path = os.path.join(directory, "bloom.bin")
+        os.makedirs(directory, exist_ok=True)
+        self.bloom_hits = 0
+        self.bloom_misses = 0
+        self.false_positives = 0
+        self._local = threading.local()
+        self._bloom_lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS ids (transaction_id TEXT PRIMARY KEY, added_at REAL NOT NULL) WITHOUT ROWID")
+            if not os.path.exists(self.bloom_path):
+                BloomFilter.create(self.bloom_path, capacity, error_rate)
+        self._bloom = BloomFilter(self.bloom_path)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, serializing writers across processes
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _current_bloom(self):
+        # Another process may have rebuilt the filter into a new file
+        with self._bloom_lock:
+            if os.stat(self.bloom_path).st_ino != self._bloom.inode:
+                self._bloom.close()
+                self._bloom = BloomFilter(self.bloom_path)
+            return self._bloom
+
+    def _existing(self, conn, transaction_ids):
+        existing = set()
+        for start in range(0, len(transaction_ids), _SQL_CHUNK):
+            chunk = transaction_ids[start:start + _SQL_CHUNK]
+            rows = conn.execute(
+                f"SELECT transaction_id FROM ids WHERE transaction_id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def __contains__(self, transaction_id):
+        if transaction_id not in self._current_bloom():
+            self.bloom_misses += 1
+            return False
+        self.bloom_hits += 1
+        found = self._connection().execute("SELECT 1 FROM ids WHERE transaction_id = ?", (transaction_id,)).fetchone() is not None
+        if not found:
+            self.false_positives += 1
+        return found
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+
+    def contains_many(self, transaction_ids):
+        """
+        Which of these IDs are already in the index.
+
+        Args:
+            transaction_ids (iterable): IDs to look up.
+
+        Returns:
+            set: The IDs that are known.
+        """
+        bloom = self._current_bloom()
+        maybe = [transaction_id for transaction_id in dict.fromkeys(transaction_ids) if transaction_id in bloom]
+        if not maybe:
+            return set()
+        known = self._existing(self._connection(), maybe)
+        self.false_positives += len(maybe) - len(known)
+        return known
+
+    def claim(self, transaction_ids):
+        """
+        Add IDs to the index and report which ones it already held.
+
+        Atomic across processes: when two workers claim the same ID, exactly one of them
+        gets it as new.
+
+        Args:
+            transaction_ids (iterable): IDs about to be uploaded.
+
+        Returns:
+            set: IDs that were already in the index (duplicates of earlier uploads).
+        """
+        transaction_ids = list(dict.fromkeys(transaction_ids))
+        if not transaction_ids:
+            return set()
+        with self._transaction() as conn:
+            bloom = self._current_bloom()
+            maybe = [transaction_id for transaction_id in transaction_ids if transaction_id in bloom]
+            known = self._existing(conn, maybe)
+            self.bloom_hits += len(maybe)
+            self.bloom_misses += len(transaction_ids) - len(maybe)
+            self.false_positives += len(maybe) - len(known)
+            new = [transaction_id for transaction_id in transaction_ids if transaction_id not in known]
+            now = time.time()
+            conn.execute("SAVEPOINT claim")
+            changes = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO ids (transaction_id, added_at) VALUES (?, ?)", ((i, now) for i in new))
+            if conn.total_changes - changes != len(new):
+                # The filter missed IDs that are in the table: it is out of date, so use the exact answer
+                logging.warning(f"Duplicate index Bloom filter at {self.bloom_path} is stale; run `python duplicate_index.py rebuild`.")
+                conn.execute("ROLLBACK TO claim")
+                known = self._existing(conn, transaction_ids)
+                new = [transaction_id for transaction_id in transaction_ids if transaction_id not in known]
+                conn.executemany("INSERT INTO ids (transaction_id, added_at) VALUES (?, ?)", ((i, now) for i in new))
+            conn.execute("RELEASE claim")
+            for transaction_id in new:
+                bloom.add(transaction_id)
+        return known
+
+    def release(self, transaction_ids):
+        """
+        Remove claimed IDs whose upload failed, so a retry is not rejected.
+
+        The Bloom bits stay set; the exact table turns later lookups into false positives.
+
+        Args:
+            transaction_ids (iterable): IDs to remove.
+        """
+        transaction_ids = list(transaction_ids)
+        if not transaction_ids:
+            return
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM ids WHERE transaction_id = ?", ((i,) for i in transaction_ids))
+
+    def rebuild(self, transaction_ids=None, capacity=None, error_rate=None):
+        """
+        Recreate the Bloom filter, optionally resized, and optionally reload the exact table.
+
+        Run it while no uploads are in progress.
+
+        Args:
+            transaction_ids (iterable, optional): Replace the table with these IDs (e.g. every
+                document in storage); by default the filter is rebuilt from the current table.
+            capacity (int, optional): New expected number of IDs; defaults to the current one,
+                or twice the number of IDs if that is larger.
+            error_rate (float, optional): New target false-positive rate.
+
+        Returns:
+            dict: Index statistics after the rebuild.
+        """
+        with self._transaction() as conn:
+            if transaction_ids is not None:
+                conn.execute("DELETE FROM ids")
+                now = time.time()
+                conn.executemany("INSERT OR IGNORE INTO ids (transaction_id, added_at) VALUES (?, ?)", ((i, now) for i in transaction_ids))
+            entries = conn.execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+            bloom = self._current_bloom()
+            capacity = capacity or max(bloom.capacity, 2 * entries)
+            error_rate = error_rate or bloom.error_rate
+
+            tmp_path = self.bloom_path + ".rebuild"
+            BloomFilter.create(tmp_path, capacity, error_rate)
+            rebuilt = BloomFilter(tmp_path)
+            for (transaction_id,) in conn.execute("SELECT transaction_id FROM ids"):
+                rebuilt.add(transaction_id)
+            rebuilt.flush()
+            rebuilt.close()
+            os.replace(tmp_path, self.bloom_path)
+        logging.info(f"Rebuilt duplicate index Bloom filter for {entries} IDs (capacity {capacity}, error rate {error_rate}).")
+        return self.stats()
+
+    def stats(self):
+        """
+        Size and accuracy of the index.
+
+        Returns:
+            dict: Entries, filter geometry and fill, the false-positive rate expected at the
+                current fill, file sizes, and this process's lookup counters.
+        """
+        bloom = self._current_bloom()
+        entries = len(self)
+        fill = bloom.bits_set() / bloom.num_bits
+        return {
+            "entries": entries,
+            "capacity": bloom.capacity,
+            "target_error_rate": bloom.error_rate,
+            "expected_false_positive_rate": fill ** bloom.num_hashes,
+            "bloom_bits": bloom.num_bits,
+            "bloom_hashes": bloom.num_hashes,
+            "bloom_fill_ratio": round(fill, 6),
+            "bloom_bytes": bloom.size_bytes(),
+            "db_bytes": sum(
+                os.path.getsize(path) for path in (self.db_path, self.db_path + "-wal") if os.path.exists(path)
+            ),
+            "over_capacity": entries > bloom.capacity,
+            "bloom_hits": self.bloom_hits,
+            "bloom_misses": self.bloom_misses,
+            "false_positives": self.false_positives,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """
+    The process-wide duplicate index, or None unless UPLOAD_DUPLICATE_INDEX=1.
+
+    Returns:
+        DuplicateIndex | None: The shared index.
+    """
+    global _index
+    if not UPLOAD_DUPLICATE_INDEX:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex()
+        return _index
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Inspect and maintain the persistent duplicate transaction index.")
+    parser.add_argument("--dir", default=DUPLICATE_INDEX_DIR, help="Index directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Print size, fill and false-positive rate.")
+    check = commands.add_parser("check", help="Look up transaction IDs.")
+    check.add_argument("transaction_ids", nargs="+")
+    rebuild = commands.add_parser("rebuild", help="Recreate the Bloom filter, optionally resized or reloaded from storage.")
+    rebuild.add_argument("--from-storage", action="store_true", help="Reload the IDs from every settlement in storage.")
+    rebuild.add_argument("--capacity", type=int, help="Expected number of IDs.")
+    rebuild.add_argument("--error-rate", type=float, help="Target false-positive rate.")
+    args = parser.parse_args(argv)
+
+    index = DuplicateIndex(args.dir)
+    if args.command == "stats":
+        print(json.dumps(index.stats(), indent=2))
+    elif args.command == "check":
+        for transaction_id in args.transaction_ids:
+            started = time.perf_counter()
+            found = transaction_id in index
+            print(f"{transaction_id}: {'known' if found else 'new'} ({(time.perf_counter() - started) * 1e6:.1f} µs)")
+    else:
+        transaction_ids = None
+        if args.from_storage:
+            from storage import get_storage
+            transaction_ids = (txn["transaction_id"] for txn in get_storage().stream_settlements() if txn.get("transaction_id"))
+        print(json.dumps(index.rebuild(transaction_ids, args.capacity, args.error_rate), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
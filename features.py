@@ -0,0 +1,159 @@
+# features.py
+# Turns settlement records into the numeric matrix consumed by every anomaly detector.
+import logging
+import numpy as np
+import pandas as pd
+from model_store import save_artifact, load_artifact
+
+FEATURE_SCHEMA_ARTIFACT = "feature_schema"
+CATEGORICAL_FIELDS = ["asset_type", "settlement_venue", "counterparty_1"]
+FEATURE_COLUMNS = [
+    "settlement_lag_days",
+    "asset_type_code",
+    "settlement_venue_code",
+    "counterparty_1_code",
+    "counterparty_failure_rate",
+]
+
+
+def to_frame(transactions):
+    """
+    Build a DataFrame from transaction dicts (a DataFrame is passed through unchanged).
+
+    Args:
+        transactions (list | pandas.DataFrame): Settlement records.
+
+    Returns:
+        pandas.DataFrame: One row per transaction.
+    """
+    if isinstance(transactions, pd.DataFrame):
+        return transactions
+    return pd.DataFrame.from_records(transactions)
+
+
+def _clean(df, field):
+    # Missing columns encode as unknown rather than raising, so partial records still score
+    if field not in df:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    return df[field].astype("string").str.strip().str.lower()
+
+
+def _parse_dates(series):
+    # Settlement files repeat a small set of dates, so parse each distinct value once
+    codes, uniques = pd.factorize(series)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors="coerce", format="mixed").to_numpy(dtype="datetime64[ns]")
+    return np.append(parsed, np.datetime64("NaT"))[codes]
+
+
+def settlement_lag_days(df):
+    """
+    Days between trade date and settlement date; 0 when either date is missing or invalid.
+
+    Args:
+        df (pandas.DataFrame): Settlement records.
+
+    Returns:
+        numpy.ndarray: float32 lag per row.
+    """
+    if "trade_date" not in df or "settlement_date" not in df:
+        return np.zeros(len(df), dtype=np.float32)
+    lag = (_parse_dates(df["settlement_date"]) - _parse_dates(df["trade_date"])) / np.timedelta64(1, "D")
+    return np.nan_to_num(np.floor(lag), nan=0.0).astype(np.float32)
+
+
+class FeatureSchema:
+    """
+    Category vocabularies and counterparty failure rates learned at training time.
+
+    The same schema is used to encode training and scoring batches, so a given record
+    always maps to the same feature vector regardless of what else is in the batch.
+    Unknown categories encode as -1 and unknown counterparties fall back to the
+    overall training failure rate.
+    """
+
+    def __init__(self, categories, failure_rates, default_failure_rate, columns=None):
+        self.categories = categories
+        self.failure_rates = failure_rates
+        self.default_failure_rate = default_failure_rate
+        self.columns = columns or list(FEATURE_COLUMNS)
+
+    @classmethod
+    def fit(cls, transactions):
+        """
+        Learn the schema from training transactions.
+
+        Args:
+            transactions (list | pandas.DataFrame): Training records.
+
+        Returns:
+            FeatureSchema: The fitted schema.
+        """
+        df = to_frame(transactions)
+        categories = {
+            field: sorted(_clean(df, field).dropna().unique().tolist())
+            for field in CATEGORICAL_FIELDS
+        }
+        failed = (_clean(df, "status") == "failed").fillna(False).astype(np.float32)
+        counterparty = _clean(df, "counterparty_1")
+        failure_rates = failed.groupby(counterparty).mean().astype(float).to_dict()
+        default_failure_rate = float(failed.mean()) if len(failed) else 0.0
+        return cls(categories, failure_rates, default_failure_rate)
+
+    def encode(self, transactions):
+        """
+        Encode a batch of settlement records into a float32 feature matrix in one pass.
+
+        Args:
+            transactions (list | pandas.DataFrame): Records to encode.
+
+        Returns:
+            numpy.ndarray: Matrix of shape (n_rows, len(self.columns)).
+        """
+        df = to_frame(transactions)
+        X = np.empty((len(df), len(self.columns)), dtype=np.float32)
+        X[:, 0] = settlement_lag_days(df)
+        for i, field in enumerate(CATEGORICAL_FIELDS, start=1):
+            X[:, i] = pd.Categorical(_clean(df, field), categories=self.categories[field]).codes
+        counterparty = _clean(df, "counterparty_1")
+        X[:, 4] = counterparty.map(self.failure_rates).astype("Float64").fillna(self.default_failure_rate).to_numpy(dtype=np.float32)
+        return X
+
+    def to_dict(self):
+        return {
+            "columns": self.columns,
+            "categories": self.categories,
+            "failure_rates": self.failure_rates,
+            "default_failure_rate": self.default_failure_rate,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["categories"], data["failure_rates"], data["default_failure_rate"], data["columns"])
+
+
+def save_feature_schema(schema):
+    """
+    Persist the schema as a versioned artifact shared by all detectors.
+
+    Args:
+        schema (FeatureSchema): Fitted schema.
+
+    Returns:
+        dict: Manifest of the saved artifact.
+    """
+    return save_artifact(FEATURE_SCHEMA_ARTIFACT, schema.to_dict(), {"columns": schema.columns})
+
+
+def load_feature_schema(version=None):
+    """
+    Load the trained feature schema (cached after the first call).
+
+    Args:
+        version (str, optional): Specific schema version; defaults to the latest.
+
+    Returns:
+        tuple: (FeatureSchema, version)
+    """
+    payload, manifest = load_artifact(FEATURE_SCHEMA_ARTIFACT, version)
+    logging.debug(f"Using feature schema {manifest['version']}")
+    return FeatureSchema.from_dict(payload), manifest["version"]
@@ -1,59 +1,134 @@
 # generate_recommendations.py
-# This script generates recommendations based on root cause tags in Firebase Firestore.
+# This script generates recommendations based on root cause tags for the settlements in storage.
 # -*- coding: utf-8 -*-
 
 import os
 import logging
-import firebase_admin
-from firebase_admin import credentials, firestore
+import threading
+import pandas as pd
+from batch_writer import chunked
+from recommendation_rules import RuleEngine
+from storage import get_storage
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 
-# Firebase Init
-try:
-    if not firebase_admin._apps:  # Check if Firebase is already initialized
-        cred = credentials.Certificate("/app/clearsettle-ai-firebase-adminsdk-fbsvc-844f7a5e30.json")
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logging.info("Firebase initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize Firebase: {e}")
-    exit()
-
-def generate_recommendations():
+RECOMMENDATION_MAP = {
+    "Insufficient securities": "Initiate securities recall",
+    "Counterparty liquidity issue": "Request liquidity injection from counterparty",
+    "Settlement window mismatch": "Initiate trade matching earlier",
+    "anomaly_detected": "Investigate unusual settlement pattern",
+    "normal": "Follow standard repair process – pattern is common"
+}
+DEFAULT_RECOMMENDATION = "Investigate manually"
+RULES_FILE = os.getenv("RECOMMENDATION_RULES", "recommendation_rules.json")
+# Transactions resolved per vectorized block
+RECOMMENDATION_BLOCK_SIZE = 50_000
+
+_rule_engine = None
+_rule_engine_lock = threading.Lock()
+
+def get_rule_engine():
+    """
+    The process-wide rule engine, compiled on first use.
+
+    It reloads itself when the rules file changes and falls back to the exact-match
+    tag map when no rules file is deployed.
+
+    Returns:
+        RuleEngine: The shared engine.
+    """
+    global _rule_engine
+    with _rule_engine_lock:
+        if _rule_engine is None:
+            _rule_engine = RuleEngine(RULES_FILE, RuleEngine.from_tag_map(RECOMMENDATION_MAP, DEFAULT_RECOMMENDATION))
+        return _rule_engine
+
+def resolve_recommendations(df):
+    """
+    Resolve the recommendation for every row of a batch at once using the rule engine.
+
+    Args:
+        df (pandas.DataFrame): Settlements.
+
+    Returns:
+        pandas.Series: Recommendation per row.
+    """
+    return get_rule_engine().evaluate(df)
+
+def changed_recommendations(df, recommendations):
+    """
+    Select the rows whose resolved recommendation differs from the stored one.
+
+    Args:
+        df (pandas.DataFrame): Settlements, optionally with a stored `recommendation` column.
+        recommendations (pandas.Series): Newly resolved recommendations.
+
+    Returns:
+        pandas.Series: Boolean mask of rows that need a write.
+    """
+    if "recommendation" not in df:
+        return pd.Series(True, index=df.index)
+    return recommendations.ne(df["recommendation"])
+
+def generate_recommendations(transactions=None):
+    """
+    Map each settlement's root cause tag to a recommendation and store it.
+
+    Recommendations are resolved for a whole block at once and compared with the stored
+    value; only documents whose recommendation changed are written, in chunked batch
+    commits, so a steady-state rerun does close to zero writes.
+
+    Args:
+        transactions (list, optional): Transactions from the pipeline context. When omitted
+            the stage runs on its own and reads the `settlements` collection.
+
+    Returns:
+        int: Number of transactions updated.
+
+    Raises:
+        RuntimeError: If some recommendations could not be stored. Other errors are logged and re-raised.
+    """
     try:
-        # Fetch settlement data
-        docs = db.collection('settlements').stream()
-        recommendation_map = {
-            "Insufficient securities": "Initiate securities recall",
-            "Counterparty liquidity issue": "Request liquidity injection from counterparty",
-            "Settlement window mismatch": "Initiate trade matching earlier",
-            "anomaly_detected": "Investigate unusual settlement pattern",
-            "normal": "Follow standard repair process – pattern is common"
-        }
-
-        updated_count = 0
-        for doc in docs:
-            data = doc.to_dict()
-            tag = data.get("root_cause_tag", "")
-            recommendation = recommendation_map.get(tag, "Investigate manually")
-
-            # Update Firestore with the recommendation
-            db.collection('settlements').document(doc.id).update({
-                "recommendation": recommendation
-            })
-            updated_count += 1
-
-        logging.info(f"Recommendations updated for {updated_count} transactions.")
+        storage = get_storage()
+        # Fetch settlement data only when no pipeline context was passed in
+        if transactions is None:
+            transactions = storage.stream_settlements()
+
+        updated_count = unchanged_count = failed_count = 0
+        for block in chunked(transactions, RECOMMENDATION_BLOCK_SIZE):
+            df = pd.DataFrame.from_records(block)
+            recommendations = resolve_recommendations(df)
+            changed = changed_recommendations(df, recommendations)
+
+            updates = (
+                (transaction_id, {"recommendation": recommendation})
+                for transaction_id, recommendation in zip(df.loc[changed, "transaction_id"], recommendations[changed])
+            )
+            result = storage.update_settlements(updates)
+            updated_count += result["written"]
+            failed_count += len(result["failed"])
+            unchanged_count += int((~changed).sum())
+
+            # Mirror the stored value onto the shared dicts for later pipeline stages
+            for txn, recommendation in zip(block, recommendations.tolist()):
+                txn["recommendation"] = recommendation
+
+        logging.info(
+            f"Recommendations updated for {updated_count} transactions "
+            f"({unchanged_count} unchanged, {failed_count} failed)."
+        )
+        logging.info(f"Recommendation rule hits: {get_rule_engine().hits}")
+        if failed_count:
+            raise RuntimeError(f"{failed_count} recommendations could not be stored.")
         return updated_count
     except Exception as e:
         logging.error(f"Error generating recommendations: {e}")
-        return 0
+        raise
 
-def main():
-    recommendations = generate_recommendations()
-    logging.info(f"Generated recommendations for {recommendations} transactions.")
+def main(transactions=None):
+    recommendations = generate_recommendations(transactions)
+    logging.info(f"Updated recommendations for {recommendations} transactions.")
 
 if __name__ == "__main__":
     main()
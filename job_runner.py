@@ -0,0 +1,248 @@
+# job_runner.py
+# Background pipeline runs: a SQLite job table plus a bounded process pool, so the UI never blocks on a run.
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from state_store import STATE_DIR
+
+JOBS_DB = os.path.join(STATE_DIR, "jobs.db")
+UPLOAD_DIR = os.getenv("CLEARSETTLE_UPLOAD_DIR", "uploads")
+MAX_CONCURRENT_JOBS = int(os.getenv("PIPELINE_MAX_CONCURRENT_JOBS", "2"))
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "interrupted")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    data_file TEXT NOT NULL,
+    submitted_by TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_stages (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    seconds REAL,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE INDEX IF NOT EXISTS jobs_submitted_at ON jobs (submitted_at);
+"""
+
+
+@contextmanager
+def connect(db_path=JOBS_DB):
+    """
+    Open the job table for one transaction. WAL mode lets the UI read while worker processes write.
+
+    Args:
+        db_path (str): SQLite database file.
+
+    Yields:
+        sqlite3.Connection: Connection, committed and closed on exit.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def update_job(db_path, job_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with connect(db_path) as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", [*fields.values(), job_id])
+
+
+def record_stage(db_path, job_id, stage, status, seconds=None, error=None):
+    with connect(db_path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO job_stages (job_id, stage, status, seconds, error, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, stage, status, seconds, error, time.time()),
+        )
+
+
+def oldest_running_start(db_path):
+    # Checkpoints touched since this time may still be in use by a running job
+    with connect(db_path) as conn:
+        return conn.execute("SELECT MIN(started_at) FROM jobs WHERE status = 'running'").fetchone()[0]
+
+
+def remove_upload(data_file):
+    # An uploaded file is only needed until its job finishes
+    try:
+        os.remove(data_file)
+    except FileNotFoundError:
+        pass
+
+
+def init_worker(firebase_credentials):
+    # Worker processes start clean, so give them the same Firebase credentials as the UI
+    if firebase_credentials is None:
+        return
+    import firebase_admin
+    from firebase_admin import credentials
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(firebase_credentials))
+
+
+def run_job(db_path, job_id, data_file, resume=False):
+    """
+    Worker-process entry point: run the pipeline for one job and record its progress.
+
+    Args:
+        db_path (str): Job table.
+        job_id (str): Job to run.
+        data_file (str): Uploaded settlements file.
+        resume (bool): Skip stages already completed for the same file content by an earlier run.
+
+    Returns:
+        bool: True if the pipeline completed.
+    """
+    # Imported here so the UI process never loads the pipeline's models and clients
+    from main_pipeline import run_pipeline
+
+    failures = []
+
+    def progress(stage, status, seconds, error):
+        record_stage(db_path, job_id, stage, status, seconds, error)
+        if status == "failed":
+            failures.append(f"{stage}: {error}")
+
+    update_job(db_path, job_id, status="running", started_at=time.time())
+    try:
+        ok = run_pipeline(data_file=data_file, progress=progress, resume=resume,
+                          active_since=oldest_running_start(db_path))
+    except Exception as e:
+        logging.error(f"Job {job_id} crashed: {e}")
+        update_job(db_path, job_id, status="failed", error=str(e), finished_at=time.time())
+        return False
+    update_job(db_path, job_id, status="succeeded" if ok else "failed",
+               error=None if ok else (failures[-1] if failures else "pipeline stopped"), finished_at=time.time())
+    return ok
+
+
+class JobRunner:
+    """
+    Accepts uploaded files and runs the pipeline on them in a pool of worker processes.
+
+    At most `max_workers` pipelines run at once; further jobs wait as "queued". Job and
+    per-stage state lives in SQLite, so it survives Streamlit reruns and is visible to
+    every session. Jobs left queued or running by a previous server process are marked
+    "interrupted" on start-up. Uploaded files are deleted once their job finishes or is
+    interrupted.
+
+    Args:
+        max_workers (int): Concurrent pipeline runs.
+        db_path (str): Job table.
+        upload_dir (str): Where uploaded files are stored, one file per job.
+        firebase_credentials (dict, optional): Service account used by the workers; by default
+            the pipeline modules initialize Firebase themselves.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, db_path=JOBS_DB, upload_dir=UPLOAD_DIR,
+                 firebase_credentials=None):
+        self.db_path = db_path
+        self.upload_dir = upload_dir
+        self.max_workers = max_workers
+        self.firebase_credentials = firebase_credentials
+        self.executor = self._new_executor()
+        with connect(db_path) as conn:
+            interrupted = [row["data_file"] for row in conn.execute("SELECT data_file FROM jobs WHERE status IN ('queued', 'running')")]
+            conn.execute(
+                "UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE status IN ('queued', 'running')",
+                (time.time(),),
+            )
+        for data_file in interrupted:
+            remove_upload(data_file)
+
+    def _new_executor(self):
+        # spawn, not fork: the Streamlit server is multi-threaded
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self.firebase_credentials,),
+        )
+
+    def submit(self, filename, content, submitted_by=None, resume=False):
+        """
+        Store an uploaded file and queue a pipeline run for it.
+
+        Args:
+            filename (str): Original file name, for display.
+            content (bytes): File content.
+            submitted_by (str, optional): Who submitted the job.
+            resume (bool): Reuse stage checkpoints of earlier runs of the same content. Off by
+                default, so resubmitting a file runs every stage again.
+
+        Returns:
+            str: Job ID.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(self.upload_dir, exist_ok=True)
+        extension = os.path.splitext(filename)[1] or ".json"
+        data_file = os.path.join(self.upload_dir, f"{job_id}{extension}")
+        with open(data_file, "wb") as f:
+            f.write(content)
+
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, filename, data_file, submitted_by, status, submitted_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, filename, data_file, submitted_by, time.time()),
+            )
+        try:
+            future = self.executor.submit(run_job, self.db_path, job_id, data_file, resume)
+        except BrokenProcessPool:
+            # A crashed worker breaks the whole pool; later jobs get a fresh one
+            logging.warning("Pipeline worker pool was broken; starting a new one.")
+            self.executor = self._new_executor()
+            future = self.executor.submit(run_job, self.db_path, job_id, data_file, resume)
+        future.add_done_callback(lambda f: self._on_done(job_id, data_file, f))
+        logging.info(f"Queued pipeline job {job_id} for {filename}")
+        return job_id
+
+    def _on_done(self, job_id, data_file, future):
+        remove_upload(data_file)
+        # A worker that dies (e.g. out of memory) never gets to record its own failure
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Job {job_id} failed in its worker process: {error}")
+            update_job(self.db_path, job_id, status="failed", error=str(error), finished_at=time.time())
+
+    def jobs(self, limit=20):
+        """
+        Most recent jobs with their stage progress.
+
+        Args:
+            limit (int): Number of jobs to return.
+
+        Returns:
+            list: Job dicts, newest first, each with a "stages" dict keyed by stage name.
+        """
+        with connect(self.db_path) as conn:
+            jobs = [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY submitted_at DESC LIMIT ?", (limit,))]
+            for job in jobs:
+                rows = conn.execute("SELECT * FROM job_stages WHERE job_id = ?", (job["job_id"],))
+                job["stages"] = {row["stage"]: dict(row) for row in rows}
+        return jobs
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
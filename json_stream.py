@@ -0,0 +1,178 @@
+# json_stream.py
+# Incremental readers for settlement files, so large files are never loaded into memory at once.
+import re
+import json
+import logging
+
+CHUNK_SIZE = 64 * 1024
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+# Characters that end a number or literal
+_DELIMITER = re.compile(r'[\s,:\[\]{}"]')
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+
+
+def _may_be_truncated(buffer, pos):
+    # Without a delimiter after `pos`, the token there may continue in the next chunk
+    return _DELIMITER.search(buffer, pos) is None
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield the items of a top-level JSON array one by one.
+
+    Only the current item and one read chunk are held in memory. Items must be
+    separated by exactly one comma; a malformed item raises as soon as it is read,
+    without buffering the rest of the file.
+
+    Args:
+        f: Text file object positioned at the start of the array.
+        chunk_size (int): Number of characters to read at a time.
+
+    Yields:
+        object: The next decoded array item.
+    """
+    buffer = ""
+    pos = 0
+    # Characters dropped from the front of the buffer, for error positions in the file
+    offset = 0
+    eof = False
+    # What comes next: "[", the first item or "]", an item after a comma, or "," / "]" after an item
+    expect = "open"
+
+    def fill():
+        nonlocal buffer, pos, offset, eof
+        data = f.read(chunk_size)
+        if not data:
+            eof = True
+        offset += pos
+        buffer = buffer[pos:] + data
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of file: JSON array is not closed")
+            fill()
+            continue
+
+        char = buffer[pos]
+        if expect == "open":
+            if char != "[":
+                raise ValueError("Expected a JSON array")
+            expect = "first"
+            pos += 1
+            continue
+        if expect == "separator":
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' after array item at character {offset + pos}, found {char!r}")
+            expect = "item"
+            pos += 1
+            continue
+        if char == "]":
+            if expect == "first":
+                return
+            raise ValueError(f"Trailing comma before ']' at character {offset + pos}")
+        if char == ",":
+            raise ValueError(f"Missing array item before ',' at character {offset + pos}")
+
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # Only read on if the error can be the end of the chunk cutting a token short
+            if eof or not (e.msg.startswith("Unterminated string") or _may_be_truncated(buffer, e.pos)):
+                raise ValueError(f"Invalid JSON at character {offset + e.pos}: {e.msg}") from e
+            fill()
+            continue
+        # A value touching the end of the buffer (e.g. a number) may continue in the next chunk
+        if not eof and _may_be_truncated(buffer, end):
+            fill()
+            continue
+        pos = end
+        expect = "separator"
+        yield item
+
+
+def iter_ndjson(f):
+    """
+    Yield one decoded JSON object per non-empty line.
+
+    Args:
+        f: Text file object with newline-delimited JSON.
+
+    Yields:
+        object: The next decoded line.
+    """
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+
+
+def sniff_columnar_format(data_file):
+    """
+    Detect a columnar settlement file from its magic bytes.
+
+    Args:
+        data_file (str): Path to the settlement file.
+
+    Returns:
+        str | None: "parquet", "arrow" (IPC file or stream), or None for JSON formats.
+    """
+    with open(data_file, "rb") as f:
+        head = f.read(len(ARROW_FILE_MAGIC))
+    if head.startswith(PARQUET_MAGIC):
+        return "parquet"
+    if head == ARROW_FILE_MAGIC or head.startswith(ARROW_STREAM_MAGIC):
+        return "arrow"
+    return None
+
+
+def iter_transactions(data_file):
+    """
+    Stream transactions from a JSON array or NDJSON file.
+
+    Parquet and Arrow IPC files are recognized by their magic bytes and read one
+    record batch at a time. Otherwise the format is detected from the first
+    non-whitespace character: "[" means a JSON array, anything else is treated as
+    newline-delimited JSON.
+
+    Args:
+        data_file (str): Path to the settlement file.
+
+    Yields:
+        dict: The next transaction in the file.
+    """
+    file_format = sniff_columnar_format(data_file)
+    if file_format:
+        # Imported here so JSON-only callers never load Arrow
+        from columnar import iter_columnar
+        logging.info(f"Streaming {file_format} record batches from {data_file}")
+        yield from iter_columnar(data_file, file_format)
+        return
+
+    with open(data_file, 'r') as f:
+        first = ""
+        while True:
+            char = f.read(1)
+            if not char or char not in _WHITESPACE:
+                first = char
+                break
+        f.seek(0)
+
+        if first == "[":
+            logging.info(f"Streaming JSON array from {data_file}")
+            yield from iter_json_array(f)
+        else:
+            logging.info(f"Streaming NDJSON from {data_file}")
+            yield from iter_ndjson(f)
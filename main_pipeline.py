@@ -1,53 +1,188 @@
+import os
+import time
 import logging
+import argparse
 from upload_settlements import main as upload_settlements
-from anomaly_detection import main as detect_anomalies
-from generate_recommendations import main as generate_recommendations
+from anomaly_detection import main as detect_anomalies, ISOLATION_FOREST_ARTIFACT, ANOMALY_VOTE
+from autoencoder_model import AUTOENCODER_MODEL_PATH, AUTOENCODER_SCALER_PATH
+from features import FEATURE_SCHEMA_ARTIFACT
+from model_store import read_manifest
+from generate_recommendations import main as generate_recommendations, RULES_FILE
 from simulate_blockchain_log import main as log_blockchain_activity
+from pipeline_context import PipelineContext, PIPELINE_STAGES, configure_logging, report_progress
+from query_cache import publish_transaction_changes
+from storage import get_storage
+from streaming_pipeline import run_streaming_pipeline
+from pipeline_checkpoint import (
+    file_sha256, stage_input_hash, read_checkpoint, write_checkpoint,
+    save_transactions, load_transactions, prune_checkpoints,
+)
 
 # Setup logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+configure_logging()
 
-def run_pipeline(data_file="/app/settlement_transactions.json"):
-    logging.info("🚀 Starting ClearSettle AI pipeline...")
+PIPELINE_MODES = ("batch", "streaming")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "batch")
 
-    # Step 1: Upload Settlements
-    logging.info("📤 Step 1: Uploading settlements...")
-    try:
-        upload_settlements(data_file)
-        logging.info("✅ Settlements uploaded successfully.")
-    except Exception as e:
-        logging.error(f"❌ Error uploading settlements: {e}")
-        return
+def publish_changes(context):
+    """
+    Tell dashboards which slices of the data this run touched, so only those are refetched.
 
-    # Step 2: Anomaly Detection
-    logging.info("⚠️ Step 2: Running anomaly detection...")
+    Args:
+        context (PipelineContext): Transactions processed by the run.
+    """
     try:
-        detect_anomalies()
-        logging.info("✅ Anomaly detection completed.")
+        publish_transaction_changes(
+            (txn["transaction_id"] for txn in context.transactions),
+            (txn.get("status") for txn in context.transactions),
+        )
     except Exception as e:
-        logging.error(f"❌ Error during anomaly detection: {e}")
-        return
+        # Dashboards still pick the changes up when their cache entries expire
+        logging.warning(f"Failed to publish cache invalidation: {e}")
 
-    # Step 3: Generate Recommendations
-    logging.info("🎯 Step 3: Generating recommendations...")
+def _artifact_version(name):
     try:
-        generate_recommendations()
-        logging.info("✅ Recommendations generated successfully.")
-    except Exception as e:
-        logging.error(f"❌ Error generating recommendations: {e}")
-        return
+        return read_manifest(name)["version"]
+    except FileNotFoundError:
+        return "untrained"
+
+def _file_version(path):
+    return f"{os.path.getmtime(path)}:{os.path.getsize(path)}" if os.path.exists(path) else "missing"
+
+def stage_fingerprint(stage):
+    """
+    What a stage's result depends on besides its input transactions.
+
+    Retraining a model or editing the recommendation rules changes the fingerprint,
+    so the affected stages run again even when the data did not change. Every stage
+    also depends on the storage backend it writes to, so switching to another store
+    (or a wiped SQLite database) runs the whole pipeline again.
+
+    Args:
+        stage (str): Stage name.
+
+    Returns:
+        str: Fingerprint string.
+    """
+    store = get_storage().identity
+    if stage == "anomaly_detection":
+        return "|".join([
+            store, _artifact_version(FEATURE_SCHEMA_ARTIFACT), _artifact_version(ISOLATION_FOREST_ARTIFACT),
+            _file_version(AUTOENCODER_MODEL_PATH), _file_version(AUTOENCODER_SCALER_PATH), ANOMALY_VOTE,
+        ])
+    if stage == "recommendations":
+        return f"{store}|{file_sha256(RULES_FILE) if os.path.exists(RULES_FILE) else 'built-in'}"
+    return store
+
+def run_pipeline(data_file="/app/settlement_transactions.json", progress=None, resume=True, mode=PIPELINE_MODE,
+                 active_since=None):
+    """
+    Run upload, anomaly detection, recommendations and audit logging in order.
+
+    In "streaming" mode the stages run concurrently on chunks instead (see
+    streaming_pipeline.py); checkpoints and `resume` only apply to "batch" mode.
+
+    Every completed stage saves a checkpoint keyed by its input hash (the data file or
+    the previous stage's output, plus the stage fingerprint) with its output transactions
+    as an NDJSON artifact. With `resume`, stages whose input already completed are skipped
+    and the pipeline continues from the first one that has not, reloading the context from
+    the last skipped stage's artifact.
+
+    Args:
+        data_file (str): Settlement transactions file.
+        progress (callable, optional): Called as progress(stage, status, seconds, error) when a
+            stage in PIPELINE_STAGES starts ("running") and ends ("completed", "skipped" or "failed").
+        resume (bool): Skip stages with a completed checkpoint for the same input.
+        mode (str): "batch" or "streaming"; defaults to the PIPELINE_MODE environment variable.
+        active_since (float, optional): Start time of the oldest pipeline run in progress, whose
+            checkpoints must survive pruning; defaults to the start of this run.
+
+    Returns:
+        bool: True if every stage completed.
+    """
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode '{mode}'. Expected one of {PIPELINE_MODES}.")
+    if mode == "streaming":
+        return run_streaming_pipeline(data_file, progress=progress)["ok"]
+
+    logging.info("🚀 Starting ClearSettle AI pipeline...")
+    if active_since is None:
+        active_since = time.time()
+    # Uploaded transactions are carried between stages so Firestore is only read when a stage runs on its own
+    context = PipelineContext(data_file)
+
+    # Stage entry points raise on failure; the upload reports failed writes in its summary instead
+    def upload():
+        summary = upload_settlements(data_file, context)
+        if summary is None:
+            raise RuntimeError(f"could not read {data_file}")
+        if summary["failed"]:
+            raise RuntimeError(f"{summary['failed']} transactions could not be stored")
+
+    steps = {
+        "upload": ("📤 Step 1: Uploading settlements...", upload,
+                   lambda: f"✅ Settlements uploaded successfully ({len(context)} transactions).", "❌ Error uploading settlements"),
+        "anomaly_detection": ("⚠️ Step 2: Running anomaly detection...", lambda: detect_anomalies(context.transactions),
+                              lambda: "✅ Anomaly detection completed.", "❌ Error during anomaly detection"),
+        "recommendations": ("🎯 Step 3: Generating recommendations...", lambda: generate_recommendations(context.transactions),
+                            lambda: "✅ Recommendations generated successfully.", "❌ Error generating recommendations"),
+        "audit_log": ("🔐 Step 4: Simulating blockchain logs...", lambda: log_blockchain_activity(context.transactions),
+                      lambda: "✅ Blockchain logs updated successfully.", "❌ Error during blockchain logging"),
+    }
 
-    # Step 4: Blockchain-style Logging
-    logging.info("🔐 Step 4: Simulating blockchain logs...")
     try:
-        log_blockchain_activity()
-        logging.info("✅ Blockchain logs updated successfully.")
-    except Exception as e:
-        logging.error(f"❌ Error during blockchain logging: {e}")
-        return
+        upstream_hash = file_sha256(data_file)
+    except OSError as e:
+        logging.error(f"❌ Error uploading settlements: could not read {data_file}: {e}")
+        report_progress(progress, "upload", "failed", 0.0, str(e))
+        return False
+
+    # Artifact of the last skipped stage; only loaded once a later stage actually has to run
+    skipped_output = None
+    for stage in PIPELINE_STAGES:
+        start_message, step, done_message, error_message = steps[stage]
+        input_hash = stage_input_hash(stage, upstream_hash, stage_fingerprint(stage))
+
+        checkpoint = read_checkpoint(stage, input_hash) if resume else None
+        if checkpoint:
+            logging.info(f"⏭️ Skipping {stage}: its input is unchanged since the last completed run.")
+            report_progress(progress, stage, "skipped", 0.0)
+            skipped_output = checkpoint["output_file"]
+            upstream_hash = checkpoint["output_hash"]
+            continue
+
+        logging.info(start_message)
+        report_progress(progress, stage, "running")
+        started = time.perf_counter()
+        try:
+            if skipped_output:
+                context.transactions = load_transactions(skipped_output)
+                logging.info(f"Resumed {len(context)} transactions from {skipped_output}.")
+                skipped_output = None
+            step()
+            output_file, upstream_hash = save_transactions(context.transactions, stage, input_hash)
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            logging.error(f"{error_message}: {e}")
+            write_checkpoint(stage, input_hash, "failed", seconds=elapsed, error=str(e))
+            report_progress(progress, stage, "failed", elapsed, str(e))
+            publish_changes(context)
+            return False
+        elapsed = time.perf_counter() - started
+        write_checkpoint(stage, input_hash, "completed", output_file, upstream_hash, elapsed)
+        logging.info(done_message())
+        report_progress(progress, stage, "completed", elapsed)
 
+    publish_changes(context)
+    prune_checkpoints(active_since=active_since)
     logging.info("🏁 Pipeline completed successfully.\n")
+    return True
 
 # Ensure the function is accessible for import
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the ClearSettle AI pipeline.")
+    parser.add_argument("data_file", nargs="?", default="/app/settlement_transactions.json", help="Settlement transactions file.")
+    parser.add_argument("--no-resume", action="store_true", help="Run every stage, ignoring saved checkpoints.")
+    parser.add_argument("--mode", choices=PIPELINE_MODES, default=PIPELINE_MODE, help="Run stages one after another or as a streaming pipeline.")
+    args = parser.parse_args()
+    run_pipeline(args.data_file, resume=not args.no_resume, mode=args.mode)
\ No newline at end of file
@@ -0,0 +1,88 @@
+# merkle.py
+# Merkle tree helpers for the blockchain-style audit log.
+import hashlib
+
+
+def hash_pair(left, right):
+    """
+    Hash two hex-encoded child hashes into their parent.
+
+    Args:
+        left (str): Left child hash (hex).
+        right (str): Right child hash (hex).
+
+    Returns:
+        str: Parent hash (hex).
+    """
+    return hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def merkle_root(leaves):
+    """
+    Compute the Merkle root of a list of hex-encoded leaf hashes.
+
+    Odd levels duplicate their last node, so every level pairs up evenly.
+
+    Args:
+        leaves (list): Leaf hashes (hex), in order.
+
+    Returns:
+        str: Root hash (hex), or the hash of the empty string for no leaves.
+    """
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def merkle_proofs(leaves):
+    """
+    Build the inclusion proof of every leaf in one pass over the tree.
+
+    A proof lists the sibling hashes from the leaf up to the root, each prefixed with
+    the side the sibling sits on ("L:<hash>" or "R:<hash>"), so it has O(log n) entries.
+
+    Args:
+        leaves (list): Leaf hashes (hex), in order.
+
+    Returns:
+        list: One proof (list of strings) per leaf.
+    """
+    proofs = [[] for _ in leaves]
+    # positions[i] is the index of leaf i's ancestor in the current level
+    positions = list(range(len(leaves)))
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        for leaf, position in enumerate(positions):
+            if position % 2:
+                proofs[leaf].append(f"L:{level[position - 1]}")
+            else:
+                proofs[leaf].append(f"R:{level[position + 1]}")
+            positions[leaf] = position // 2
+        level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return proofs
+
+
+def verify_proof(leaf, proof, root):
+    """
+    Check that a leaf belongs to the tree with the given root.
+
+    Args:
+        leaf (str): Leaf hash (hex).
+        proof (list): Proof from merkle_proofs.
+        root (str): Expected Merkle root (hex).
+
+    Returns:
+        bool: True if folding the proof over the leaf yields the root.
+    """
+    current = leaf
+    for step in proof:
+        side, sibling = step.split(":", 1)
+        current = hash_pair(sibling, current) if side == "L" else hash_pair(current, sibling)
+    return current == root
@@ -0,0 +1,163 @@
+# model_store.py
+# Versioned on-disk model artifacts with content hashes, cached in memory once loaded.
+import os
+import json
+import hashlib
+import logging
+import datetime
+import tempfile
+import threading
+import joblib
+
+MODEL_DIR = os.getenv("CLEARSETTLE_MODEL_DIR", "models")
+MANIFEST_NAME = "latest.json"
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models.
+
+    Each entry is loaded lazily on first use and reused afterwards. Entries remember
+    the modification times of the files they were loaded from and are reloaded when
+    any of those files change. Loads are serialized with a lock so concurrent callers
+    never load the same model twice.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, paths, loader):
+        """
+        Return the cached value for `key`, loading it if missing or stale.
+
+        Args:
+            key (hashable): Cache key.
+            paths (list): Files the value is loaded from; their mtimes decide staleness.
+            loader (callable): Zero-argument function that loads the value.
+
+        Returns:
+            object: The loaded value.
+        """
+        signature = tuple(os.stat(path).st_mtime_ns for path in paths)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+            value = loader()
+            self._entries[key] = (signature, value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+registry = ModelRegistry()
+
+
+def _artifact_dir(name):
+    return os.path.join(MODEL_DIR, name)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def save_artifact(name, payload, metadata=None):
+    """
+    Persist a fitted model as a new artifact version and mark it as the latest.
+
+    The version combines the UTC training time with the first 12 characters of the
+    artifact's SHA-256, so two runs that produce different models never collide.
+
+    Args:
+        name (str): Artifact name, e.g. "isolation_forest".
+        payload (object): Picklable object to store (model, feature list, ...).
+        metadata (dict, optional): Extra fields recorded in the manifest.
+
+    Returns:
+        dict: The manifest written for this version.
+    """
+    directory = _artifact_dir(name)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    joblib.dump(payload, tmp_path)
+    sha256 = _sha256(tmp_path)
+
+    trained_at = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    version = f"{trained_at}-{sha256[:12]}"
+    filename = f"{version}.joblib"
+    os.replace(tmp_path, os.path.join(directory, filename))
+
+    manifest = dict(metadata or {})
+    manifest.update({"name": name, "version": version, "file": filename, "sha256": sha256})
+    _write_json_atomic(os.path.join(directory, f"{version}.json"), manifest)
+    _write_json_atomic(os.path.join(directory, MANIFEST_NAME), manifest)
+    logging.info(f"Saved {name} artifact version {version}")
+    return manifest
+
+
+def read_manifest(name, version=None):
+    """
+    Read the manifest of an artifact version.
+
+    Args:
+        name (str): Artifact name.
+        version (str, optional): Specific version; defaults to the latest.
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        FileNotFoundError: If no such artifact has been trained.
+    """
+    manifest_file = MANIFEST_NAME if version is None else f"{version}.json"
+    path = os.path.join(_artifact_dir(name), manifest_file)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {name} artifact found at {path}. Run `python train_models.py` first.")
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_artifact(name, version=None):
+    """
+    Load an artifact, verifying its content hash. Loaded versions are cached in the registry.
+
+    Args:
+        name (str): Artifact name.
+        version (str, optional): Specific version; defaults to the latest.
+
+    Returns:
+        tuple: (payload, manifest)
+    """
+    manifest = read_manifest(name, version)
+    path = os.path.join(_artifact_dir(name), manifest["file"])
+
+    def loader():
+        sha256 = _sha256(path)
+        if sha256 != manifest["sha256"]:
+            raise ValueError(f"{name} artifact {manifest['version']} failed its content hash check.")
+        payload = joblib.load(path)
+        logging.info(f"Loaded {name} artifact version {manifest['version']}")
+        return payload, manifest
+
+    return registry.get((name, manifest["version"]), [path], loader)
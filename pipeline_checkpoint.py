@@ -0,0 +1,168 @@
+# pipeline_checkpoint.py
+# Per-stage checkpoints for main_pipeline.run_pipeline: input hash, NDJSON output artifact and completion state.
+import os
+import json
+import glob
+import time
+import hashlib
+import logging
+import tempfile
+from json_stream import iter_ndjson
+from state_store import STATE_DIR, read_state, write_state, state_lock, state_path
+
+CHECKPOINT_DIR = os.path.join(STATE_DIR, "pipeline")
+# Completed checkpoints kept per stage; older ones are pruned with their artifacts
+CHECKPOINTS_KEPT = int(os.getenv("PIPELINE_CHECKPOINTS_KEPT", "10"))
+# Serializes pruning with checkpoint reads of concurrent pipeline runs
+CHECKPOINT_LOCK = "pipeline_checkpoints"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_input_hash(stage, upstream_hash, fingerprint=""):
+    """
+    Hash identifying everything a stage consumes.
+
+    Args:
+        stage (str): Stage name.
+        upstream_hash (str): Hash of the data file (first stage) or of the previous stage's output.
+        fingerprint (str): Anything else the stage's result depends on, e.g. model versions.
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    return hashlib.sha256(f"{stage}|{upstream_hash}|{fingerprint}".encode()).hexdigest()
+
+
+def _checkpoint_name(stage, input_hash):
+    return f"pipeline/{stage}-{input_hash[:16]}"
+
+
+def read_checkpoint(stage, input_hash):
+    """
+    Return the completed checkpoint of a stage for this input, if its artifact is still on disk.
+
+    Args:
+        stage (str): Stage name.
+        input_hash (str): Input hash from stage_input_hash.
+
+    Returns:
+        dict | None: The checkpoint, or None if the stage has to run.
+    """
+    with state_lock(CHECKPOINT_LOCK):
+        checkpoint = read_state(_checkpoint_name(stage, input_hash))
+        if not checkpoint or checkpoint.get("input_hash") != input_hash or checkpoint.get("status") != "completed":
+            return None
+        if not os.path.exists(checkpoint["output_file"]):
+            logging.warning(f"Checkpoint artifact for {stage} is missing; the stage will run again.")
+            return None
+        # A checkpoint being resumed from counts as in use by this run, so concurrent runs do not prune it
+        os.utime(checkpoint["output_file"])
+        os.utime(state_path(_checkpoint_name(stage, input_hash)))
+    return checkpoint
+
+
+def write_checkpoint(stage, input_hash, status, output_file=None, output_hash=None, seconds=None, error=None):
+    """
+    Record the outcome of a stage run.
+
+    Args:
+        stage (str): Stage name.
+        input_hash (str): Input hash from stage_input_hash.
+        status (str): "completed" or "failed".
+        output_file (str, optional): NDJSON artifact of the stage's output.
+        output_hash (str, optional): SHA-256 of the artifact.
+        seconds (float, optional): Stage duration.
+        error (str, optional): Failure reason.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    write_state(_checkpoint_name(stage, input_hash), {
+        "stage": stage,
+        "input_hash": input_hash,
+        "status": status,
+        "output_file": output_file,
+        "output_hash": output_hash,
+        "seconds": seconds,
+        "error": error,
+        "finished_at": time.time(),
+    })
+
+
+def save_transactions(transactions, stage, input_hash):
+    """
+    Write a stage's output transactions as an NDJSON artifact, atomically.
+
+    Args:
+        transactions (list): Transactions after the stage.
+        stage (str): Stage name.
+        input_hash (str): Input hash of the stage run.
+
+    Returns:
+        tuple: (artifact path, SHA-256 of its content)
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = os.path.join(CHECKPOINT_DIR, f"{stage}-{input_hash[:16]}.ndjson")
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=CHECKPOINT_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for transaction in transactions:
+                line = (json.dumps(transaction, sort_keys=True, default=str) + "\n").encode()
+                digest.update(line)
+                f.write(line)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path, digest.hexdigest()
+
+
+def load_transactions(path):
+    """
+    Read a stage's NDJSON artifact back into transaction dicts.
+
+    Args:
+        path (str): Artifact path.
+
+    Returns:
+        list: Transactions.
+    """
+    with open(path, "r") as f:
+        return list(iter_ndjson(f))
+
+
+def prune_checkpoints(keep=CHECKPOINTS_KEPT, active_since=None):
+    """
+    Delete all but the newest `keep` checkpoints of each stage, with their artifacts.
+
+    Pipelines running at the same time share CHECKPOINT_DIR, so checkpoints written or
+    resumed from since `active_since` are never deleted, even beyond `keep`.
+
+    Args:
+        keep (int): Checkpoints kept per stage.
+        active_since (float, optional): Start time (epoch seconds) of the oldest pipeline run
+            still in progress.
+    """
+    with state_lock(CHECKPOINT_LOCK):
+        records = {}
+        for path in glob.glob(os.path.join(CHECKPOINT_DIR, "*.json")):
+            stage = os.path.basename(path).rsplit("-", 1)[0]
+            records.setdefault(stage, []).append((os.path.getmtime(path), path))
+        for stage, paths in records.items():
+            for modified, path in sorted(paths, reverse=True)[keep:]:
+                if active_since is not None and modified >= active_since:
+                    continue
+                try:
+                    artifact = os.path.splitext(path)[0] + ".ndjson"
+                    if os.path.exists(artifact):
+                        os.remove(artifact)
+                    os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Failed to prune checkpoint {path}: {e}")
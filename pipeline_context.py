@@ -0,0 +1,86 @@
+# pipeline_context.py
+# In-process state shared between the stages of main_pipeline.run_pipeline.
+import os
+import logging
+from logging.handlers import RotatingFileHandler
+
+LOG_FILE = os.getenv("CLEARSETTLE_LOG_FILE", "logs/app.log")
+
+# Stages of run_pipeline, in execution order
+PIPELINE_STAGES = ["upload", "anomaly_detection", "recommendations", "audit_log"]
+
+
+def configure_logging(log_file=LOG_FILE):
+    """
+    Log to the console and to a rotating log file. Called by entry points, not at import.
+
+    Args:
+        log_file (str): Log file path; its directory is created if needed.
+    """
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.StreamHandler(),  # Log to console
+            RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3)  # Log to file with rotation
+        ]
+    )
+
+
+def report_progress(progress, stage, status, seconds=None, error=None):
+    """
+    Forward a stage event to a run_pipeline progress callback; callback errors never stop the pipeline.
+
+    Args:
+        progress (callable | None): Callback taking (stage, status, seconds, error).
+        stage (str): Stage name from PIPELINE_STAGES.
+        status (str): "running", "completed", "skipped" or "failed".
+        seconds (float, optional): Stage duration.
+        error (str, optional): Failure reason.
+    """
+    if progress is None:
+        return
+    try:
+        progress(stage, status, seconds, error)
+    except Exception as e:
+        logging.warning(f"Progress callback failed for {stage}: {e}")
+
+
+class PipelineContext:
+    """
+    Carries the normalized transactions from stage to stage so each stage does not
+    re-read the whole `settlements` collection from Firestore.
+
+    Stages receive `context.transactions` as input and update the dicts in place
+    (e.g. anomaly flags, recommendations) so later stages see the same state that
+    was written to Firestore.
+    """
+
+    def __init__(self, data_file=None):
+        self.data_file = data_file
+        self.transactions = []
+
+    def add_transactions(self, transactions):
+        """
+        Record transactions accepted by the upload stage.
+
+        Args:
+            transactions (iterable): Normalized, validated transactions.
+        """
+        self.transactions.extend(transactions)
+
+    def discard(self, transaction_ids):
+        """
+        Drop transactions that failed to upload, so later stages only see stored rows.
+
+        Args:
+            transaction_ids (iterable): IDs of transactions to remove.
+        """
+        transaction_ids = set(transaction_ids)
+        if transaction_ids:
+            self.transactions = [t for t in self.transactions if t["transaction_id"] not in transaction_ids]
+            logging.info(f"Dropped {len(transaction_ids)} failed uploads from the pipeline context.")
+
+    def __len__(self):
+        return len(self.transactions)
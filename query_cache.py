@@ -0,0 +1,208 @@
+# query_cache.py
+# Shared TTL + LRU cache for dashboard queries, invalidated by events published at the end of pipeline runs.
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+import pandas as pd
+from state_store import read_state, write_state, state_lock, state_path
+
+INVALIDATION_STATE = "cache_invalidation"
+# Events kept in the invalidation log; readers further behind than this drop their whole cache
+MAX_EVENTS = 200
+# Events with more tags than this invalidate the whole collection instead
+MAX_EVENT_TAGS = 1000
+
+
+def estimate_size(value):
+    """
+    Approximate memory footprint of a cached value in bytes.
+
+    Args:
+        value (object): Cached value.
+
+    Returns:
+        int: Size in bytes.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    Thread-safe cache of query results with a TTL and LRU eviction by memory size.
+
+    Every entry is stored under a per-query key and labelled with (collection, slice) tags
+    such as ("settlements", "status:failed") or ("audit_log", "txn:TXN00001"). Invalidation
+    events published by the pipeline name the slices that changed, so only the affected
+    queries are refetched. A result whose load overlapped an invalidation is returned but
+    not cached, since it may predate the change.
+
+    Args:
+        ttl (float): Seconds an entry stays fresh.
+        max_bytes (int): Total estimated size above which least recently used entries are evicted.
+    """
+
+    def __init__(self, ttl=300, max_bytes=256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, tags, value)
+        self._bytes = 0
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+        self._last_event = read_state(INVALIDATION_STATE, {}).get("sequence", 0)
+        self._events_mtime = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get_or_load(self, key, tags, loader):
+        """
+        Return the cached value for `key`, calling `loader` on a miss or after expiry.
+
+        Args:
+            key (hashable): Per-query cache key.
+            tags (iterable | callable): (collection, slice) tags the result depends on, or a
+                function computing them from the loaded value.
+            loader (callable): Zero-argument function that runs the query.
+
+        Returns:
+            object: The query result.
+        """
+        self.apply_invalidations()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[3]
+            self.stats["misses"] += 1
+            generation = self._generation
+
+        # Load outside the lock so slow queries don't block other sessions
+        value = loader()
+        size = estimate_size(value)
+        tags = frozenset(tags(value) if callable(tags) else tags)
+        with self._lock:
+            if self._generation != generation:
+                # Invalidated while loading: the result may be stale
+                return value
+            self._remove(key)
+            self._entries[key] = (now + self.ttl, size, tags, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+        return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def invalidate(self, collection, tags=None):
+        """
+        Drop entries of a collection, or only those carrying one of the given tags.
+
+        Args:
+            collection (str): Collection name, e.g. "settlements".
+            tags (iterable, optional): Slice names within the collection; None drops the whole collection.
+
+        Returns:
+            int: Number of entries dropped.
+        """
+        with self._lock:
+            return self._invalidate(collection, tags)
+
+    def _invalidate(self, collection, tags):
+        # Caller holds self._lock
+        self._generation += 1
+        if tags is None:
+            stale = [key for key, entry in self._entries.items() if any(tag[0] == collection for tag in entry[2])]
+        else:
+            wanted = {(collection, tag) for tag in tags}
+            stale = [key for key, entry in self._entries.items() if entry[2] & wanted]
+        for key in stale:
+            self._remove(key)
+        self.stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        # Caller holds self._lock
+        self._generation += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def apply_invalidations(self):
+        """
+        Apply invalidation events published since the last check. Cheap when nothing changed.
+
+        Runs under the cache lock, so concurrent sessions sharing the cache apply each event once.
+        """
+        path = state_path(INVALIDATION_STATE)
+        with self._lock:
+            mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+            if mtime == self._events_mtime:
+                return
+            self._events_mtime = mtime
+
+            log = read_state(INVALIDATION_STATE, {"sequence": 0, "events": []})
+            new_events = [event for event in log["events"] if event["sequence"] > self._last_event]
+            oldest = log["events"][0]["sequence"] if log["events"] else log["sequence"] + 1
+            if self._last_event + 1 < oldest and log["sequence"] > self._last_event:
+                # Missed events that were already trimmed from the log
+                self._clear()
+            else:
+                for event in new_events:
+                    self._invalidate(event["collection"], event.get("tags"))
+            self._last_event = log["sequence"]
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), megabytes=self._bytes / (1024 * 1024))
+
+
+def publish_invalidation(collection, tags=None):
+    """
+    Append an invalidation event for the dashboards to pick up.
+
+    Args:
+        collection (str): Collection that changed.
+        tags (iterable, optional): Changed slices (e.g. "status:failed", "txn:TXN00001");
+            None, or more than MAX_EVENT_TAGS of them, invalidates the whole collection.
+    """
+    tags = sorted(set(tags)) if tags is not None else None
+    if tags is not None and len(tags) > MAX_EVENT_TAGS:
+        tags = None
+
+    # Serialize read-modify-write across concurrent pipeline runs
+    with state_lock(INVALIDATION_STATE):
+        log = read_state(INVALIDATION_STATE, {"sequence": 0, "events": []})
+        log["sequence"] += 1
+        log["events"].append({"sequence": log["sequence"], "collection": collection, "tags": tags, "at": time.time()})
+        log["events"] = log["events"][-MAX_EVENTS:]
+        write_state(INVALIDATION_STATE, log)
+    logging.info(f"Published cache invalidation #{log['sequence']} for {collection} ({'all' if tags is None else len(tags)} slices).")
+
+
+def publish_transaction_changes(transaction_ids, statuses):
+    """
+    Publish the invalidation events for settlements written by a pipeline run and their audit history.
+
+    Args:
+        transaction_ids (iterable): IDs of the transactions the run wrote.
+        statuses (iterable): Statuses of those transactions.
+    """
+    transaction_ids = list(transaction_ids)
+    if not transaction_ids:
+        return
+    txn_tags = [f"txn:{txn_id}" for txn_id in transaction_ids]
+    publish_invalidation("settlements", [f"status:{status}" for status in set(statuses)] + txn_tags)
+    publish_invalidation("audit_log", txn_tags)
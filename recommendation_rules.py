@@ -0,0 +1,252 @@
+# recommendation_rules.py
+# Rule engine that compiles recommendation rules into vectorized pandas masks.
+import os
+import json
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from features import settlement_lag_days
+
+OPERATORS = ("eq", "ne", "in", "not_in", "gt", "gte", "lt", "lte", "exists")
+
+# Fields computed from the record rather than read from it
+DERIVED_FIELDS = {
+    "settlement_lag_days": lambda df: pd.Series(settlement_lag_days(df), index=df.index),
+}
+
+
+class _BatchColumns:
+    """
+    Per-batch cache so each field is read, derived and factorized once, however many rules use it.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._columns = {}
+        self._factorized = {}
+
+    def column(self, field):
+        if field not in self._columns:
+            if field in DERIVED_FIELDS:
+                self._columns[field] = DERIVED_FIELDS[field](self.df)
+            elif field in self.df:
+                self._columns[field] = self.df[field]
+            else:
+                self._columns[field] = pd.Series(np.nan, index=self.df.index, dtype=object)
+        return self._columns[field]
+
+    def factorized(self, field):
+        # Equality tests run on the (few) distinct values and are broadcast back through the codes
+        if field not in self._factorized:
+            codes, uniques = pd.factorize(self.column(field))
+            distinct = np.array(list(uniques) + [None], dtype=object)
+            self._factorized[field] = (codes, distinct)
+        return self._factorized[field]
+
+
+def _compile_condition(field, operator, operand):
+    """
+    Compile one condition into a function returning a boolean mask.
+
+    Equality tests are exact, like a dict lookup: strings must match in case and
+    whitespace (upload_settlements already normalizes status, asset_type and
+    counterparty). Missing values never match, except for `exists: false`.
+    """
+    if operator not in OPERATORS:
+        raise ValueError(f"Unknown operator '{operator}' for field '{field}'. Expected one of {OPERATORS}.")
+
+    if operator in ("in", "not_in"):
+        values = list(operand)
+    else:
+        value = operand
+
+    def mask(columns):
+        if operator == "exists":
+            present = columns.column(field).notna().to_numpy()
+            return present if operand else ~present
+
+        if operator in ("gt", "gte", "lt", "lte"):
+            numeric = pd.to_numeric(columns.column(field), errors="coerce").to_numpy(dtype=np.float64)
+            with np.errstate(invalid="ignore"):
+                return {
+                    "gt": numeric > operand, "gte": numeric >= operand,
+                    "lt": numeric < operand, "lte": numeric <= operand,
+                }[operator]
+
+        # codes are -1 for missing values, which index the trailing None and never match
+        codes, distinct = columns.factorized(field)
+        if operator == "eq":
+            hits = np.array([v is not None and v == value for v in distinct], dtype=bool)
+        elif operator == "ne":
+            hits = np.array([v is not None and v != value for v in distinct], dtype=bool)
+        elif operator == "in":
+            hits = np.array([v is not None and v in values for v in distinct], dtype=bool)
+        else:
+            hits = np.array([v is not None and v not in values for v in distinct], dtype=bool)
+        return hits[codes]
+
+    return mask
+
+
+class Rule:
+    """
+    A named recommendation that applies when all of its conditions hold.
+
+    Args:
+        name (str): Rule name, used for hit counters.
+        recommendation (str): Value assigned to matching rows.
+        when (dict): {field: {operator: operand}} conditions, all of which must hold.
+        priority (int): Rules with lower numbers are evaluated first; the first match wins.
+    """
+
+    def __init__(self, name, recommendation, when, priority=100):
+        self.name = name
+        self.recommendation = recommendation
+        self.priority = priority
+        self.conditions = [
+            _compile_condition(field, operator, operand)
+            for field, ops in when.items()
+            for operator, operand in ops.items()
+        ]
+
+    def mask(self, columns):
+        result = np.ones(len(columns.df), dtype=bool)
+        for condition in self.conditions:
+            result &= condition(columns)
+        return result
+
+
+class RuleEngine:
+    """
+    Evaluates prioritized rules over a whole batch of settlements at once.
+
+    Rules are loaded from a JSON (or YAML, if PyYAML is installed) file of the form
+    {"default": "...", "rules": [{"name", "priority", "when", "recommendation"}, ...]}
+    and reloaded automatically when the file changes; an edit that does not parse or
+    compile is logged and skipped, and the last good rules stay in use. Per-rule hit counters accumulate
+    across evaluations. Each evaluation uses one consistent snapshot of the rules, the
+    default and the counters, even if a reload happens while it runs.
+
+    Args:
+        path (str, optional): Rules file. When missing, `fallback` rules are used.
+        fallback (dict, optional): Parsed rules to use when `path` does not exist.
+    """
+
+    def __init__(self, path=None, fallback=None):
+        self.path = path
+        self.fallback = fallback or {"rules": []}
+        self.rules = []
+        self.default = None
+        self.hits = {}
+        self._mtime = None
+        self._loaded = False
+        # Reentrant: reload_if_changed holds it while calling load
+        self._lock = threading.RLock()
+        self.reload_if_changed()
+
+    @staticmethod
+    def from_tag_map(tag_map, default):
+        """
+        Rules equivalent to an exact-match {root_cause_tag: recommendation} dict.
+
+        Args:
+            tag_map (dict): Recommendation per root cause tag.
+            default (str): Recommendation for tags not in the map.
+
+        Returns:
+            dict: Rules document for `load`.
+        """
+        return {
+            "default": default,
+            "rules": [
+                {"name": f"tag:{tag}", "priority": 1000, "when": {"root_cause_tag": {"eq": tag}}, "recommendation": value}
+                for tag, value in tag_map.items()
+            ],
+        }
+
+    def _read(self):
+        with open(self.path, "r") as f:
+            if self.path.endswith((".yaml", ".yml")):
+                import yaml  # Optional dependency, only needed for YAML rule files
+                return yaml.safe_load(f)
+            return json.load(f)
+
+    def load(self, config):
+        """
+        Compile a parsed rules document, replacing the current rules.
+
+        Args:
+            config (dict): Parsed rules document.
+        """
+        rules = [
+            Rule(r["name"], r["recommendation"], r.get("when", {}), r.get("priority", 100))
+            for r in config.get("rules", [])
+        ]
+        # sorted() is stable, so rules with equal priority keep file order
+        rules = sorted(rules, key=lambda rule: rule.priority)
+        hits = {rule.name: 0 for rule in rules}
+        hits["default"] = 0
+        with self._lock:
+            self.rules, self.default, self.hits = rules, config.get("default", "Investigate manually"), hits
+
+    def reload_if_changed(self):
+        """
+        Recompile the rules if the rules file changed since it was last loaded.
+
+        A changed file that fails to parse or compile keeps the previous rules in use; its
+        mtime is remembered so the same broken version is not retried on every call.
+
+        Returns:
+            bool: True if the rules were (re)loaded.
+
+        Raises:
+            Exception: If the very first load fails, since there are no rules to fall back on.
+        """
+        mtime = os.stat(self.path).st_mtime_ns if self.path and os.path.exists(self.path) else None
+        if self._loaded and mtime == self._mtime:
+            return False
+        with self._lock:
+            if self._loaded and mtime == self._mtime:
+                return False
+            try:
+                config = self._read() if mtime is not None else self.fallback
+                self.load(config)
+            except Exception as e:
+                if not self._loaded:
+                    raise
+                self._mtime = mtime
+                logging.error(f"Keeping the previous recommendation rules: {self.path} could not be loaded: {e}")
+                return False
+            self._mtime = mtime
+            self._loaded = True
+            logging.info(f"Loaded {len(self.rules)} recommendation rules from {self.path if mtime else 'built-in defaults'}.")
+            return True
+
+    def evaluate(self, df):
+        """
+        Resolve a recommendation for every row; the first matching rule in priority order wins.
+
+        Args:
+            df (pandas.DataFrame): Settlements.
+
+        Returns:
+            pandas.Series: Recommendation per row.
+        """
+        self.reload_if_changed()
+        if df.empty:
+            return pd.Series([], index=df.index, dtype=object)
+
+        with self._lock:
+            rules, default, hits = self.rules, self.default, self.hits
+
+        columns = _BatchColumns(df)
+        masks = np.vstack([rule.mask(columns) for rule in rules] + [np.ones(len(df), dtype=bool)])
+        winner = masks.argmax(axis=0)
+        choices = np.array([rule.recommendation for rule in rules] + [default], dtype=object)
+
+        counts = np.bincount(winner, minlength=len(choices))
+        with self._lock:
+            for name, count in zip([rule.name for rule in rules] + ["default"], counts):
+                hits[name] += int(count)
+        return pd.Series(choices[winner], index=df.index)
@@ -1,67 +1,251 @@
-import os
 import logging
-import firebase_admin
-from firebase_admin import credentials, firestore
 import hashlib
 import datetime
+from contextlib import contextmanager
+from merkle import merkle_root, merkle_proofs
+from audit_verifier import entry_hash_input, compute_block_hash, HASH_VERSION, GENESIS_BLOCK_HASH
+from state_store import state_lock
+from storage import get_storage
 
-# Firebase Init
-try:
-    if not firebase_admin._apps:
-        cred = credentials.Certificate("/app/clearsettle-ai-firebase-adminsdk-fbsvc-844f7a5e30.json")
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
-except Exception as e:
-    logging.error(f"Failed to initialize Firebase: {e}")
-    exit()
-
-def log_blockchain_activity():
-    try:
-        # Fetch settlement data
-        docs = db.collection('settlements').stream()
-        settlements = [doc.to_dict() for doc in docs]
+ACTOR = "AI Engine"
+# Entries per Merkle block
+AUDIT_BLOCK_SIZE = 1024
+AUDIT_CHAIN_LOCK = "audit_chain"
 
-        if not settlements:
-            logging.warning("No settlements found for blockchain logging.")
-            return
+def hash_entries(entries):
+    """
+    Compute the SHA-256 of every audit entry.
 
-        # Debug: Log the fetched data
-        logging.info(f"Fetched settlements: {len(settlements)} records")
+    Args:
+        entries (list): Audit entries without a "hash" field.
+
+    Returns:
+        list: Hex hash for each entry, in order.
+    """
+    return [hashlib.sha256(entry_hash_input(entry).encode()).hexdigest() for entry in entries]
+
+def audit_document_id(height, index, transaction_id):
+    """
+    Document ID of an audit entry, from its place in the chain and its transaction.
+
+    The run timestamp and block hash are left out on purpose: a retry that rebuilds the
+    same block after a failed header write overwrites the first attempt's entries
+    instead of leaving them behind as duplicates.
+
+    Args:
+        height (int): Block height.
+        index (int): Position of the entry in its block.
+        transaction_id (str): Logged transaction.
+
+    Returns:
+        str: Document ID.
+    """
+    digest = hashlib.sha256(f"{height}|{index}|{transaction_id}".encode()).hexdigest()
+    return f"{height:010d}-{index:05d}-{digest[:16]}"
 
-        previous_hash = "0000"  # Genesis block
-        for settlement in settlements:
-            # Handle missing or mismatched transaction_id
-            txn_id = settlement.get("transaction_id") or settlement.get("TransactionID")
-            if not txn_id:
-                logging.warning(f"Skipping settlement with missing transaction ID: {settlement}")
-                continue
+def get_chain_tip():
+    """
+    Find the newest audit block.
 
-            action = f"Settlement status updated to '{settlement.get('SettlementStatus', 'unknown')}'"
-            timestamp = datetime.datetime.utcnow().isoformat() + "Z"
-            actor = "AI Engine"
+    Appending writers must read the tip through `locked_chain_tip` instead, or two of
+    them can build on the same tip and fork the chain.
 
-            log_entry = {
+    Returns:
+        tuple: (next block height, hash of the newest block or the genesis hash)
+    """
+    tip = get_storage().latest_audit_block()
+    if tip is None:
+        return 0, GENESIS_BLOCK_HASH
+    return tip["height"] + 1, tip["block_hash"]
+
+@contextmanager
+def locked_chain_tip():
+    """
+    Read the chain tip while holding the audit chain lock; append blocks inside the context.
+
+    The lock serializes writers on this host (pipeline jobs run in parallel worker
+    processes), so each one builds on the tip the previous one left. Writers on other
+    hosts must not append to the same chain at the same time.
+
+    Yields:
+        tuple: (next block height, hash of the newest block or the genesis hash)
+    """
+    with state_lock(AUDIT_CHAIN_LOCK):
+        yield get_chain_tip()
+
+def build_audit_blocks(settlements, height, previous_block_hash, timestamp=None, block_size=AUDIT_BLOCK_SIZE):
+    """
+    Build Merkle audit blocks for a batch of settlements in memory.
+
+    Every entry in a block records the previous block's hash and its Merkle path, and
+    each block hash covers the previous block hash and the block's Merkle root, so any
+    rewritten entry or block breaks the chain.
+
+    Args:
+        settlements (list): Settlements to log.
+        height (int): Height of the first new block.
+        previous_block_hash (str): Hash of the current chain tip.
+        timestamp (str, optional): Batch timestamp; defaults to now.
+        block_size (int): Maximum entries per block.
+
+    Returns:
+        tuple: (list of block headers, list of (document ID, entry) pairs)
+    """
+    timestamp = timestamp or datetime.datetime.utcnow().isoformat() + "Z"
+    valid = []
+    for settlement in settlements:
+        # Handle missing or mismatched transaction_id
+        txn_id = settlement.get("transaction_id") or settlement.get("TransactionID")
+        if not txn_id:
+            logging.warning(f"Skipping settlement with missing transaction ID: {settlement}")
+            continue
+        valid.append((txn_id, f"Settlement status updated to '{settlement.get('SettlementStatus', 'unknown')}'"))
+
+    # Block boundaries are known up front, but each block's previous hash is only known
+    # once the block before it is built, so blocks are built in order
+    blocks, documents = [], []
+    for start in range(0, len(valid), block_size):
+        entries = [
+            {
                 "transaction_id": txn_id,
                 "timestamp": timestamp,
                 "action": action,
-                "actor": actor,
-                "previous_hash": previous_hash
+                "actor": ACTOR,
+                "previous_hash": previous_block_hash,
+                "block_height": height,
+                "index": index,
+                "hash_version": HASH_VERSION,
             }
+            for index, (txn_id, action) in enumerate(valid[start:start + block_size])
+        ]
+        hashes = hash_entries(entries)
+        block = {
+            "height": height,
+            "previous_block_hash": previous_block_hash,
+            "merkle_root": merkle_root(hashes),
+            "timestamp": timestamp,
+            "entry_count": len(entries),
+        }
+        block["block_hash"] = compute_block_hash(block)
+
+        # Deterministic document IDs, so retrying a commit overwrites instead of duplicating
+        for entry, entry_hash, proof in zip(entries, hashes, merkle_proofs(hashes)):
+            entry["hash"] = entry_hash
+            entry["block_hash"] = block["block_hash"]
+            entry["merkle_proof"] = proof
+            documents.append((audit_document_id(height, entry["index"], entry["transaction_id"]), entry))
+
+        blocks.append(block)
+        previous_block_hash = block["block_hash"]
+        height += 1
+    return blocks, documents
+
+class AuditChainWriter:
+    """
+    Appends settlements to the audit chain over several batches.
 
-            # Compute hash
-            hash_input = (txn_id + timestamp + action + actor).encode()
-            log_entry["hash"] = hashlib.sha256(hash_input).hexdigest()
+    Settlements that do not fill a whole block are held back until the next batch or
+    `close`, so a run split into chunks produces the same full blocks as one large batch.
+    Every write re-reads the chain tip under the audit chain lock and stores its blocks
+    before releasing it, so concurrent writers append one after another instead of
+    forking the chain. The tip only advances once a block's entries and header are stored.
+
+    Args:
+        block_size (int): Maximum entries per block.
+        timestamp (str, optional): Timestamp shared by every entry of the run; defaults to now.
+    """
+
+    def __init__(self, block_size=AUDIT_BLOCK_SIZE, timestamp=None):
+        self.block_size = block_size
+        self.timestamp = timestamp or datetime.datetime.utcnow().isoformat() + "Z"
+        self.height = None
+        self.previous_block_hash = None
+        self.pending = []
+        self.entries_written = 0
+        self.blocks_written = 0
+
+    def append(self, settlements):
+        """
+        Queue settlements and write every block that is full.
+
+        Args:
+            settlements (iterable): Settlements to log.
+        """
+        self.pending.extend(settlements)
+        full = len(self.pending) - len(self.pending) % self.block_size
+        if full:
+            self._write(self.pending[:full])
+            self.pending = self.pending[full:]
+
+    def close(self):
+        """
+        Write the remaining, partly filled block.
+        """
+        if self.pending:
+            self._write(self.pending)
+            self.pending = []
+
+    def _write(self, settlements):
+        with locked_chain_tip() as (height, previous_block_hash):
+            blocks, documents = build_audit_blocks(settlements, height, previous_block_hash, self.timestamp, self.block_size)
+            if not blocks:
+                return
+
+            storage = get_storage()
+            result = storage.put_audit_entries(documents)
+            if result["failed"]:
+                raise RuntimeError(f"{len(result['failed'])} audit entries failed to write; chain tip not advanced.")
+
+            block_result = storage.put_audit_blocks(blocks)
+            if block_result["failed"]:
+                raise RuntimeError(f"{len(block_result['failed'])} audit block headers failed to write.")
+
+        self.height = blocks[-1]["height"] + 1
+        self.previous_block_hash = blocks[-1]["block_hash"]
+        self.entries_written += result["written"]
+        self.blocks_written += len(blocks)
+
+def log_blockchain_activity(settlements=None):
+    """
+    Append a hash-linked audit entry for every settlement.
+
+    Entries are grouped into Merkle blocks built in memory and committed in chunked batch
+    writes with deterministic document IDs. Block headers are written to `audit_blocks`
+    once every entry of the block is stored, which advances the chain tip.
+
+    Args:
+        settlements (list, optional): Transactions from the pipeline context. When omitted
+            the stage runs on its own and reads the `settlements` collection.
+
+    Raises:
+        Exception: Whatever stopped the run, after logging it, so the pipeline marks the stage failed.
+    """
+    try:
+        # Fetch settlement data only when no pipeline context was passed in
+        if settlements is None:
+            settlements = list(get_storage().stream_settlements())
+
+        if not settlements:
+            logging.warning("No settlements found for blockchain logging.")
+            return
+
+        # Debug: Log the fetched data
+        logging.info(f"Fetched settlements: {len(settlements)} records")
 
-            # Store in Firestore
-            db.collection("audit_log").add(log_entry)
-            previous_hash = log_entry["hash"]
+        writer = AuditChainWriter()
+        writer.append(settlements)
+        writer.close()
 
-        logging.info("Blockchain-style audit log created successfully.")
+        logging.info(
+            f"Blockchain-style audit log created successfully: {writer.entries_written} entries in "
+            f"{writer.blocks_written} blocks, tip {writer.previous_block_hash}."
+        )
     except Exception as e:
         logging.error(f"Error during blockchain logging: {e}")
+        raise
 
-def main():
-    log_blockchain_activity()
+def main(settlements=None):
+    log_blockchain_activity(settlements)
     logging.info("Blockchain logging completed.")
 
 if __name__ == "__main__":
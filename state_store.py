@@ -0,0 +1,93 @@
+# state_store.py
+# Small JSON state files (cursors, checkpoints) written atomically under state/, and locks shared by local processes.
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: byte-range locks through msvcrt instead of flock
+    fcntl = None
+    import msvcrt
+
+STATE_DIR = os.getenv("CLEARSETTLE_STATE_DIR", "state")
+
+
+def state_path(name):
+    return os.path.join(STATE_DIR, f"{name}.json")
+
+
+def read_state(name, default=None):
+    """
+    Read a state file.
+
+    Args:
+        name (str): State name, e.g. "anomaly_cursor".
+        default (object): Returned when the state has never been written.
+
+    Returns:
+        object: The decoded state.
+    """
+    path = state_path(name)
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_state(name, data):
+    """
+    Write a state file atomically: readers see either the old or the new content, never a partial write.
+
+    Args:
+        name (str): State name.
+        data (object): JSON-serializable state.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=STATE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, state_path(name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def state_lock(name):
+    """
+    Hold an exclusive lock shared by every process on this host that uses the same STATE_DIR.
+
+    Backed by a lock file (flock on POSIX, msvcrt.locking on Windows) and released when
+    the block exits or the process dies. It does not coordinate processes on other hosts.
+
+    Args:
+        name (str): Lock name; the lock file is STATE_DIR/<name>.lock.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(os.path.join(STATE_DIR, f"{name}.lock"), "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up with OSError after ten one-second retries; keep waiting
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
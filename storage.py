@@ -0,0 +1,559 @@
+# storage.py
+# Storage backends for settlements and the audit log: Firestore, or an embedded SQLite database for local runs.
+import os
+import json
+import heapq
+import sqlite3
+import datetime
+import logging
+import threading
+import itertools
+import uuid
+from abc import ABC, abstractmethod
+from batch_writer import write_in_batches, chunked, MAX_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT
+
+STORAGE_BACKENDS = ("firestore", "sqlite")
+STORAGE_BACKEND = os.getenv("CLEARSETTLE_STORAGE", "firestore")
+SQLITE_PATH = os.getenv("CLEARSETTLE_SQLITE_PATH", "state/clearsettle.db")
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "/app/clearsettle-ai-firebase-adminsdk-fbsvc-844f7a5e30.json")
+
+
+class StorageBackend(ABC):
+    """
+    Interface every stage uses to read and write settlements and the audit log.
+
+    Write methods take iterables (consumed lazily) and return {"written": int, "failed": [ids]},
+    like batch_writer.write_in_batches. Settlements are returned as dicts that always
+    include "transaction_id"; upserted settlements get an "updated_at" timestamp that
+    drives incremental anomaly detection. A backend missing any method cannot be instantiated.
+    """
+
+    name = "backend"
+
+    @property
+    @abstractmethod
+    def identity(self):
+        """String naming this store; pipeline checkpoints are only reused against the same store."""
+
+    # Settlements
+
+    @abstractmethod
+    def put_settlements(self, transactions, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Create or replace settlements and stamp them with `updated_at`."""
+
+    @abstractmethod
+    def update_settlements(self, updates, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Merge fields into existing settlements; `updates` yields (transaction_id, fields) pairs."""
+
+    @abstractmethod
+    def get_settlement(self, transaction_id):
+        """Return one settlement, or None."""
+
+    @abstractmethod
+    def stream_settlements(self):
+        """Yield every settlement."""
+
+    @abstractmethod
+    def stream_changed_settlements(self, since=None):
+        """Yield settlements with an `updated_at` after `since` (all stamped ones if None), oldest first."""
+
+    @abstractmethod
+    def settlements_page(self, statuses, start_after=None, limit=50):
+        """
+        Return up to `limit` settlements with one of `statuses`, highest anomaly_score first.
+
+        Ties are ordered by transaction_id and settlements without a score come last.
+        `start_after` is the page_cursor() of the last settlement of the previous page.
+        """
+
+    @abstractmethod
+    def count_settlements(self, statuses):
+        """Count settlements with one of `statuses`."""
+
+    # Audit log
+
+    @abstractmethod
+    def put_audit_entries(self, documents, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Store audit entries; `documents` yields (document ID, entry) pairs."""
+
+    @abstractmethod
+    def put_audit_blocks(self, blocks):
+        """Store audit block headers, keyed by their block_hash."""
+
+    @abstractmethod
+    def audit_entries_for_transaction(self, transaction_id):
+        """Return the audit entries of one transaction, ordered by timestamp."""
+
+    @abstractmethod
+    def audit_entries_in_block(self, block_hash):
+        """Yield (document ID, entry) for every entry of a block."""
+
+    @abstractmethod
+    def get_audit_block(self, block_hash):
+        """Return a block header, or None."""
+
+    @abstractmethod
+    def latest_audit_block(self):
+        """Return the block header with the greatest height, or None for an empty chain."""
+
+    @abstractmethod
+    def audit_blocks_after(self, height, limit):
+        """Return up to `limit` block headers above `height`, in height order."""
+
+
+_firestore_client = None
+_firestore_lock = threading.Lock()
+
+
+def page_cursor(settlement):
+    """Keyset cursor for settlements_page: (anomaly_score or None, transaction_id) of a settlement."""
+    return settlement.get("anomaly_score"), settlement["transaction_id"]
+
+
+def _page_order(score, transaction_id):
+    # settlements_page order: highest score first, unscored last, ties by transaction_id
+    return (score is None, 0 if score is None else -score, transaction_id)
+
+
+def firestore_client():
+    """
+    Create the Firestore client on first use.
+
+    Uses the emulator with anonymous credentials when FIRESTORE_EMULATOR_HOST is set,
+    otherwise the service account in FIREBASE_CREDENTIALS (or an already initialized app).
+
+    Returns:
+        google.cloud.firestore.Client: The shared client.
+    """
+    global _firestore_client
+    with _firestore_lock:
+        if _firestore_client is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            if os.getenv("FIRESTORE_EMULATOR_HOST"):
+                os.environ.setdefault("FIRESTORE_PROJECT_ID", "clearsettle-ai")
+                # The emulator accepts anonymous credentials, so no service account is needed
+                _firestore_client = firestore.Client(project=os.environ["FIRESTORE_PROJECT_ID"])
+            else:
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+                _firestore_client = firestore.client()
+            logging.info("Firebase initialized successfully.")
+        return _firestore_client
+
+
+class FirestoreBackend(StorageBackend):
+    """
+    Settlements and audit log in Cloud Firestore (collections `settlements`, `audit_log`, `audit_blocks`).
+
+    Writes go through chunked, retried batch commits. The queries used here are backed
+    by the composite indexes in firestore.indexes.json.
+
+    Args:
+        db (optional): Firestore client; created from the environment on first use if omitted.
+    """
+
+    name = "firestore"
+
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = firestore_client()
+        return self._db
+
+    @property
+    def identity(self):
+        return f"firestore:{self.db.project}"
+
+    @staticmethod
+    def _filter(field, op, value):
+        from firebase_admin import firestore
+        return firestore.FieldFilter(field, op, value)
+
+    def put_settlements(self, transactions, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        from firebase_admin import firestore
+        collection_ref = self.db.collection('settlements')
+        # A null anomaly_score keeps unscored documents in the index settlements_page reads
+        writes = (
+            ("set", collection_ref.document(txn['transaction_id']),
+             {"anomaly_score": None, **txn, "updated_at": firestore.SERVER_TIMESTAMP})
+            for txn in transactions
+        )
+        return write_in_batches(self.db, writes, batch_size=batch_size, max_in_flight=max_in_flight)
+
+    def backfill_anomaly_score(self, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """
+        Give settlements stored before put_settlements wrote `anomaly_score` a null score.
+
+        Documents without the field are not in the index settlements_page reads, so they
+        would never be listed. Reads the whole collection once; run it after upgrading.
+
+        Returns:
+            dict: {"written": int, "failed": [ids]}
+        """
+        writes = (
+            ("update", doc.reference, {"anomaly_score": None})
+            for doc in self.db.collection('settlements').stream()
+            if "anomaly_score" not in doc.to_dict()
+        )
+        return write_in_batches(self.db, writes, batch_size=batch_size, max_in_flight=max_in_flight)
+
+    def update_settlements(self, updates, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        collection_ref = self.db.collection('settlements')
+        writes = (("update", collection_ref.document(transaction_id), fields) for transaction_id, fields in updates)
+        return write_in_batches(self.db, writes, batch_size=batch_size, max_in_flight=max_in_flight)
+
+    def get_settlement(self, transaction_id):
+        doc = self.db.collection('settlements').document(transaction_id).get()
+        return doc.to_dict() | {"transaction_id": doc.id} if doc.exists else None
+
+    def stream_settlements(self):
+        for doc in self.db.collection('settlements').stream():
+            yield doc.to_dict() | {"transaction_id": doc.id}
+
+    def stream_changed_settlements(self, since=None):
+        query = self.db.collection('settlements')
+        if since is not None:
+            query = query.where(filter=self._filter('updated_at', '>', since))
+        for doc in query.order_by('updated_at').stream():
+            yield doc.to_dict() | {"transaction_id": doc.id}
+
+    def _status_query(self, statuses):
+        return (
+            self.db.collection('settlements')
+            .where(filter=self._filter('status', 'in', list(statuses)))
+            .order_by('transaction_id')
+        )
+
+    def settlements_page(self, statuses, start_after=None, limit=50):
+        from firebase_admin import firestore
+        # One range of the (status, anomaly_score DESC, transaction_id) index; unscored documents
+        # hold a null anomaly_score, which sorts after every number
+        query = (
+            self.db.collection('settlements')
+            .where(filter=self._filter('status', 'in', list(statuses)))
+            .order_by('anomaly_score', direction=firestore.Query.DESCENDING)
+            .order_by('transaction_id')
+        )
+        if start_after is not None:
+            score, transaction_id = start_after
+            query = query.start_after({'anomaly_score': score, 'transaction_id': transaction_id})
+        return [doc.to_dict() | {"transaction_id": doc.id} for doc in query.limit(limit).stream()]
+
+    def count_settlements(self, statuses):
+        # Aggregation query: counted on the server without reading the documents
+        return int(self._status_query(statuses).count().get()[0][0].value)
+
+    def put_audit_entries(self, documents, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        audit_ref = self.db.collection("audit_log")
+        writes = (("set", audit_ref.document(doc_id), entry) for doc_id, entry in documents)
+        return write_in_batches(self.db, writes, batch_size=batch_size, max_in_flight=max_in_flight)
+
+    def put_audit_blocks(self, blocks):
+        blocks_ref = self.db.collection("audit_blocks")
+        return write_in_batches(self.db, (("set", blocks_ref.document(block["block_hash"]), block) for block in blocks))
+
+    def audit_entries_for_transaction(self, transaction_id):
+        logs = (
+            self.db.collection('audit_log')
+            .where(filter=self._filter('transaction_id', '==', transaction_id))
+            .order_by('timestamp')
+            .stream()
+        )
+        return [doc.to_dict() for doc in logs]
+
+    def audit_entries_in_block(self, block_hash):
+        for doc in self.db.collection("audit_log").where(filter=self._filter("block_hash", "==", block_hash)).stream():
+            yield doc.id, doc.to_dict()
+
+    def get_audit_block(self, block_hash):
+        doc = self.db.collection("audit_blocks").document(block_hash).get()
+        return doc.to_dict() if doc.exists else None
+
+    def latest_audit_block(self):
+        from firebase_admin import firestore
+        query = self.db.collection("audit_blocks").order_by("height", direction=firestore.Query.DESCENDING).limit(1)
+        docs = list(query.stream())
+        return docs[0].to_dict() if docs else None
+
+    def audit_blocks_after(self, height, limit):
+        query = (
+            self.db.collection("audit_blocks")
+            .where(filter=self._filter("height", ">", height))
+            .order_by("height")
+            .limit(limit)
+        )
+        return [doc.to_dict() for doc in query.stream()]
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settlements (
+    transaction_id TEXT PRIMARY KEY,
+    status TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS settlements_status ON settlements (status, transaction_id);
+CREATE INDEX IF NOT EXISTS settlements_score ON settlements (status, json_extract(data, '$.anomaly_score') DESC, transaction_id);
+CREATE INDEX IF NOT EXISTS settlements_updated_at ON settlements (updated_at);
+CREATE TABLE IF NOT EXISTS audit_log (
+    doc_id TEXT PRIMARY KEY,
+    transaction_id TEXT NOT NULL,
+    block_hash TEXT,
+    timestamp TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_log_transaction ON audit_log (transaction_id, timestamp);
+CREATE INDEX IF NOT EXISTS audit_log_block ON audit_log (block_hash);
+CREATE TABLE IF NOT EXISTS audit_blocks (
+    block_hash TEXT PRIMARY KEY,
+    height INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_blocks_height ON audit_blocks (height);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+# Must match the settlements_score index expression for SQLite to use it
+SQLITE_SCORE = "json_extract(data, '$.anomaly_score')"
+# Rows per INSERT/UPDATE transaction
+SQLITE_CHUNK_SIZE = 5000
+
+
+def _timestamp(value):
+    # Fixed-width UTC text, so string order in SQLite is time order
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _dumps(data):
+    return json.dumps(data, default=str)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Settlements and audit log in an embedded SQLite database in WAL mode.
+
+    Documents are stored as JSON next to indexed columns for transaction_id, status,
+    updated_at, block_hash and timestamp, and writes are committed in large transactions,
+    which makes bulk backfills, benchmarks and tests far faster than per-document RPCs.
+    Each thread gets its own connection; WAL lets readers run alongside the single writer.
+
+    Args:
+        path (str): Database file, created if missing.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+            # Random ID of this database file, so a wiped and recreated database is a different store
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+            self.store_id = conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()[0]
+
+    @property
+    def identity(self):
+        return f"sqlite:{os.path.abspath(self.path)}:{self.store_id}"
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _rows(self, sql, params=()):
+        return self._conn().execute(sql, params)
+
+    @staticmethod
+    def _settlement(row):
+        transaction_id, updated_at, data = row
+        settlement = json.loads(data)
+        settlement["transaction_id"] = transaction_id
+        if updated_at is not None:
+            settlement["updated_at"] = datetime.datetime.fromisoformat(updated_at)
+        return settlement
+
+    def put_settlements(self, transactions, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        written = 0
+        conn = self._conn()
+        for chunk in chunked(transactions, SQLITE_CHUNK_SIZE):
+            updated_at = _timestamp(datetime.datetime.now(datetime.timezone.utc))
+            rows = [
+                (txn["transaction_id"], txn.get("status"), updated_at,
+                 _dumps({key: value for key, value in txn.items() if key != "updated_at"}))
+                for txn in chunk
+            ]
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO settlements VALUES (?, ?, ?, ?)", rows)
+            written += len(rows)
+        return {"written": written, "failed": []}
+
+    def update_settlements(self, updates, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        written, failed = 0, []
+        conn = self._conn()
+        for chunk in chunked(updates, MAX_BATCH_SIZE):
+            fields_by_id = dict(chunk)
+            placeholders = ",".join("?" * len(fields_by_id))
+            with conn:
+                stored = dict(conn.execute(
+                    f"SELECT transaction_id, data FROM settlements WHERE transaction_id IN ({placeholders})",
+                    list(fields_by_id),
+                ))
+                rows = []
+                for transaction_id, fields in fields_by_id.items():
+                    if transaction_id not in stored:
+                        # Same as Firestore: updating a missing document fails
+                        failed.append(transaction_id)
+                        continue
+                    data = json.loads(stored[transaction_id])
+                    data.update(fields)
+                    rows.append((data.get("status"), _dumps(data), transaction_id))
+                conn.executemany("UPDATE settlements SET status = ?, data = ? WHERE transaction_id = ?", rows)
+            written += len(rows)
+        return {"written": written, "failed": failed}
+
+    def get_settlement(self, transaction_id):
+        row = self._rows("SELECT transaction_id, updated_at, data FROM settlements WHERE transaction_id = ?", (transaction_id,)).fetchone()
+        return self._settlement(row) if row else None
+
+    def stream_settlements(self):
+        for row in self._rows("SELECT transaction_id, updated_at, data FROM settlements"):
+            yield self._settlement(row)
+
+    def stream_changed_settlements(self, since=None):
+        if since is None:
+            rows = self._rows("SELECT transaction_id, updated_at, data FROM settlements WHERE updated_at IS NOT NULL ORDER BY updated_at")
+        else:
+            rows = self._rows(
+                "SELECT transaction_id, updated_at, data FROM settlements WHERE updated_at > ? ORDER BY updated_at",
+                (_timestamp(since),),
+            )
+        for row in rows:
+            yield self._settlement(row)
+
+    def settlements_page(self, statuses, start_after=None, limit=50):
+        # One settlements_score index range per status, merged in page order
+        sql = f"SELECT transaction_id, updated_at, data, {SQLITE_SCORE} FROM settlements WHERE status = ?"
+        params = []
+        if start_after is not None:
+            score, transaction_id = start_after
+            if score is None:
+                sql += f" AND {SQLITE_SCORE} IS NULL AND transaction_id > ?"
+                params = [transaction_id]
+            else:
+                sql += (
+                    f" AND ({SQLITE_SCORE} < ? OR ({SQLITE_SCORE} = ? AND transaction_id > ?)"
+                    f" OR {SQLITE_SCORE} IS NULL)"
+                )
+                params = [score, score, transaction_id]
+        sql += f" ORDER BY {SQLITE_SCORE} DESC, transaction_id LIMIT ?"
+        pages = [self._rows(sql, [status] + params + [limit]).fetchall() for status in dict.fromkeys(statuses)]
+        rows = heapq.merge(*pages, key=lambda row: _page_order(row[3], row[0]))
+        return [self._settlement(row[:3]) for row in itertools.islice(rows, limit)]
+
+    def count_settlements(self, statuses):
+        statuses = list(statuses)
+        placeholders = ",".join("?" * len(statuses))
+        return self._rows(f"SELECT COUNT(*) FROM settlements WHERE status IN ({placeholders})", statuses).fetchone()[0]
+
+    def put_audit_entries(self, documents, batch_size=MAX_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        written = 0
+        conn = self._conn()
+        for chunk in chunked(documents, SQLITE_CHUNK_SIZE):
+            rows = [
+                (doc_id, entry["transaction_id"], entry.get("block_hash"), entry["timestamp"], _dumps(entry))
+                for doc_id, entry in chunk
+            ]
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO audit_log VALUES (?, ?, ?, ?, ?)", rows)
+            written += len(rows)
+        return {"written": written, "failed": []}
+
+    def put_audit_blocks(self, blocks):
+        rows = [(block["block_hash"], block["height"], _dumps(block)) for block in blocks]
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO audit_blocks VALUES (?, ?, ?)", rows)
+        return {"written": len(rows), "failed": []}
+
+    def audit_entries_for_transaction(self, transaction_id):
+        rows = self._rows("SELECT data FROM audit_log WHERE transaction_id = ? ORDER BY timestamp", (transaction_id,))
+        return [json.loads(data) for (data,) in rows]
+
+    def audit_entries_in_block(self, block_hash):
+        for doc_id, data in self._rows("SELECT doc_id, data FROM audit_log WHERE block_hash = ?", (block_hash,)):
+            yield doc_id, json.loads(data)
+
+    def get_audit_block(self, block_hash):
+        row = self._rows("SELECT data FROM audit_blocks WHERE block_hash = ?", (block_hash,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest_audit_block(self):
+        row = self._rows("SELECT data FROM audit_blocks ORDER BY height DESC LIMIT 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def audit_blocks_after(self, height, limit):
+        rows = self._rows("SELECT data FROM audit_blocks WHERE height > ? ORDER BY height LIMIT ?", (height, limit))
+        return [json.loads(data) for (data,) in rows]
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend=None, **kwargs):
+    """
+    Build a storage backend by name.
+
+    Args:
+        backend (str, optional): "firestore" or "sqlite"; defaults to CLEARSETTLE_STORAGE.
+        **kwargs: Passed to the backend (e.g. `path` for SQLite, `db` for Firestore).
+
+    Returns:
+        StorageBackend: The backend.
+    """
+    backend = backend or STORAGE_BACKEND
+    if backend == "firestore":
+        return FirestoreBackend(**kwargs)
+    if backend == "sqlite":
+        return SQLiteBackend(**kwargs)
+    raise ValueError(f"Unknown storage backend '{backend}'. Expected one of {STORAGE_BACKENDS}.")
+
+
+def get_storage():
+    """
+    The process-wide storage backend selected by CLEARSETTLE_STORAGE, created on first use.
+
+    Returns:
+        StorageBackend: The shared backend.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+            logging.info(f"Using {_storage.name} storage.")
+        return _storage
+
+
+def set_storage(storage):
+    """
+    Replace the process-wide backend, e.g. with a SQLite database in tests.
+
+    Args:
+        storage (StorageBackend): Backend to use from now on.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
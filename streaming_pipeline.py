@@ -0,0 +1,262 @@
+# streaming_pipeline.py
+# Streaming mode of the pipeline: stages run concurrently on chunks of transactions, connected by bounded queues.
+import os
+import time
+import queue
+import logging
+import threading
+from json_stream import iter_transactions
+from batch_writer import chunked
+from upload_settlements import upload_transactions
+from anomaly_detection import ChunkScorer
+from generate_recommendations import generate_recommendations
+from simulate_blockchain_log import AuditChainWriter
+from pipeline_context import PIPELINE_STAGES, report_progress
+from query_cache import publish_transaction_changes
+
+STREAM_CHUNK_SIZE = int(os.getenv("PIPELINE_STREAM_CHUNK_SIZE", "5000"))
+# Chunks buffered between two stages; a full queue blocks the stage upstream of it
+STREAM_QUEUE_SIZE = int(os.getenv("PIPELINE_STREAM_QUEUE_SIZE", "4"))
+# How often blocked stages check whether another stage failed
+_POLL_SECONDS = 0.1
+_END = object()
+
+
+class StageMetrics:
+    """
+    Throughput and queueing statistics of one streaming stage.
+
+    Attributes:
+        chunks (int): Chunks processed.
+        rows (int): Transactions processed.
+        busy_seconds (float): Time spent processing chunks.
+        starved_seconds (float): Time spent waiting for the upstream stage.
+        blocked_seconds (float): Time spent waiting for room in the downstream queue (backpressure).
+        max_queue_depth (int): Deepest the stage's input queue got.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.chunks = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def sample_depth(self, depth):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    def to_dict(self):
+        return {
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "starved_seconds": round(self.starved_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_queue_depth": round(self._depth_total / self._depth_samples, 2) if self._depth_samples else 0.0,
+        }
+
+
+class StreamingPipeline:
+    """
+    Runs upload, detection, recommendations and audit logging as concurrent workers.
+
+    The upload worker reads the file in chunks; every chunk it stores is handed to the
+    detection worker through a bounded queue, and so on down the line. Detection of chunk
+    k therefore overlaps with the upload of chunk k+1, while the queue bound keeps at most
+    `queue_size` chunks in memory between any two stages. If any stage fails, every
+    worker stops after its current chunk.
+
+    Unlike the batch mode, streaming runs do not write stage checkpoints.
+
+    Args:
+        data_file (str): Settlement transactions file.
+        chunk_size (int): Transactions per chunk.
+        queue_size (int): Maximum chunks waiting between two stages.
+        progress (callable, optional): run_pipeline-style progress callback.
+        scorer (ChunkScorer, optional): Scorer for the anomaly stage; defaults to one running
+            the registered detectors.
+    """
+
+    def __init__(self, data_file, chunk_size=STREAM_CHUNK_SIZE, queue_size=STREAM_QUEUE_SIZE, progress=None,
+                 scorer=None):
+        self.data_file = data_file
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.progress = progress
+        self.scorer = scorer
+        self.metrics = {stage: StageMetrics(stage) for stage in PIPELINE_STAGES}
+        self.errors = {}
+        self._stop = threading.Event()
+        self._uploaded_ids = []
+        self._uploaded_statuses = set()
+
+    # Stage bodies: each takes a chunk and returns the chunk to pass downstream
+
+    def _upload_chunks(self):
+        seen_ids = set()
+        for chunk in chunked(iter_transactions(self.data_file), self.chunk_size):
+            accepted = []
+            summary = upload_transactions(chunk, accepted=accepted, seen_ids=seen_ids)
+            failed = set(summary["failed_ids"])
+            stored = [txn for txn in accepted if txn["transaction_id"] not in failed]
+            self._uploaded_ids.extend(txn["transaction_id"] for txn in stored)
+            self._uploaded_statuses.update(txn.get("status") for txn in stored)
+            if failed:
+                # Same as the batch upload stage: failed writes fail the run
+                raise RuntimeError(f"{len(failed)} transactions could not be stored")
+            yield len(chunk), stored
+
+    def _put(self, q, item, metrics):
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        metrics.blocked_seconds += time.perf_counter() - started
+
+    def _get(self, q, metrics):
+        started = time.perf_counter()
+        metrics.sample_depth(q.qsize())
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _END
+        metrics.starved_seconds += time.perf_counter() - started
+        return item
+
+    def _run_upload(self, outbound):
+        metrics = self.metrics["upload"]
+        chunks = self._upload_chunks()
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                read, stored = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                metrics.busy_seconds += time.perf_counter() - started
+            metrics.chunks += 1
+            metrics.rows += read
+            if stored:
+                self._put(outbound, stored, metrics)
+
+    def _run_consumer(self, stage, process, inbound, outbound, finish=None):
+        metrics = self.metrics[stage]
+        while True:
+            chunk = self._get(inbound, metrics)
+            if chunk is _END:
+                break
+            started = time.perf_counter()
+            process(chunk)
+            metrics.busy_seconds += time.perf_counter() - started
+            metrics.chunks += 1
+            metrics.rows += len(chunk)
+            if outbound is not None:
+                self._put(outbound, chunk, metrics)
+        if finish is not None and not self._stop.is_set():
+            started = time.perf_counter()
+            finish()
+            metrics.busy_seconds += time.perf_counter() - started
+
+    def _worker(self, stage, target, outbound, *args):
+        report_progress(self.progress, stage, "running")
+        started = time.perf_counter()
+        try:
+            target(*args)
+        except Exception as e:
+            logging.error(f"Streaming stage {stage} failed: {e}")
+            self.errors[stage] = str(e)
+            self._stop.set()
+            report_progress(self.progress, stage, "failed", time.perf_counter() - started, str(e))
+            return
+        finally:
+            # Tell the next stage there is nothing more to come
+            if outbound is not None and not self._stop.is_set():
+                self._put(outbound, _END, self.metrics[stage])
+        if self._stop.is_set():
+            report_progress(self.progress, stage, "failed", time.perf_counter() - started, "stopped after another stage failed")
+        else:
+            report_progress(self.progress, stage, "completed", time.perf_counter() - started)
+
+    def run(self):
+        """
+        Run all stages to completion.
+
+        Returns:
+            dict: {"ok", "seconds", "errors", "stages": per-stage metrics}
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in PIPELINE_STAGES[1:]]
+        scorer = self.scorer or ChunkScorer()
+        writer = AuditChainWriter()
+        workers = [
+            threading.Thread(target=self._worker, args=("upload", self._run_upload, queues[0], queues[0])),
+            threading.Thread(target=self._worker, args=(
+                "anomaly_detection", self._run_consumer, queues[1],
+                "anomaly_detection", scorer.score, queues[0], queues[1], scorer.close)),
+            threading.Thread(target=self._worker, args=(
+                "recommendations", self._run_consumer, queues[2],
+                "recommendations", generate_recommendations, queues[1], queues[2])),
+            threading.Thread(target=self._worker, args=(
+                "audit_log", self._run_consumer, None,
+                "audit_log", writer.append, queues[2], None, writer.close)),
+        ]
+
+        logging.info(f"🚀 Starting streaming pipeline (chunks of {self.chunk_size}, queues of {self.queue_size})...")
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        if self.errors:
+            scorer.abort()
+
+        try:
+            publish_transaction_changes(self._uploaded_ids, self._uploaded_statuses)
+        except Exception as e:
+            logging.warning(f"Failed to publish cache invalidation: {e}")
+
+        report = {
+            "ok": not self.errors,
+            "seconds": elapsed,
+            "errors": dict(self.errors),
+            "stages": {stage: metrics.to_dict() for stage, metrics in self.metrics.items()},
+        }
+        for stage, stats in report["stages"].items():
+            logging.info(
+                f"{stage}: {stats['rows']} rows in {stats['chunks']} chunks, busy {stats['busy_seconds']}s, "
+                f"starved {stats['starved_seconds']}s, blocked {stats['blocked_seconds']}s, "
+                f"input queue depth max {stats['max_queue_depth']} / mean {stats['mean_queue_depth']}"
+            )
+        if report["ok"]:
+            logging.info(f"🏁 Streaming pipeline completed in {elapsed:.2f}s ({writer.entries_written} audit entries).\n")
+        return report
+
+
+def run_streaming_pipeline(data_file, chunk_size=STREAM_CHUNK_SIZE, queue_size=STREAM_QUEUE_SIZE, progress=None):
+    """
+    Run the pipeline in streaming mode.
+
+    Args:
+        data_file (str): Settlement transactions file.
+        chunk_size (int): Transactions per chunk.
+        queue_size (int): Maximum chunks waiting between two stages.
+        progress (callable, optional): run_pipeline-style progress callback.
+
+    Returns:
+        dict: Run report with per-stage metrics.
+    """
+    return StreamingPipeline(data_file, chunk_size, queue_size, progress).run()
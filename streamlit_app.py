@@ -2,7 +2,8 @@ import streamlit as st
 import logging
 import firebase_admin
 from firebase_admin import credentials, firestore
-from main_pipeline import run_pipeline
+from job_runner import JobRunner
+from pipeline_context import PIPELINE_STAGES
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -35,20 +36,53 @@ try:
 except Exception as e:
     st.error(f"❌ Failed to load secrets: {e}")
 
+@st.cache_resource
+def get_job_runner():
+    # One worker pool per server process, shared by every session and kept across reruns
+    return JobRunner(firebase_credentials=dict(firebase_credentials))
+
+job_runner = get_job_runner()
+
 # File uploader for settlement transactions
-uploaded_file = st.file_uploader("Upload Settlement Transactions JSON File", type=["json"])
+uploaded_file = st.file_uploader("Upload Settlement Transactions File", type=["json", "ndjson", "parquet", "arrow", "feather"])
+resume = st.checkbox("Skip stages already completed for this file", value=False)
 
 if st.button("Run Pipeline"):
     if uploaded_file:
-        # Save uploaded file temporarily
-        with open("uploaded_transactions.json", "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        st.info("📤 Starting the pipeline...")
-        try:
-            run_pipeline(data_file="uploaded_transactions.json")
-            st.success("🏁 Pipeline completed successfully!")
-        except Exception as e:
-            st.error(f"❌ An error occurred: {e}")
+        # Runs in a background worker; this session stays responsive and the job survives reruns
+        job_id = job_runner.submit(uploaded_file.name, uploaded_file.getvalue(), resume=resume)
+        st.session_state.setdefault("my_jobs", []).append(job_id)
+        st.info(f"📤 Pipeline job `{job_id}` queued.")
     else:
-        st.warning("⚠️ Please upload a JSON file to proceed.")
+        st.warning("⚠️ Please upload a settlement file to proceed.")
+
+STATUS_ICONS = {"queued": "⏳", "running": "🔄", "succeeded": "🏁", "failed": "❌", "interrupted": "⚠️"}
+
+# Refreshes on its own, without rerunning the rest of the page
+@st.fragment(run_every=2)
+def show_jobs():
+    st.subheader("Pipeline Jobs")
+    jobs = job_runner.jobs()
+    if not jobs:
+        st.caption("No pipeline jobs yet.")
+        return
+
+    my_jobs = st.session_state.get("my_jobs", [])
+    for job in jobs:
+        stages = job["stages"]
+        completed = sum(stages.get(stage, {}).get("status") in ("completed", "skipped") for stage in PIPELINE_STAGES)
+        label = f"{STATUS_ICONS.get(job['status'], '')} {job['filename']} – {job['status']} (job {job['job_id']})"
+        with st.expander(label, expanded=job["job_id"] in my_jobs and job["status"] in ("queued", "running")):
+            st.progress(completed / len(PIPELINE_STAGES), text=f"{completed}/{len(PIPELINE_STAGES)} stages")
+            st.table([
+                {
+                    "stage": stage,
+                    "status": stages.get(stage, {}).get("status", "pending"),
+                    "seconds": round(stages[stage]["seconds"], 2) if stages.get(stage, {}).get("seconds") is not None else None,
+                }
+                for stage in PIPELINE_STAGES
+            ])
+            if job["error"]:
+                st.error(f"❌ {job['error']}")
+
+show_jobs()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import model_store
+from anomaly_detection import run_detectors, detect_anomalies
+from columnar import ParquetExport
+from detector_runner import Detector, DetectorRunner
+from storage import SQLiteBackend, set_storage
+
+
+class SignDetector(Detector):
+    name = "Sign"
+    score_field = "sign_score"
+
+    def score(self, X):
+        return X[:, 0] > 0, X[:, 0]
+
+
+class BrokenDetector(Detector):
+    name = "Broken"
+    score_field = "broken_score"
+
+    def score(self, X):
+        raise RuntimeError("no artifact")
+
+
+class TestRunDetectors(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = SQLiteBackend(os.path.join(self.tmp, "clearsettle.db"))
+        set_storage(self.storage)
+        self.transactions = [{"transaction_id": f"T{i}", "status": "failed", "ISIN": "US1234567890"} for i in range(3)]
+        self.storage.put_settlements(self.transactions)
+        self.X = np.array([[1.0], [-1.0], [2.0]], dtype=np.float32)
+
+    def tearDown(self):
+        set_storage(None)
+        shutil.rmtree(self.tmp)
+
+    def run_with(self, *detectors):
+        export = ParquetExport(os.path.join(self.tmp, "anomalies.parquet"))
+        try:
+            return run_detectors(self.transactions, self.X, DetectorRunner(detectors), export=export)
+        finally:
+            export.close()
+
+    def test_flags_are_stored(self):
+        result = self.run_with(SignDetector())
+        self.assertEqual(result.flags.tolist(), [True, False, True])
+        self.assertTrue(self.storage.get_settlement("T2")["anomaly_detected"])
+        self.assertNotIn("anomaly_detected", self.storage.get_settlement("T1"))
+
+    def test_failed_detector_fails_the_batch(self):
+        with self.assertLogs(level="ERROR"), self.assertRaisesRegex(RuntimeError, "detector Broken failed"):
+            self.run_with(SignDetector(), BrokenDetector())
+        # The working detector's verdicts are still stored
+        self.assertTrue(self.storage.get_settlement("T0")["anomaly_detected"])
+
+
+    def test_missing_model_fails_detection(self):
+        self.addCleanup(setattr, model_store, "MODEL_DIR", model_store.MODEL_DIR)
+        model_store.MODEL_DIR = os.path.join(self.tmp, "models")
+        with self.assertLogs(level="ERROR"), self.assertRaises(FileNotFoundError):
+            detect_anomalies(self.transactions, block_size=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import datetime
+import os
+import tempfile
+import unittest
+import pyarrow as pa
+import pyarrow.parquet as pq
+from columnar import SettlementBatch, ParquetExport
+from json_stream import iter_transactions
+
+
+class TestColumnar(unittest.TestCase):
+    def test_batch_from_records(self):
+        records = [
+            {"transaction_id": "1", "settlement_venue": "DTCC", "asset_type": "ETF"},
+            {"transaction_id": "2", "settlement_venue": "DTCC", "counterparty_1": "Broker X", "amount": 5},
+        ]
+        batch = SettlementBatch.from_records(records)
+
+        self.assertEqual(batch.columns, ["transaction_id", "settlement_venue", "asset_type", "counterparty_1", "amount"])
+        self.assertTrue(pa.types.is_dictionary(batch.table["settlement_venue"].type))
+        self.assertEqual(str(batch.to_pandas()["settlement_venue"].dtype), "category")
+        self.assertEqual(batch.to_records(), records)
+        self.assertEqual(batch.take([False, True]).to_records(), records[1:])
+
+    def test_export_conforms_later_batches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "anomalies.parquet")
+            export = ParquetExport(path)
+            export.write(SettlementBatch.from_records([{"transaction_id": "1", "asset_type": "ETF", "score": 0.5}]))
+            export.write(SettlementBatch.from_records([{"transaction_id": "2", "score": 1, "extra": "x"}]))
+            self.assertFalse(os.path.exists(path))  # Published only on close
+            self.assertEqual(export.close(), 2)
+
+            batch = SettlementBatch.read_parquet(path, columns=["transaction_id", "score"])
+            self.assertEqual(batch.table.to_pylist(), [{"transaction_id": "1", "score": 0.5}, {"transaction_id": "2", "score": 1.0}])
+            self.assertEqual(os.listdir(tmp), ["anomalies.parquet"])
+
+    def test_iter_transactions_reads_columnar_files(self):
+        table = pa.table({
+            "transaction_id": ["1", "2"],
+            "trade_date": pa.array([datetime.date(2025, 4, 29), None], type=pa.date32()),
+            "asset_type": pa.array(["ETF", "Bond"]).dictionary_encode(),
+        })
+        expected = [
+            {"transaction_id": "1", "trade_date": "2025-04-29", "asset_type": "ETF"},
+            {"transaction_id": "2", "asset_type": "Bond"},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            parquet_path = os.path.join(tmp, "settlements.parquet")
+            pq.write_table(table, parquet_path)
+            arrow_path = os.path.join(tmp, "settlements.arrow")
+            with pa.OSFile(arrow_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            stream_path = os.path.join(tmp, "settlements.arrows")
+            with pa.OSFile(stream_path, "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+
+            for path in (parquet_path, arrow_path, stream_path):
+                self.assertEqual(list(iter_transactions(path)), expected, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
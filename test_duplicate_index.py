@@ -0,0 +1,103 @@
+import os
+import json
+import sqlite3
+import tempfile
+import unittest
+import multiprocessing
+from duplicate_index import DuplicateIndex, bloom_parameters
+from storage import SQLiteBackend, set_storage
+
+
+def _claim_range(args):
+    # Worker for the multi-process test: return the IDs this process got as new
+    directory, start, stop = args
+    ids = [f"T{i}" for i in range(start, stop)]
+    known = DuplicateIndex(directory, capacity=1000).claim(ids)
+    return [i for i in ids if i not in known]
+
+
+class TestDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = self.tmp.name
+
+    def test_claims_persist_across_instances(self):
+        index = DuplicateIndex(self.directory, capacity=1000)
+        self.assertEqual(index.claim(["A", "B", "B"]), set())
+        self.assertEqual(index.claim(["B", "C"]), {"B"})
+
+        reopened = DuplicateIndex(self.directory, capacity=1000)
+        self.assertEqual(len(reopened), 3)
+        self.assertIn("A", reopened)
+        self.assertNotIn("D", reopened)
+        self.assertEqual(reopened.contains_many(["A", "D"]), {"A"})
+
+    def test_release_allows_retry(self):
+        index = DuplicateIndex(self.directory, capacity=1000)
+        index.claim(["A", "B"])
+        index.release(["A"])
+        self.assertNotIn("A", index)
+        self.assertEqual(index.claim(["A", "B"]), {"B"})
+
+    def test_stale_filter_falls_back_to_table(self):
+        index = DuplicateIndex(self.directory, capacity=1000)
+        # IDs written behind the filter's back, e.g. by an older release
+        with sqlite3.connect(index.db_path) as conn:
+            conn.execute("INSERT INTO ids VALUES ('A', 0)")
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(index.claim(["A", "B"]), {"A"})
+        self.assertEqual(len(index), 2)
+
+        stats = index.rebuild(capacity=5000)
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["capacity"], 5000)
+        self.assertIn("A", index)
+        self.assertEqual(stats["bloom_bits"], bloom_parameters(5000, 0.001)[0])
+
+    def test_lookups_follow_a_rebuild_by_another_instance(self):
+        index = DuplicateIndex(self.directory, capacity=1000)
+        index.claim(["A"])
+        # e.g. `python duplicate_index.py rebuild` from storage while the app keeps its index open
+        DuplicateIndex(self.directory, capacity=1000).rebuild(transaction_ids=["A", "B"])
+        self.assertIn("B", index)
+        self.assertEqual(index.contains_many(["A", "B", "C"]), {"A", "B"})
+
+    def test_parallel_workers_claim_each_id_once(self):
+        ranges = [(self.directory, start, start + 300) for start in (0, 100, 200, 300)]
+        with multiprocessing.get_context("spawn").Pool(len(ranges)) as pool:
+            claimed = [i for new in pool.map(_claim_range, ranges) for i in new]
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(set(claimed), {f"T{i}" for i in range(600)})
+
+    def test_rerun_upload_rejects_uploaded_ids(self):
+        from upload_settlements import upload_transactions
+        set_storage(SQLiteBackend(os.path.join(self.directory, "clearsettle.db")))
+        self.addCleanup(set_storage, None)
+        index = DuplicateIndex(os.path.join(self.directory, "index"), capacity=1000)
+        transactions = [{"transaction_id": f"T{i}", "status": "settled", "ISIN": "US1234567890"} for i in range(10)]
+
+        self.assertEqual(upload_transactions(transactions, duplicate_index=index)["accepted"], 10)
+        summary = upload_transactions(transactions[5:] + [dict(transactions[0], transaction_id="T10")], duplicate_index=index)
+        self.assertEqual((summary["accepted"], summary["rejected"]), (1, 5))
+        self.assertEqual(summary["rejections"]["reasons"]["already uploaded"], {"count": 5, "samples": ["T5", "T6", "T7", "T8", "T9"]})
+
+    def test_failed_upload_releases_claims(self):
+        from json_stream import iter_transactions
+        from upload_settlements import upload_transactions
+        set_storage(SQLiteBackend(os.path.join(self.directory, "clearsettle.db")))
+        self.addCleanup(set_storage, None)
+        index = DuplicateIndex(os.path.join(self.directory, "index"), capacity=1000)
+        transactions = [{"transaction_id": f"T{i}", "status": "settled", "ISIN": "US1234567890"} for i in range(10)]
+        path = os.path.join(self.directory, "settlements.json")
+        with open(path, "w") as f:
+            f.write(json.dumps(transactions)[:-40])  # Truncated upload
+
+        with self.assertRaises(ValueError):
+            upload_transactions(iter_transactions(path), batch_size=4, duplicate_index=index)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(upload_transactions(transactions, duplicate_index=index)["accepted"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import state_store
+import pipeline_checkpoint
+from job_runner import JobRunner, connect, oldest_running_start
+from pipeline_checkpoint import save_transactions, write_checkpoint, read_checkpoint, prune_checkpoints
+
+
+class TestJobRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "state", "jobs.db")
+        self.upload_dir = os.path.join(self.tmp.name, "uploads")
+
+    def add_job(self, job_id, status, started_at=None):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        data_file = os.path.join(self.upload_dir, f"{job_id}.json")
+        with open(data_file, "w") as f:
+            json.dump([], f)
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, filename, data_file, status, submitted_at, started_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, "settlements.json", data_file, status, time.time(), started_at),
+            )
+        return data_file
+
+    def job(self, runner, job_id):
+        return next(job for job in runner.jobs() if job["job_id"] == job_id)
+
+    def test_submitted_job_records_its_stages(self):
+        # Worker processes are spawned, so they are pointed at the temporary directories through the environment
+        for name, value in [
+            ("CLEARSETTLE_STATE_DIR", os.path.join(self.tmp.name, "state")),
+            ("CLEARSETTLE_MODEL_DIR", os.path.join(self.tmp.name, "models")),
+            ("CLEARSETTLE_STORAGE", "sqlite"),
+            ("CLEARSETTLE_SQLITE_PATH", os.path.join(self.tmp.name, "clearsettle.db")),
+            ("CLEARSETTLE_LOG_FILE", os.path.join(self.tmp.name, "logs", "app.log")),
+        ]:
+            if name in os.environ:
+                self.addCleanup(os.environ.__setitem__, name, os.environ[name])
+            else:
+                self.addCleanup(os.environ.pop, name)
+            os.environ[name] = value
+
+        runner = JobRunner(max_workers=1, db_path=self.db_path, upload_dir=self.upload_dir)
+        content = json.dumps([{"transaction_id": f"T{i}", "status": "failed", "ISIN": "US1234567890"} for i in range(3)])
+        with self.assertLogs(level="INFO"):
+            job_id = runner.submit("settlements.json", content.encode(), submitted_by="ops")
+        runner.shutdown(wait=True)
+
+        # No trained models: the upload completes and anomaly detection fails
+        job = self.job(runner, job_id)
+        self.assertEqual((job["status"], job["submitted_by"]), ("failed", "ops"))
+        self.assertTrue(job["error"].startswith("anomaly_detection: "))
+        self.assertEqual({stage: row["status"] for stage, row in job["stages"].items()},
+                         {"upload": "completed", "anomaly_detection": "failed"})
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_crashed_worker_fails_its_job(self):
+        runner = JobRunner(max_workers=1, db_path=self.db_path, upload_dir=self.upload_dir)
+        self.addCleanup(runner.shutdown)
+        data_file = self.add_job("crashed", "running", started_at=time.time())
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker killed"))
+
+        with self.assertLogs(level="ERROR"):
+            runner._on_done("crashed", data_file, future)
+        job = self.job(runner, "crashed")
+        self.assertEqual((job["status"], job["error"]), ("failed", "worker killed"))
+        self.assertFalse(os.path.exists(data_file))
+
+    def test_unfinished_jobs_are_interrupted_on_start(self):
+        files = {status: self.add_job(status, status) for status in ("queued", "running", "succeeded")}
+        runner = JobRunner(max_workers=1, db_path=self.db_path, upload_dir=self.upload_dir)
+        self.addCleanup(runner.shutdown)
+
+        statuses = {job["job_id"]: job["status"] for job in runner.jobs()}
+        self.assertEqual(statuses, {"queued": "interrupted", "running": "interrupted", "succeeded": "succeeded"})
+        self.assertEqual({status: os.path.exists(path) for status, path in files.items()},
+                         {"queued": False, "running": False, "succeeded": True})
+
+
+class TestPruneCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for module, name, value in [
+            (state_store, "STATE_DIR", self.tmp.name),
+            (pipeline_checkpoint, "CHECKPOINT_DIR", os.path.join(self.tmp.name, "pipeline")),
+        ]:
+            self.addCleanup(setattr, module, name, getattr(module, name))
+            setattr(module, name, value)
+
+    def add_checkpoint(self, input_hash, modified):
+        output_file, output_hash = save_transactions([{"transaction_id": input_hash}], "upload", input_hash)
+        write_checkpoint("upload", input_hash, "completed", output_file, output_hash)
+        for path in (output_file, state_store.state_path(f"pipeline/upload-{input_hash[:16]}")):
+            os.utime(path, (modified, modified))
+        return output_file
+
+    def test_checkpoints_of_running_jobs_are_kept(self):
+        now = time.time()
+        db_path = os.path.join(self.tmp.name, "jobs.db")
+        with connect(db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, filename, data_file, status, submitted_at, started_at) VALUES ('job', 'f', 'f', 'running', ?, ?)",
+                (now - 100, now - 100),
+            )
+        old = self.add_checkpoint("a" * 64, now - 300)
+        resumed = self.add_checkpoint("b" * 64, now - 200)
+        written = self.add_checkpoint("c" * 64, now - 50)
+        # The running job resumes from an older checkpoint while another job prunes
+        self.assertIsNotNone(read_checkpoint("upload", "b" * 64))
+
+        prune_checkpoints(keep=0, active_since=oldest_running_start(db_path))
+        self.assertEqual([os.path.exists(path) for path in (old, resumed, written)], [False, True, True])
+        prune_checkpoints(keep=0)
+        self.assertEqual(os.listdir(pipeline_checkpoint.CHECKPOINT_DIR), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
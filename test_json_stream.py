@@ -0,0 +1,61 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from json_stream import iter_json_array, iter_ndjson, iter_transactions
+
+
+class TestJsonStream(unittest.TestCase):
+    def test_iter_json_array_small_chunks(self):
+        items = [{"transaction_id": f"TXN{i}", "amount": 12345 + i, "note": "a, [b] {c}"} for i in range(50)]
+        text = json.dumps(items, indent=2)
+        # A tiny chunk size forces items and numbers to straddle chunk boundaries
+        self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size=7)), items)
+
+    def test_iter_json_array_empty_and_invalid(self):
+        self.assertEqual(list(iter_json_array(io.StringIO("  [ ]  "))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"transaction_id": "1"}')))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('[{"transaction_id": "1"},')))
+        for text in ("[1,,2]", "[1 2]", "[1,2,]", "[,1]", "[1.]"):
+            with self.assertRaises(ValueError, msg=text):
+                list(iter_json_array(io.StringIO(text), chunk_size=2))
+
+    def test_iter_json_array_fails_fast_on_malformed_item(self):
+        class CountingReader(io.StringIO):
+            reads = 0
+
+            def read(self, size=-1):
+                self.reads += 1
+                return super().read(size)
+
+        items = ",".join(json.dumps({"transaction_id": f"TXN{i}"}) for i in range(10000))
+        f = CountingReader('[{"transaction_id": "0"}, {"transaction_id" "1"}, ' + items + "]")
+        with self.assertRaisesRegex(ValueError, "character 44"):
+            list(iter_json_array(f, chunk_size=64))
+        self.assertLessEqual(f.reads, 2)
+
+    def test_iter_ndjson(self):
+        text = '{"transaction_id": "1"}\n\n{"transaction_id": "2"}\n'
+        self.assertEqual([t["transaction_id"] for t in iter_ndjson(io.StringIO(text))], ["1", "2"])
+        with self.assertRaises(ValueError):
+            list(iter_ndjson(io.StringIO('{"transaction_id": "1"}\n{broken\n')))
+
+    def test_iter_transactions_detects_format(self):
+        items = [{"transaction_id": "1"}, {"transaction_id": "2"}]
+        with tempfile.TemporaryDirectory() as tmp:
+            array_path = os.path.join(tmp, "array.json")
+            ndjson_path = os.path.join(tmp, "lines.ndjson")
+            with open(array_path, "w") as f:
+                json.dump(items, f)
+            with open(ndjson_path, "w") as f:
+                f.write("\n".join(json.dumps(item) for item in items))
+
+            self.assertEqual(list(iter_transactions(array_path)), items)
+            self.assertEqual(list(iter_transactions(ndjson_path)), items)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import glob
+import json
+import logging
+import tempfile
+import unittest
+
+# main_pipeline configures file logging at import unless logging is already set up
+logging.getLogger().addHandler(logging.NullHandler())
+
+import state_store
+import model_store
+import pipeline_checkpoint
+from main_pipeline import run_pipeline
+from storage import SQLiteBackend, get_storage, set_storage
+
+
+class TestRunPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for module, name, value in [
+            (state_store, "STATE_DIR", os.path.join(self.tmp.name, "state")),
+            (pipeline_checkpoint, "CHECKPOINT_DIR", os.path.join(self.tmp.name, "state", "pipeline")),
+            (model_store, "MODEL_DIR", os.path.join(self.tmp.name, "models")),
+        ]:
+            self.addCleanup(setattr, module, name, getattr(module, name))
+            setattr(module, name, value)
+        set_storage(SQLiteBackend(os.path.join(self.tmp.name, "clearsettle.db")))
+        self.addCleanup(set_storage, None)
+
+        self.data_file = os.path.join(self.tmp.name, "settlements.json")
+        with open(self.data_file, "w") as f:
+            json.dump([{"transaction_id": f"T{i}", "status": "failed", "ISIN": "US1234567890"} for i in range(5)], f)
+
+    def run_pipeline(self, **kwargs):
+        events = []
+        with self.assertLogs(level="INFO") as logs:
+            ok = run_pipeline(self.data_file, progress=lambda stage, status, *_: events.append((stage, status)), **kwargs)
+        return ok, events, logs.output
+
+    def checkpoint_statuses(self):
+        statuses = {}
+        for path in glob.glob(os.path.join(pipeline_checkpoint.CHECKPOINT_DIR, "*.json")):
+            with open(path) as f:
+                checkpoint = json.load(f)
+            statuses.setdefault(checkpoint["stage"], []).append(checkpoint["status"])
+        return statuses
+
+    def test_failed_stage_is_not_checkpointed_as_completed(self):
+        # No trained models: anomaly detection fails
+        ok, events, _ = self.run_pipeline()
+        self.assertFalse(ok)
+        self.assertEqual(events[-1], ("anomaly_detection", "failed"))
+        self.assertEqual(self.checkpoint_statuses(), {"upload": ["completed"], "anomaly_detection": ["failed"]})
+
+    def test_resume_skips_completed_stages_and_reloads_their_output(self):
+        self.run_pipeline()
+        ok, events, logs = self.run_pipeline()
+        self.assertFalse(ok)
+        self.assertEqual(events[:2], [("upload", "skipped"), ("anomaly_detection", "running")])
+        self.assertTrue(any("Resumed 5 transactions from" in line for line in logs))
+
+        _, events, _ = self.run_pipeline(resume=False)
+        self.assertEqual(events[:2], [("upload", "running"), ("upload", "completed")])
+
+    def test_checkpoints_belong_to_their_store(self):
+        self.run_pipeline()
+        # Another database, and the same database wiped and recreated, hold none of the uploaded data
+        set_storage(SQLiteBackend(os.path.join(self.tmp.name, "other.db")))
+        _, events, _ = self.run_pipeline()
+        self.assertEqual(events[1], ("upload", "completed"))
+
+        os.remove(os.path.join(self.tmp.name, "clearsettle.db"))
+        set_storage(SQLiteBackend(os.path.join(self.tmp.name, "clearsettle.db")))
+        _, events, _ = self.run_pipeline()
+        self.assertEqual(events[1], ("upload", "completed"))
+        self.assertEqual(len(get_storage().settlements_page(["failed"])), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import hashlib
+import unittest
+from merkle import merkle_root, merkle_proofs, verify_proof
+from audit_verifier import entry_hash, compute_block_hash, verify_inclusion_proof, GENESIS_BLOCK_HASH
+
+
+def leaf(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+class TestMerkle(unittest.TestCase):
+    def test_proofs_verify_for_every_leaf(self):
+        for n in (1, 2, 3, 7, 8, 33):
+            leaves = [leaf(i) for i in range(n)]
+            root = merkle_root(leaves)
+            for value, proof in zip(leaves, merkle_proofs(leaves)):
+                self.assertTrue(verify_proof(value, proof, root))
+                self.assertLessEqual(len(proof), max(1, n).bit_length())
+
+    def test_proof_rejects_other_leaf(self):
+        leaves = [leaf(i) for i in range(5)]
+        proofs = merkle_proofs(leaves)
+        self.assertFalse(verify_proof(leaves[1], proofs[0], merkle_root(leaves)))
+
+
+class TestAuditVerifier(unittest.TestCase):
+    def build_block(self):
+        entries = [
+            {"transaction_id": f"TXN{i}", "timestamp": "2025-01-01T00:00:00Z", "action": "a", "actor": "AI Engine",
+             "previous_hash": GENESIS_BLOCK_HASH, "block_height": 0, "index": i, "hash_version": 2}
+            for i in range(3)
+        ]
+        hashes = [entry_hash(entry) for entry in entries]
+        block = {"height": 0, "previous_block_hash": GENESIS_BLOCK_HASH, "merkle_root": merkle_root(hashes),
+                 "timestamp": "2025-01-01T00:00:00Z", "entry_count": 3}
+        block["block_hash"] = compute_block_hash(block)
+        for entry, value, proof in zip(entries, hashes, merkle_proofs(hashes)):
+            entry.update({"hash": value, "block_hash": block["block_hash"], "merkle_proof": proof})
+        return entries, block
+
+    def test_verified_entry(self):
+        entries, block = self.build_block()
+        self.assertEqual(verify_inclusion_proof({"entry": entries[2], "block": block}), (True, "verified"))
+
+    def test_tampered_previous_hash_is_caught(self):
+        entries, block = self.build_block()
+        entries[0]["previous_hash"] = "f" * 64
+        entries[0]["hash"] = entry_hash(entries[0])  # Attacker recomputes the entry hash
+        ok, _ = verify_inclusion_proof({"entry": entries[0], "block": block})
+        self.assertFalse(ok)
+
+    def test_tampered_block_is_caught(self):
+        entries, block = self.build_block()
+        block["entry_count"] = 4
+        ok, reason = verify_inclusion_proof({"entry": entries[0], "block": block})
+        self.assertFalse(ok)
+        self.assertIn("block header", reason)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import tempfile
+import threading
+import unittest
+import state_store
+from query_cache import QueryCache, publish_invalidation
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(setattr, state_store, "STATE_DIR", state_store.STATE_DIR)
+        state_store.STATE_DIR = self.tmp.name
+        self.cache = QueryCache(ttl=60)
+
+    def test_invalidation_drops_tagged_entries(self):
+        self.cache.get_or_load("failed", [("settlements", "status:failed")], lambda: 1)
+        self.cache.get_or_load("settled", [("settlements", "status:settled")], lambda: 2)
+        publish_invalidation("settlements", ["status:failed"])
+        self.assertEqual(self.cache.get_or_load("failed", [("settlements", "status:failed")], lambda: 3), 3)
+        self.assertEqual(self.cache.get_or_load("settled", [("settlements", "status:settled")], lambda: 4), 2)
+
+    def test_invalidation_during_load_is_not_cached(self):
+        tags = [("settlements", "status:failed")]
+
+        def stale_load():
+            # The pipeline changes the data after the query ran but before the result is cached
+            self.cache.invalidate("settlements", ["status:failed"])
+            return "stale"
+
+        self.assertEqual(self.cache.get_or_load("failed", tags, stale_load), "stale")
+        self.assertEqual(self.cache.get_or_load("failed", tags, lambda: "fresh"), "fresh")
+        self.assertEqual(self.cache.get_or_load("failed", tags, lambda: "later"), "fresh")
+
+    def test_sessions_apply_each_event_once(self):
+        self.cache.get_or_load("failed", [("settlements", "status:failed")], lambda: 1)
+        publish_invalidation("settlements", ["status:failed"])
+
+        # Another session holds the cache lock: the others wait instead of moving the event cursor
+        sessions = [threading.Thread(target=self.cache.apply_invalidations) for _ in range(4)]
+        with self.cache._lock:
+            for session in sessions:
+                session.start()
+            sessions[0].join(timeout=0.1)
+            self.assertTrue(sessions[0].is_alive())
+            self.assertIsNone(self.cache._events_mtime)
+        for session in sessions:
+            session.join()
+        self.assertEqual(self.cache._last_event, 1)
+        self.assertEqual(self.cache._generation, 1)
+        self.assertEqual(self.cache.summary()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import pandas as pd
+from recommendation_rules import RuleEngine
+from storage import SQLiteBackend, set_storage
+
+RULES = {
+    "default": "Investigate manually",
+    "rules": [
+        {"name": "tag:normal", "priority": 100, "when": {"root_cause_tag": {"eq": "normal"}},
+         "recommendation": "Follow standard repair process"},
+        {"name": "aged_fail", "priority": 10,
+         "when": {"status": {"eq": "failed"}, "settlement_lag_days": {"gt": 3}},
+         "recommendation": "Escalate"},
+        {"name": "venue", "priority": 50, "when": {"settlement_venue": {"in": ["DTCC", "Euroclear"]}},
+         "recommendation": "Check venue cut-off"},
+    ],
+}
+
+
+class TestRuleEngine(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame([
+            {"root_cause_tag": "normal", "status": "failed", "trade_date": "2025-01-01", "settlement_date": "2025-01-08"},
+            {"root_cause_tag": "normal", "status": "failed", "trade_date": "2025-01-01", "settlement_date": "2025-01-02"},
+            {"root_cause_tag": None, "settlement_venue": "DTCC"},
+            {"root_cause_tag": "other"},
+        ])
+
+    def test_priority_order_and_hits(self):
+        engine = RuleEngine(fallback=RULES)
+        result = engine.evaluate(self.df).tolist()
+        self.assertEqual(result, ["Escalate", "Follow standard repair process", "Check venue cut-off", "Investigate manually"])
+        self.assertEqual(engine.hits, {"aged_fail": 1, "venue": 1, "tag:normal": 1, "default": 1})
+
+    def test_from_tag_map_matches_exact_lookup(self):
+        tag_map = {"normal": "N"}
+        engine = RuleEngine(fallback=RuleEngine.from_tag_map(tag_map, "D"))
+        df = pd.concat([self.df, pd.DataFrame([{"root_cause_tag": "Normal"}, {"root_cause_tag": " normal"}])])
+        expected = [tag_map.get(tag, "D") for tag in df["root_cause_tag"]]
+        self.assertEqual(engine.evaluate(df).tolist(), expected)
+        self.assertEqual(expected, ["N", "N", "D", "D", "D", "D"])
+
+    def test_reload_during_evaluation(self):
+        other = {"default": "Other", "rules": [{"name": "other", "when": {"root_cause_tag": {"eq": "normal"}}, "recommendation": "O"}]}
+        expected = {tuple(RuleEngine(fallback=config).evaluate(self.df)) for config in (RULES, other)}
+        engine = RuleEngine(fallback=RULES)
+        stop = threading.Event()
+
+        def reload():
+            while not stop.is_set():
+                engine.load(other)
+                engine.load(RULES)
+
+        reloader = threading.Thread(target=reload)
+        reloader.start()
+        try:
+            for _ in range(300):
+                self.assertIn(tuple(engine.evaluate(self.df)), expected)
+        finally:
+            stop.set()
+            reloader.join()
+
+    def test_hot_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rules.json")
+            with open(path, "w") as f:
+                json.dump(RULES, f)
+            engine = RuleEngine(path)
+            self.assertEqual(engine.evaluate(self.df).iloc[3], "Investigate manually")
+
+            with open(path, "w") as f:
+                json.dump({"default": "Reloaded", "rules": []}, f)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+            self.assertEqual(engine.evaluate(self.df).tolist(), ["Reloaded"] * 4)
+
+    def test_broken_edit_keeps_previous_rules(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rules.json")
+            with open(path, "w") as f:
+                json.dump(RULES, f)
+            engine = RuleEngine(path)
+            expected = engine.evaluate(self.df).tolist()
+
+            with open(path, "w") as f:
+                f.write('{"default": "Broken", "rules": [')
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+            with self.assertLogs(level="ERROR") as logs:
+                self.assertEqual(engine.evaluate(self.df).tolist(), expected)
+                self.assertEqual(engine.evaluate(self.df).tolist(), expected)
+            self.assertEqual(len(logs.output), 1)
+
+            # A rule that parses but does not compile is skipped the same way
+            with open(path, "w") as f:
+                json.dump({"rules": [{"name": "x", "when": {"status": {"like": "f"}}, "recommendation": "X"}]}, f)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2_000_000))
+            with self.assertLogs(level="ERROR"):
+                self.assertEqual(engine.evaluate(self.df).tolist(), expected)
+
+            with open(path, "w") as f:
+                json.dump({"default": "Fixed", "rules": []}, f)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 3_000_000))
+            self.assertEqual(engine.evaluate(self.df).tolist(), ["Fixed"] * 4)
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            RuleEngine(fallback={"rules": [{"name": "x", "when": {"status": {"like": "f"}}, "recommendation": "X"}]})
+
+
+class TestGenerateRecommendations(unittest.TestCase):
+    def test_failed_writes_fail_the_stage(self):
+        from generate_recommendations import generate_recommendations
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        storage = SQLiteBackend(os.path.join(tmp.name, "clearsettle.db"))
+        set_storage(storage)
+        self.addCleanup(set_storage, None)
+        storage.put_settlements([{"transaction_id": "T1", "root_cause_tag": "normal"}])
+
+        transactions = [{"transaction_id": "T1", "root_cause_tag": "normal"}, {"transaction_id": "MISSING", "root_cause_tag": "normal"}]
+        with self.assertRaisesRegex(RuntimeError, "1 recommendations could not be stored"), self.assertLogs(level="ERROR"):
+            generate_recommendations(transactions)
+        self.assertIn("recommendation", storage.get_settlement("T1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
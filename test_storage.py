@@ -0,0 +1,135 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from storage import StorageBackend, SQLiteBackend, set_storage, page_cursor
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = SQLiteBackend(os.path.join(self.tmp, "clearsettle.db"))
+        set_storage(self.storage)
+
+    def tearDown(self):
+        set_storage(None)
+        shutil.rmtree(self.tmp)
+
+    def put(self, n, status="failed", prefix="TXN"):
+        return self.storage.put_settlements(
+            {"transaction_id": f"{prefix}{i:04d}", "status": status, "ISIN": "US1234567890"} for i in range(n)
+        )
+
+    def test_put_and_page_by_status(self):
+        self.assertEqual(self.put(120)["written"], 120)
+        self.put(30, status="settled", prefix="SET")
+
+        first = self.storage.settlements_page(["failed"], limit=50)
+        second = self.storage.settlements_page(["failed"], start_after=page_cursor(first[-1]), limit=50)
+        self.assertEqual([t["transaction_id"] for t in first][:2], ["TXN0000", "TXN0001"])
+        self.assertEqual(second[0]["transaction_id"], "TXN0050")
+        self.assertEqual(self.storage.count_settlements(["failed"]), 120)
+        self.assertEqual(self.storage.count_settlements(["failed", "settled"]), 150)
+
+    def test_pages_follow_anomaly_score(self):
+        scores = {"A1": 0.2, "A2": 0.9, "A3": None, "A4": 0.9, "A5": 0.5}
+        self.storage.put_settlements(
+            {"transaction_id": txn, "status": "failed" if txn != "A4" else "pending", **({"anomaly_score": score} if score is not None else {})}
+            for txn, score in scores.items()
+        )
+        self.put(2, prefix="B")
+
+        pages, cursor = [], None
+        while True:
+            page = self.storage.settlements_page(["failed", "pending"], start_after=cursor, limit=2)
+            pages.append([t["transaction_id"] for t in page])
+            if len(page) < 2:
+                break
+            cursor = page_cursor(page[-1])
+        self.assertEqual(pages, [["A2", "A4"], ["A5", "A1"], ["A3", "B0000"], ["B0001"]])
+
+    def test_incomplete_backend_cannot_be_instantiated(self):
+        class SettlementsOnly(StorageBackend):
+            def get_settlement(self, transaction_id):
+                return None
+
+        with self.assertRaises(TypeError):
+            SettlementsOnly()
+
+    def test_update_merges_fields_and_reports_missing_documents(self):
+        self.put(3)
+        result = self.storage.update_settlements([
+            ("TXN0001", {"recommendation": "Investigate manually"}),
+            ("MISSING", {"recommendation": "x"}),
+        ])
+        self.assertEqual(result, {"written": 1, "failed": ["MISSING"]})
+        stored = self.storage.get_settlement("TXN0001")
+        self.assertEqual(stored["recommendation"], "Investigate manually")
+        self.assertEqual(stored["status"], "failed")
+
+    def test_changed_settlements_follow_updated_at(self):
+        self.put(2)
+        since = datetime.datetime.now(datetime.timezone.utc)
+        self.assertEqual(list(self.storage.stream_changed_settlements(since)), [])
+        self.put(1, prefix="NEW")
+        changed = list(self.storage.stream_changed_settlements(since))
+        self.assertEqual([t["transaction_id"] for t in changed], ["NEW0000"])
+        self.assertGreater(changed[0]["updated_at"], since)
+
+    def test_audit_chain_round_trip(self):
+        from simulate_blockchain_log import AuditChainWriter
+        from audit_verifier import verify_chain, verify_transaction
+
+        settlements = [{"transaction_id": f"TXN{i:04d}"} for i in range(10)]
+        writer = AuditChainWriter(block_size=4)
+        writer.append(settlements[:5])
+        writer.append(settlements[5:])
+        writer.close()
+        self.assertEqual((writer.blocks_written, writer.entries_written), (3, 10))
+
+        # A second writer continues from the stored tip
+        AuditChainWriter(block_size=4).append(settlements[:4])
+        report = verify_chain(self.storage, page_size=2, resume=False)
+        self.assertIsNone(report["broken_link"])
+        self.assertEqual((report["blocks"], report["entries"]), (4, 14))
+        self.assertTrue(all(ok for _, ok, _ in verify_transaction(self.storage, "TXN0003")))
+
+    def test_concurrent_audit_writers_do_not_fork(self):
+        from simulate_blockchain_log import AuditChainWriter
+        from audit_verifier import verify_chain
+
+        # Both opened before either appends, like two pipeline jobs starting together
+        first, second = AuditChainWriter(block_size=4), AuditChainWriter(block_size=4)
+        first.append([{"transaction_id": f"A{i}"} for i in range(6)])
+        second.append([{"transaction_id": f"B{i}"} for i in range(6)])
+        first.close()
+        second.close()
+
+        report = verify_chain(self.storage, resume=False)
+        self.assertIsNone(report["broken_link"])
+        self.assertEqual((report["blocks"], report["entries"]), (4, 12))
+
+
+    def test_retry_after_failed_header_write_leaves_no_orphans(self):
+        from simulate_blockchain_log import AuditChainWriter
+        from audit_verifier import verify_chain
+
+        settlements = [{"transaction_id": f"TXN{i:04d}"} for i in range(6)]
+        self.storage.put_audit_blocks = lambda blocks: {"written": 0, "failed": [block["block_hash"] for block in blocks]}
+        with self.assertRaisesRegex(RuntimeError, "block headers failed"):
+            AuditChainWriter(block_size=4, timestamp="2025-01-01T00:00:00Z").append(settlements)
+        del self.storage.put_audit_blocks
+
+        # The retry runs later, so its blocks hash differently, but it reuses the same entry IDs
+        writer = AuditChainWriter(block_size=4, timestamp="2025-01-01T00:05:00Z")
+        writer.append(settlements)
+        writer.close()
+        self.assertEqual(len(self.storage.audit_entries_for_transaction("TXN0001")), 1)
+        report = verify_chain(self.storage, resume=False)
+        self.assertIsNone(report["broken_link"])
+        self.assertEqual((report["blocks"], report["entries"]), (2, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import unittest
+import numpy as np
+import state_store
+import model_store
+from anomaly_detection import ChunkScorer, prepare_transactions, train_isolation_forest
+from audit_verifier import verify_chain
+from detector_runner import Detector, DetectorRunner
+from features import FeatureSchema, save_feature_schema
+from storage import SQLiteBackend, set_storage
+from streaming_pipeline import StreamingPipeline
+
+
+class SlowDetector(Detector):
+    name = "Slow"
+    score_field = "slow_score"
+
+    def __init__(self, fail_on_call=None):
+        self.calls = []
+        self.fail_on_call = fail_on_call
+
+    def score(self, X):
+        self.calls.append(time.monotonic())
+        if len(self.calls) == self.fail_on_call:
+            raise RuntimeError("detector crashed")
+        time.sleep(0.05)
+        return np.zeros(len(X), dtype=bool), np.zeros(len(X))
+
+
+class TestStreamingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for module, name, value in [
+            (state_store, "STATE_DIR", os.path.join(self.tmp.name, "state")),
+            (model_store, "MODEL_DIR", os.path.join(self.tmp.name, "models")),
+        ]:
+            self.addCleanup(setattr, module, name, getattr(module, name))
+            setattr(module, name, value)
+        self.storage = SQLiteBackend(os.path.join(self.tmp.name, "clearsettle.db"))
+        set_storage(self.storage)
+        self.addCleanup(set_storage, None)
+
+        transactions = [
+            {"transaction_id": f"T{i:02d}", "status": "failed", "ISIN": "US1234567890", "root_cause_tag": "normal",
+             "asset_type": "ETF", "settlement_venue": "DTCC", "trade_date": "2025-01-01", "settlement_date": "2025-01-03"}
+            for i in range(10)
+        ]
+        self.data_file = os.path.join(self.tmp.name, "settlements.json")
+        with open(self.data_file, "w") as f:
+            json.dump(transactions, f)
+
+        # Encoding needs the feature schema and the IsolationForest it was trained with
+        with self.assertLogs(level="INFO"):
+            valid = prepare_transactions(transactions)
+            schema = FeatureSchema.fit(valid)
+            train_isolation_forest(schema.encode(valid), schema.columns, save_feature_schema(schema)["version"])
+
+    def run_pipeline(self, detector):
+        events = []
+        scorer = ChunkScorer(DetectorRunner([detector]), export_path=os.path.join(self.tmp.name, "anomalies.parquet"))
+        pipeline = StreamingPipeline(
+            self.data_file, chunk_size=2, queue_size=1, scorer=scorer,
+            progress=lambda stage, status, *_: events.append((stage, status, time.monotonic())),
+        )
+        reports = []
+        runner = threading.Thread(target=lambda: reports.append(pipeline.run()))
+        with self.assertLogs(level="INFO"):
+            runner.start()
+            runner.join(timeout=30)
+        self.assertFalse(runner.is_alive(), "a stage thread did not stop")
+        return reports[0], events
+
+    def test_chunks_flow_through_every_stage(self):
+        detector = SlowDetector()
+        report, events = self.run_pipeline(detector)
+
+        self.assertTrue(report["ok"])
+        self.assertEqual(report["errors"], {})
+        for stage, stats in report["stages"].items():
+            self.assertEqual((stats["rows"], stats["chunks"]), (10, 5), stage)
+        # A queue of one chunk bounds what waits between stages and makes the upload wait for detection
+        self.assertLessEqual(report["stages"]["anomaly_detection"]["max_queue_depth"], 1)
+        self.assertGreater(report["stages"]["upload"]["blocked_seconds"], 0)
+        upload_done = next(at for stage, status, at in events if (stage, status) == ("upload", "completed"))
+        self.assertLess(detector.calls[0], upload_done)
+
+        self.assertEqual(self.storage.get_settlement("T09")["recommendation"], "Follow standard repair process – pattern is common")
+        chain = verify_chain(self.storage, resume=False)
+        self.assertIsNone(chain["broken_link"])
+        self.assertEqual(chain["entries"], 10)
+
+    def test_failing_stage_stops_every_stage(self):
+        report, events = self.run_pipeline(SlowDetector(fail_on_call=2))
+
+        self.assertFalse(report["ok"])
+        self.assertIn("detector Slow failed", report["errors"]["anomaly_detection"])
+        last = {stage: status for stage, status, _ in events}
+        self.assertEqual(set(last.values()), {"failed"})
+        self.assertLess(report["stages"]["audit_log"]["rows"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
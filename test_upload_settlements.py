@@ -0,0 +1,34 @@
+import os
+import unittest
+
+EMULATOR_HOST = os.getenv("FIRESTORE_EMULATOR_HOST")
+
+
+@unittest.skipUnless(EMULATOR_HOST, "FIRESTORE_EMULATOR_HOST is not set; start the firestore-emulator service")
+class TestBulkUpload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import upload_settlements
+        from storage import FirestoreBackend, set_storage
+        cls.module = upload_settlements
+        cls.storage = FirestoreBackend()
+        set_storage(cls.storage)
+
+    def test_bulk_upload_summary(self):
+        transactions = [
+            {"transaction_id": f"BULK{i:05d}", "status": " Failed ", "ISIN": "US1234567890"}
+            for i in range(1203)
+        ]
+        transactions.append({"transaction_id": "BULK00000", "status": "failed", "ISIN": "US1234567890"})  # Duplicate
+        transactions.append({"transaction_id": "BULK_BAD", "status": "failed"})  # Missing ISIN
+
+        summary = self.module.upload_transactions(transactions, bulk=True, batch_size=500, max_in_flight=2)
+
+        self.assertEqual(summary["accepted"], 1203)
+        self.assertEqual(summary["rejected"], 2)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(self.storage.get_settlement("BULK01202")["status"], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
-from utils import validate_transaction, normalize_status, normalize_field, normalize_transaction
+from utils import (
+    validate_transaction, normalize_status, normalize_field, normalize_transaction,
+    normalize_batch, validate_batch, RejectionReport,
+)
 
 class TestUtils(unittest.TestCase):
     def test_validate_transaction(self):
@@ -53,5 +56,51 @@ class TestUtils(unittest.TestCase):
         self.assertNotIn("asset_type", normalized_partial_txn)  # Field not present
         self.assertNotIn("counterparty", normalized_partial_txn)  # Field not present
 
+    def test_rejection_report(self):
+        report = RejectionReport(max_samples=2)
+        for txn in ({"transaction_id": "1", "status": "settled"}, {"transaction_id": "2", "status": "settled"},
+                    {"transaction_id": "3", "status": "settled"}, {"transaction_id": "4", "ISIN": "US1"}):
+            self.assertFalse(validate_transaction(txn, set(), report))
+        self.assertEqual(report.to_dict(), {
+            "rejected": 4,
+            "reasons": {
+                "missing ISIN": {"count": 3, "samples": ["1", "2"]},
+                "missing status": {"count": 1, "samples": ["4"]},
+            },
+        })
+
+    def test_batch_matches_per_dict(self):
+        import pyarrow as pa
+        transactions = [
+            {"transaction_id": "1", "status": " Settled ", "ISIN": "US1", "asset_type": " Bond "},
+            {"transaction_id": "2", "status": "FAILED"},  # Missing ISIN
+            {"transaction_id": "1", "status": "failed", "ISIN": "US1"},  # Duplicate
+            {"status": "failed", "ISIN": "US1"},  # Missing ID
+            {"transaction_id": "3", "status": None, "ISIN": "US1"},
+            {"transaction_id": "4", "status": "Pending", "ISIN": "US1"},
+            {"transaction_id": "5", "status": "pending", "ISIN": "US1"},  # Seen in an earlier batch
+        ]
+        table = pa.Table.from_pylist(transactions)
+        table = table.set_column(3, "asset_type", table["asset_type"].dictionary_encode())
+
+        seen_ids, report = {"5"}, RejectionReport()
+        expected = [validate_transaction(normalize_transaction(dict(txn)), seen_ids, report) for txn in transactions]
+
+        batch_seen_ids = {"5"}
+        normalized = normalize_batch(table)
+        valid, batch_report = validate_batch(normalized, batch_seen_ids)
+        self.assertEqual(valid.tolist(), expected)
+        self.assertEqual(batch_seen_ids, seen_ids)
+        self.assertEqual(batch_report.counts, report.counts)
+        self.assertEqual(normalized["status"].to_pylist(), ["settled", "failed", "failed", "failed", None, "pending", "pending"])
+        self.assertEqual(normalized["asset_type"].to_pylist()[0], "bond")
+
+    def test_validate_batch_rejects_wrong_column_type(self):
+        import pyarrow as pa
+        table = pa.table({"transaction_id": [1, 2], "status": ["settled", "failed"], "ISIN": ["US1", "US2"]})
+        valid, report = validate_batch(table)
+        self.assertEqual(valid.tolist(), [False, False])
+        self.assertEqual(report.counts, {"invalid transaction_id": 2})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,35 @@
+# train_models.py
+# Trains the anomaly detection models and saves them as versioned artifacts under models/.
+import sys
+import logging
+from json_stream import iter_transactions
+from features import FeatureSchema, save_feature_schema
+from anomaly_detection import train_isolation_forest, fetch_transactions, prepare_transactions
+from autoencoder_model import train_autoencoder
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+def main(data_file=None):
+    """
+    Train the models on a settlement file, or on the `settlements` collection if no file is given.
+
+    Args:
+        data_file (str, optional): Path to a JSON array, NDJSON, Parquet or Arrow IPC settlement file.
+    """
+    transactions = list(iter_transactions(data_file)) if data_file else fetch_transactions()
+    valid_transactions = prepare_transactions(transactions)
+
+    # Both detectors are trained on the same schema so scoring can encode each batch once
+    schema = FeatureSchema.fit(valid_transactions)
+    schema_manifest = save_feature_schema(schema)
+    X = schema.encode(valid_transactions)
+
+    manifest = train_isolation_forest(X, schema.columns, schema_manifest["version"])
+    logging.info(f"IsolationForest artifact {manifest['version']} trained on {manifest['n_samples']} transactions.")
+
+    train_autoencoder(X)
+    logging.info(f"Autoencoder trained on {len(X)} transactions.")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,58 +1,243 @@
 # upload_settlements.py
-# This script uploads settlement transactions from a JSON file to Firebase Firestore.
-import os
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
+# This script uploads settlement transactions from a JSON file to the configured storage backend (Firestore by default).
 import logging
-from utils import validate_transaction, normalize_transaction
+from json_stream import iter_transactions, sniff_columnar_format
+from utils import validate_transaction, normalize_transaction, normalize_batch, validate_batch, RejectionReport
+from batch_writer import MAX_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT, chunked
+from storage import get_storage
+from duplicate_index import get_duplicate_index
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 
-# Firebase Init
-try:
-    if os.getenv("FIRESTORE_EMULATOR_HOST"):
-        os.environ["FIRESTORE_PROJECT_ID"] = "clearsettle-ai"
-    if not firebase_admin._apps:  # Check if Firebase is already initialized
-        cred = credentials.Certificate("/app/clearsettle-ai-firebase-adminsdk-fbsvc-844f7a5e30.json")
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logging.info("Firebase initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize Firebase: {e}")
-    exit()
-
 def upload_to_database(transaction):
     try:
-        collection_ref = db.collection('settlements')
-        doc_ref = collection_ref.document(transaction['transaction_id'])
-        doc_ref.set(transaction)
+        # The backend stamps updated_at, the change cursor used by incremental anomaly detection
+        result = get_storage().put_settlements([transaction])
+        if result["failed"]:
+            raise RuntimeError("write failed after retries")
         logging.info(f"Transaction {transaction['transaction_id']} uploaded successfully.")
+        return True
     except Exception as e:
         logging.error(f"Error uploading transaction {transaction['transaction_id']}: {e}")
+        return False
+
+def claim_new(transactions, duplicate_index, report, claimed=None):
+    """
+    Drop transactions whose IDs were already uploaded by an earlier run or a parallel worker.
+
+    The remaining IDs are claimed in the duplicate index, so no other upload accepts them.
+
+    Args:
+        transactions (list): Validated transactions, unique within the run.
+        duplicate_index (DuplicateIndex | None): Persistent index; None disables the check.
+        report (RejectionReport): Receives the "already uploaded" rejections.
+        claimed (list, optional): Receives the IDs claimed by this call, to release them if the upload fails.
+
+    Returns:
+        list: Transactions with new IDs.
+    """
+    if duplicate_index is None or not transactions:
+        return transactions
+    known = duplicate_index.claim(txn["transaction_id"] for txn in transactions)
+    if known:
+        rejected = [txn["transaction_id"] for txn in transactions if txn["transaction_id"] in known]
+        report.add("already uploaded", rejected, len(rejected))
+        transactions = [txn for txn in transactions if txn["transaction_id"] not in known]
+    if claimed is not None:
+        claimed.extend(txn["transaction_id"] for txn in transactions)
+    return transactions
+
+def upload_transactions(transactions, bulk: bool = True, batch_size: int = MAX_BATCH_SIZE,
+                        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, accepted: list = None, seen_ids: set = None,
+                        duplicate_index=None):
+    """
+    Normalize, validate and upload transactions to the storage backend.
+
+    Args:
+        transactions (iterable): Transactions to upload. Consumed lazily.
+        bulk (bool): Commit in batched writes instead of one request per transaction.
+        batch_size (int): Documents per batch commit in bulk mode (max 500).
+        max_in_flight (int): Maximum number of concurrent batch commits in bulk mode.
+        accepted (list, optional): Receives every normalized transaction that passed validation.
+        seen_ids (set, optional): IDs already uploaded in this run; pass the same set when
+            uploading a file in several chunks so duplicates are caught across chunks.
+        duplicate_index (DuplicateIndex, optional): Persistent index of IDs uploaded by earlier
+            runs; defaults to get_duplicate_index(), which is None unless UPLOAD_DUPLICATE_INDEX=1.
 
-def upload_transactions(transactions: list):
-    seen_ids = set()
+    Returns:
+        dict: Counts of "accepted", "rejected" and "failed" transactions, the "failed_ids",
+            and the "rejections" report (count and sample IDs per reason).
+    """
+    if duplicate_index is None:
+        duplicate_index = get_duplicate_index()
+    if bulk:
+        return bulk_upload_transactions(transactions, batch_size, max_in_flight, accepted, seen_ids, duplicate_index)
+
+    summary = {"accepted": 0, "rejected": 0, "failed": 0, "failed_ids": []}
+    seen_ids = set() if seen_ids is None else seen_ids
+    report = RejectionReport()
     for txn in transactions:
         txn = normalize_transaction(txn)
-        if not validate_transaction(txn, seen_ids):
-            logging.warning(f"Invalid or duplicate transaction skipped: {txn}")
+        if not validate_transaction(txn, seen_ids, report) or not claim_new([txn], duplicate_index, report):
             continue
         # Proceed with uploading the valid transaction
-        upload_to_database(txn)
+        stored = False
+        try:
+            stored = upload_to_database(txn)
+        finally:
+            if not stored and duplicate_index is not None:
+                # Failed writes can be retried, so their IDs must not count as uploaded
+                duplicate_index.release([txn["transaction_id"]])
+        if stored:
+            summary["accepted"] += 1
+            if accepted is not None:
+                accepted.append(txn)
+        else:
+            summary["failed"] += 1
+            summary["failed_ids"].append(txn["transaction_id"])
+    summary["rejected"] = report.total
+    report.log()
+    summary["rejections"] = report.to_dict()
+    return summary
+
+def bulk_upload_transactions(transactions, batch_size: int = MAX_BATCH_SIZE,
+                             max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, accepted: list = None, seen_ids: set = None,
+                             duplicate_index=None):
+    """
+    Upload validated transactions in bulk writes (Firestore batch commits of up to 500 documents).
+
+    Each batch is retried through the shared tenacity policy; a batch that still fails
+    is counted as failed rather than aborting the whole upload.
+
+    Args:
+        transactions (iterable): Transactions to upload. Consumed lazily.
+        batch_size (int): Documents per batch commit (max 500).
+        max_in_flight (int): Maximum number of concurrent batch commits.
+        accepted (list, optional): Receives every normalized transaction that passed validation.
+        seen_ids (set, optional): IDs already uploaded in this run, shared across chunks.
+        duplicate_index (DuplicateIndex, optional): Persistent index of IDs uploaded by earlier runs.
+
+    Returns:
+        dict: Counts of "accepted", "rejected" and "failed" transactions, the "failed_ids",
+            and the "rejections" report (count and sample IDs per reason).
+    """
+    seen_ids = set() if seen_ids is None else seen_ids
+    report = RejectionReport()
+    claimed = []
+
+    def valid_transactions():
+        # One duplicate index claim per batch commit
+        for block in chunked(transactions, batch_size):
+            valid = [txn for txn in map(normalize_transaction, block) if validate_transaction(txn, seen_ids, report)]
+            valid = claim_new(valid, duplicate_index, report, claimed)
+            if accepted is not None:
+                accepted.extend(valid)
+            yield from valid
 
-def main(data_file="/app/settlement_transactions.json"):
+    return _store(valid_transactions(), report, batch_size, max_in_flight, duplicate_index, claimed)
+
+def upload_batches(batches, batch_size: int = MAX_BATCH_SIZE, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                   accepted: list = None, seen_ids: set = None, duplicate_index=None):
+    """
+    Upload column batches (e.g. the record batches of a Parquet file) in bulk writes.
+
+    Each batch is normalized and validated as a whole with utils.normalize_batch and
+    utils.validate_batch; only the accepted rows are converted to documents.
+
+    Args:
+        batches (iterable): pyarrow.RecordBatch or pyarrow.Table objects. Consumed lazily.
+        batch_size (int): Documents per batch commit (max 500).
+        max_in_flight (int): Maximum number of concurrent batch commits.
+        accepted (list, optional): Receives every normalized transaction that passed validation.
+        seen_ids (set, optional): IDs already uploaded in this run, shared across batches.
+        duplicate_index (DuplicateIndex, optional): Persistent index of IDs uploaded by earlier
+            runs; defaults to get_duplicate_index().
+
+    Returns:
+        dict: Same summary as bulk_upload_transactions.
+    """
+    # Imported here so JSON uploads never load Arrow
+    import pyarrow as pa
+    from columnar import table_records
+
+    if duplicate_index is None:
+        duplicate_index = get_duplicate_index()
+    seen_ids = set() if seen_ids is None else seen_ids
+    report = RejectionReport()
+    claimed = []
+
+    def valid_transactions():
+        for batch in batches:
+            table = normalize_batch(pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch)
+            valid, _ = validate_batch(table, seen_ids, report)
+            records = claim_new(table_records(table.filter(pa.array(valid))), duplicate_index, report, claimed)
+            if accepted is not None:
+                accepted.extend(records)
+            yield from records
+
+    return _store(valid_transactions(), report, batch_size, max_in_flight, duplicate_index, claimed)
+
+def _store(valid_transactions, report, batch_size, max_in_flight, duplicate_index, claimed):
+    # Shared tail of the bulk uploads: write, then summarize
+    try:
+        result = get_storage().put_settlements(valid_transactions, batch_size=batch_size, max_in_flight=max_in_flight)
+    except BaseException:
+        # Malformed input or a backend error: we can't tell which claimed IDs were stored, so release
+        # them all. A retry then rewrites the stored ones, which is harmless for upserts.
+        if duplicate_index is not None:
+            duplicate_index.release(claimed)
+        raise
+    if duplicate_index is not None and result["failed"]:
+        # Failed writes can be retried, so their IDs must not count as uploaded
+        duplicate_index.release(result["failed"])
+    summary = {
+        "accepted": result["written"],
+        "rejected": report.total,
+        "failed": len(result["failed"]),
+        "failed_ids": result["failed"],
+        "rejections": report.to_dict(),
+    }
+    report.log()
+    logging.info(
+        f"Bulk upload finished: {summary['accepted']} accepted, "
+        f"{summary['rejected']} rejected, {summary['failed']} failed."
+    )
+    return summary
+
+def main(data_file="/app/settlement_transactions.json", context=None):
+    """
+    Upload a settlement file to the storage backend.
+
+    Args:
+        data_file (str): Path to a JSON array, NDJSON, Parquet or Arrow IPC settlement file.
+        context (PipelineContext, optional): Receives the uploaded transactions for later stages.
+
+    Returns:
+        dict: Upload summary, or None if the file could not be read.
+    """
+    # Transactions are streamed from disk straight into validation and upload,
+    # so memory stays flat regardless of the file size unless a pipeline context collects them.
+    accepted = [] if context is not None else None
     try:
-        with open(data_file, 'r') as f:
-            transactions = json.load(f)
-        logging.info(f"Loaded {len(transactions)} transactions from JSON file.")
+        logging.info("Uploading transactions...")
+        file_format = sniff_columnar_format(data_file)
+        if file_format:
+            # Columnar files are validated a record batch at a time
+            from columnar import iter_record_batches
+            summary = upload_batches(iter_record_batches(data_file, file_format), accepted=accepted)
+        else:
+            summary = upload_transactions(iter_transactions(data_file), accepted=accepted)
     except Exception as e:
-        logging.error(f"Failed to load transactions from JSON file: {e}")
+        logging.error(f"Failed to load transactions from {data_file}: {e}")
         return
 
-    logging.info("Uploading transactions...")
-    upload_transactions(transactions)
+    if context is not None:
+        context.add_transactions(accepted)
+        context.discard(summary["failed_ids"])
+
+    logging.info(f"Processed {summary['accepted'] + summary['rejected'] + summary['failed']} transactions from {data_file}.")
+    return summary
 
 if __name__ == "__main__":
     main()
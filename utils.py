@@ -1,36 +1,125 @@
 import logging
 
-def validate_transaction(txn: dict, seen_ids: set = None) -> bool:
+# Fields every transaction must carry, with their expected Python type
+REQUIRED_FIELDS = {
+    "transaction_id": str,
+    "status": str,
+    "ISIN": str,
+}
+# Text fields stripped and lowercased by normalize_transaction / normalize_batch
+NORMALIZED_FIELDS = ("status", "asset_type", "counterparty")
+# Example IDs kept per rejection reason
+REJECTION_SAMPLES = 5
+
+
+class RejectionReport:
     """
-    Validates a transaction dictionary to ensure it has the required fields,
-    correct data types, and no duplicate IDs.
+    Compact summary of rejected transactions: a count per reason and the first few IDs for each.
+
+    Validation records rejections here instead of logging every rejected row; call `log`
+    once at the end for a single summary line.
+
+    Args:
+        max_samples (int): Example IDs kept per reason.
+    """
+
+    def __init__(self, max_samples=REJECTION_SAMPLES):
+        self.max_samples = max_samples
+        self.counts = {}
+        self.samples = {}
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def add(self, reason, samples=(), count=1):
+        """
+        Count rejections for one reason.
+
+        Args:
+            reason (str): Why the rows were rejected, e.g. "missing ISIN".
+            samples (iterable): Identifiers of some of the rejected rows.
+            count (int): Number of rows rejected.
+        """
+        self.counts[reason] = self.counts.get(reason, 0) + count
+        kept = self.samples.setdefault(reason, [])
+        for sample in samples:
+            if len(kept) >= self.max_samples:
+                break
+            kept.append(sample)
+
+    def merge(self, other):
+        for reason, count in other.counts.items():
+            self.add(reason, other.samples.get(reason, ()), count)
+
+    def to_dict(self):
+        return {
+            "rejected": self.total,
+            "reasons": {reason: {"count": count, "samples": list(self.samples[reason])} for reason, count in self.counts.items()},
+        }
+
+    def log(self, what="transactions"):
+        if not self.counts:
+            return
+        details = "; ".join(
+            f"{reason}: {count} (e.g. {', '.join(map(str, self.samples[reason]))})"
+            for reason, count in sorted(self.counts.items(), key=lambda item: -item[1])
+        )
+        logging.warning(f"Rejected {self.total} {what} - {details}")
+
+
+def _sample_id(txn):
+    transaction_id = txn.get("transaction_id")
+    return transaction_id if transaction_id is not None else "<no transaction_id>"
+
+
+def rejection_reason(txn: dict, seen_ids: set = None):
+    """
+    Check a transaction and say why it is rejected, if it is.
 
     Args:
         txn (dict): The transaction to validate.
-        seen_ids (set, optional): A set to track duplicate transaction IDs.
+        seen_ids (set, optional): IDs accepted so far; a valid transaction's ID is added to it.
 
     Returns:
-        bool: True if the transaction is valid, False otherwise.
+        str | None: "missing <field>", "invalid <field>" or "duplicate transaction_id"; None if valid.
     """
-    required_fields = {
-        "transaction_id": str,
-        "status": str,
-        "ISIN": str,
-    }
-
-    for field, expected_type in required_fields.items():
-        if field not in txn or not isinstance(txn[field], expected_type):
-            logging.warning(f"Validation failed for transaction: {txn}. Missing or invalid field: {field}")
-            return False
+    for field, expected_type in REQUIRED_FIELDS.items():
+        value = txn.get(field)
+        if value is None:
+            return f"missing {field}"
+        if not isinstance(value, expected_type):
+            return f"invalid {field}"
 
     # Check for duplicate transaction IDs
     if seen_ids is not None:
         if txn["transaction_id"] in seen_ids:
-            logging.warning(f"Duplicate transaction ID detected: {txn['transaction_id']}")
-            return False
+            return "duplicate transaction_id"
         seen_ids.add(txn["transaction_id"])
+    return None
+
+
+def validate_transaction(txn: dict, seen_ids: set = None, report: RejectionReport = None) -> bool:
+    """
+    Validates a transaction dictionary to ensure it has the required fields,
+    correct data types, and no duplicate IDs.
+
+    Args:
+        txn (dict): The transaction to validate.
+        seen_ids (set, optional): A set to track duplicate transaction IDs.
+        report (RejectionReport, optional): Collects the rejection instead of logging it.
 
-    return True
+    Returns:
+        bool: True if the transaction is valid, False otherwise.
+    """
+    reason = rejection_reason(txn, seen_ids)
+    if reason is None:
+        return True
+    if report is not None:
+        report.add(reason, [_sample_id(txn)])
+    else:
+        logging.warning(f"Transaction {_sample_id(txn)} rejected: {reason}")
+    return False
 
 
 def normalize_status(status: str) -> str:
@@ -69,13 +158,117 @@ def normalize_transaction(txn: dict) -> dict:
     Returns:
         dict: The normalized transaction.
     """
-    if "status" in txn:
-        txn["status"] = normalize_status(txn["status"])
-        logging.info(f"Normalized status: {txn['status']}")
-    if "asset_type" in txn:
-        txn["asset_type"] = normalize_field(txn["asset_type"])
-        logging.info(f"Normalized asset_type: {txn['asset_type']}")
-    if "counterparty" in txn:
-        txn["counterparty"] = normalize_field(txn["counterparty"])
-        logging.info(f"Normalized counterparty: {txn['counterparty']}")
-    return txn
\ No newline at end of file
+    for field in NORMALIZED_FIELDS:
+        value = txn.get(field)
+        if isinstance(value, str):
+            txn[field] = value.strip().lower()
+    return txn
+
+
+def _is_text(arrow_type):
+    import pyarrow as pa
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+def normalize_batch(batch):
+    """
+    Vectorized normalize_transaction: strip and lowercase the normalized fields of a whole column batch.
+
+    Dictionary-encoded columns are normalized through their dictionary, so their cost depends
+    on the number of distinct values rather than rows. Non-text columns are left unchanged.
+
+    Args:
+        batch (pyarrow.Table | columnar.SettlementBatch): Transactions as columns.
+
+    Returns:
+        pyarrow.Table | columnar.SettlementBatch: The normalized batch, same type as `batch`.
+    """
+    # Imported here so the per-dict functions stay cheap to import
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from columnar import SettlementBatch
+
+    table = batch.table if isinstance(batch, SettlementBatch) else batch
+    for field in NORMALIZED_FIELDS:
+        if field not in table.column_names or not _is_text(table.schema.field(field).type):
+            continue
+        chunks = []
+        for chunk in table[field].chunks:
+            if pa.types.is_dictionary(chunk.type):
+                dictionary = pc.utf8_lower(pc.utf8_trim_whitespace(chunk.dictionary))
+                chunks.append(pa.DictionaryArray.from_arrays(chunk.indices, dictionary))
+            else:
+                chunks.append(pc.utf8_lower(pc.utf8_trim_whitespace(chunk)))
+        table = table.set_column(table.column_names.index(field), field, pa.chunked_array(chunks, table[field].type))
+    return SettlementBatch(table) if isinstance(batch, SettlementBatch) else table
+
+
+def validate_batch(batch, seen_ids: set = None, report: RejectionReport = None):
+    """
+    Vectorized validate_transaction: check a whole column batch at once.
+
+    Rows are checked for the required fields in REQUIRED_FIELDS order, then for duplicate
+    IDs among the rows that passed, first occurrence wins. Duplicates within the batch are
+    found with a hash index over the ID column, and duplicates of earlier batches through
+    `seen_ids`, which receives the accepted IDs. The outcome matches calling
+    validate_transaction row by row.
+
+    Args:
+        batch (pyarrow.Table | columnar.SettlementBatch): Transactions as columns.
+        seen_ids (set, optional): IDs accepted so far, shared across batches.
+        report (RejectionReport, optional): Report to add to; a new one is created by default.
+
+    Returns:
+        tuple: (numpy.ndarray boolean mask of accepted rows, RejectionReport)
+    """
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from columnar import SettlementBatch
+
+    table = batch.table if isinstance(batch, SettlementBatch) else batch
+    report = report if report is not None else RejectionReport()
+    valid = np.ones(table.num_rows, dtype=bool)
+
+    ids = None
+    if "transaction_id" in table.column_names:
+        ids = table["transaction_id"]
+        if pa.types.is_dictionary(ids.type):
+            ids = ids.cast(ids.type.value_type)
+
+    def record(reason, rows):
+        if len(rows):
+            samples = rows[:report.max_samples]
+            if ids is not None:
+                samples = [value if value is not None else f"row {row}" for row, value in zip(samples, ids.take(samples).to_pylist())]
+            else:
+                samples = [f"row {row}" for row in samples]
+            report.add(reason, samples, len(rows))
+            valid[rows] = False
+
+    for field, expected_type in REQUIRED_FIELDS.items():
+        if field not in table.column_names:
+            record(f"missing {field}", np.flatnonzero(valid))
+            continue
+        column = table[field]
+        present = pc.is_valid(column).to_numpy(zero_copy_only=False)
+        record(f"missing {field}", np.flatnonzero(valid & ~present))
+        # Arrow columns have one type, so a column either holds text or is invalid throughout
+        if expected_type is str and not _is_text(column.type):
+            record(f"invalid {field}", np.flatnonzero(valid & present))
+
+    rows = np.flatnonzero(valid)
+    if ids is None or not len(rows):
+        return valid, report
+    accepted_ids = pd.Series(pd.array(ids.take(pa.array(rows)), dtype="string[pyarrow]"))
+    duplicated = accepted_ids.duplicated(keep="first").to_numpy()
+    if seen_ids:
+        values = accepted_ids.to_numpy()
+        duplicated = duplicated | np.fromiter((value in seen_ids for value in values), dtype=bool, count=len(values))
+    record("duplicate transaction_id", rows[duplicated])
+    if seen_ids is not None:
+        seen_ids.update(accepted_ids[~duplicated].tolist())
+    return valid, report
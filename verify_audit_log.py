@@ -0,0 +1,31 @@
+# verify_audit_log.py
+# Verifies the blockchain-style audit log incrementally and reports the first broken link.
+import sys
+import argparse
+import logging
+from audit_verifier import verify_chain, DEFAULT_PAGE_SIZE
+from storage import get_storage
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the audit_log hash chain.")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Block headers fetched per query.")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and verify from the genesis block.")
+    args = parser.parse_args(argv)
+
+    report = verify_chain(get_storage(), page_size=args.page_size, resume=not args.full)
+    logging.info(
+        f"Verified {report['blocks']} blocks / {report['entries']} entries from height {report['start_height']} "
+        f"in {report['seconds']:.2f}s ({report['entries_per_second']:.0f} entries/s). "
+        f"Verified tip: height {report['tip_height']}, hash {report['tip_hash']}."
+    )
+    if report["broken_link"]:
+        link = report["broken_link"]
+        logging.error(f"First broken link at height {link['height']} ({link['block_hash']}): {link['reason']}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())